@@ -3,7 +3,6 @@ from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_cors import CORS
-from mongoengine import connect
 from config import Config
 
 # Initialize extensions
@@ -21,10 +20,24 @@ def create_app(config_class=Config):
     # Initialize extensions
     jwt.init_app(app)
     mail.init_app(app)
-    CORS(app)
+    from app import revocation
+    revocation.init_app(app, jwt)
+    # Registered first so its after_request hook sees each response last
+    from app import compression
+    compression.init_app(app)
+    from app import routing, guest_carts
+    routing.init_app(app)
+    CORS(app, expose_headers=[routing.READ_AFTER_HEADER, guest_carts.HEADER])
 
-    # Connect to MongoDB
-    connect(host=app.config['MONGODB_SETTINGS']['host'])
+    # Instrumentation must be installed before the MongoDB listeners are
+    from app import metrics, profiling, admission
+    metrics.init_app(app)
+    profiling.init_app(app)
+    admission.init_app(app)
+
+    # Register MongoDB; the client is created lazily in each worker
+    from app import db
+    db.init_app(app)
 
     # Register blueprints
     from app.routes.auth import auth_bp
@@ -32,12 +45,26 @@ def create_app(config_class=Config):
     from app.routes.cart import cart_bp
     from app.routes.order import order_bp
     from app.routes.category import category_bp
+    from app.routes.analytics import analytics_bp
+    from app.routes.admin import admin_bp
+    from app.routes.batch import batch_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(product_bp, url_prefix='/api/products')
     app.register_blueprint(cart_bp, url_prefix='/api/cart')
     app.register_blueprint(order_bp, url_prefix='/api/orders')
     app.register_blueprint(category_bp, url_prefix='/api/categories')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+
+    from app import health, lifecycle
+    health.init_app(app)
+    lifecycle.init_app(app)
+
+    # Register CLI commands
+    from app.cli import register_cli
+    register_cli(app)
 
     # Error handlers
     @app.errorhandler(404)
@@ -0,0 +1,263 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+from app import metrics
+
+PRIORITIES = ('critical', 'normal', 'low')
+
+# Never shed: probes and the metrics scrape must work during an overload
+EXEMPT_ENDPOINTS = {'metrics', 'health_live', 'health_ready', 'static'}
+
+class Decision:
+    """Outcome of an admission check; ``status`` is None when admitted.
+
+    ``slot`` is False for a sub-request, which only holds a route slot.
+    """
+
+    def __init__(self, endpoint, priority, reason, status=None, retry_after=None, slot=True):
+        self.endpoint = endpoint
+        self.priority = priority
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        self.slot = slot
+        self.started = time.perf_counter()
+
+    @property
+    def admitted(self):
+        return self.status is None
+
+class TokenBuckets:
+    """In-process token buckets keyed by client, bounded to ``max_keys``.
+
+    Each worker keeps its own buckets, so with N workers a client can get
+    up to N times the configured rate in the worst case.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, period):
+        """Take a token; return 0 if allowed, else seconds until one is available."""
+        rate = burst / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+class AdmissionController:
+    """Decide per request whether to serve it now or shed it with a 503.
+
+    Capacity is counted per worker process. The load signal is the larger
+    of the proxy-reported queue delay and the recent latency relative to
+    ``latency_target``. Once it reaches 1x the target, low and normal
+    priority requests may only use the share of ``max_in_flight`` that is
+    not reserved for critical ones (cart and checkout), and low priority
+    traffic is shed; normal priority traffic is shed at 2x. Below the
+    target every slot is open to every priority, and critical requests are
+    only refused when every slot is taken. Requests without a token are
+    never critical.
+    """
+
+    def __init__(self, config):
+        self.max_in_flight = config['ADMISSION_MAX_IN_FLIGHT']
+        self.shared_slots = int(self.max_in_flight * (1 - config['ADMISSION_CRITICAL_RESERVE']))
+        self.latency_target = config['ADMISSION_LATENCY_TARGET']
+        self.retry_after = config['ADMISSION_RETRY_AFTER']
+        self.route_limits = config['ADMISSION_ROUTE_LIMITS']
+        self.priorities = config['ADMISSION_PRIORITIES']
+        self.anonymous_low = config['ADMISSION_ANONYMOUS_LOW']
+        self.in_flight = {priority: 0 for priority in PRIORITIES}
+        self.route_in_flight = {}
+        self.latency = 0.0
+        self.latency_updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def priority(self, endpoint, authenticated):
+        priority = self.priorities.get(endpoint, 'normal')
+        if not authenticated:
+            # Guests may use the cart, but not the capacity kept for signed-in checkout
+            if priority == 'critical':
+                return 'normal'
+            if priority == 'normal' and endpoint in self.anonymous_low:
+                return 'low'
+        return priority
+
+    def load(self, queue_delay=0.0):
+        """Current load as a multiple of the latency target."""
+        # Halve the latency estimate every second without completions, so
+        # an idle or fully shed worker recovers instead of shedding forever
+        idle = time.monotonic() - self.latency_updated
+        latency = self.latency * 0.5 ** max(0.0, idle - 1)
+        return max(queue_delay, latency) / self.latency_target
+
+    def admit(self, endpoint, authenticated, queue_delay=0.0):
+        priority = self.priority(endpoint, authenticated)
+        load = self.load(queue_delay)
+        with self._lock:
+            total = sum(self.in_flight.values())
+            limit = self.route_limits.get(endpoint)
+            if limit is not None and self.route_in_flight.get(endpoint, 0) >= limit:
+                reason = 'route_limit'
+            elif total >= self.max_in_flight:
+                reason = 'capacity'
+            elif priority != 'critical' and load >= 1 and total >= self.shared_slots:
+                reason = 'reserved'
+            elif (priority == 'low' and load >= 1) or (priority == 'normal' and load >= 2):
+                reason = 'overload'
+            else:
+                reason = None
+                self.in_flight[priority] += 1
+                self.route_in_flight[endpoint] = self.route_in_flight.get(endpoint, 0) + 1
+
+        if reason is None:
+            decision = Decision(endpoint, priority, 'admitted')
+            metrics.ADMISSION_IN_FLIGHT.labels(priority).inc()
+        else:
+            decision = Decision(endpoint, priority, reason, status=503, retry_after=self.retry_after)
+        metrics.ADMISSION_DECISIONS.labels(endpoint, priority, decision.reason).inc()
+        metrics.ADMISSION_LOAD.set(load)
+        return decision
+
+    def admit_route(self, endpoint, authenticated):
+        """Admit work done inside an admitted request, which holds the slot.
+
+        Only the endpoint's route limit applies, so a batch never competes
+        with itself for capacity.
+        """
+        priority = self.priority(endpoint, authenticated)
+        with self._lock:
+            limit = self.route_limits.get(endpoint)
+            admitted = limit is None or self.route_in_flight.get(endpoint, 0) < limit
+            if admitted:
+                self.route_in_flight[endpoint] = self.route_in_flight.get(endpoint, 0) + 1
+
+        if admitted:
+            decision = Decision(endpoint, priority, 'admitted', slot=False)
+        else:
+            decision = Decision(endpoint, priority, 'route_limit', status=503, retry_after=self.retry_after, slot=False)
+        metrics.ADMISSION_DECISIONS.labels(endpoint, priority, decision.reason).inc()
+        return decision
+
+    def release(self, decision):
+        if not decision.admitted:
+            return
+        duration = time.perf_counter() - decision.started
+        with self._lock:
+            self.route_in_flight[decision.endpoint] -= 1
+            if decision.slot:
+                self.in_flight[decision.priority] -= 1
+                self.latency = 0.8 * self.latency + 0.2 * duration
+                self.latency_updated = time.monotonic()
+        if decision.slot:
+            metrics.ADMISSION_IN_FLIGHT.labels(decision.priority).dec()
+
+def queue_delay(headers):
+    """Seconds since the proxy received the request, from ``X-Request-Start``.
+
+    Accepts nginx's ``t=<seconds.millis>`` and the ``t=<microseconds>``
+    form some load balancers send; 0 when the header is missing.
+    """
+    value = headers.get('X-Request-Start', '')
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return 0.0
+    if started > 1e14:  # Microseconds
+        started /= 1e6
+    elif started > 1e11:  # Milliseconds
+        started /= 1e3
+    return max(0.0, time.time() - started)
+
+def _client_address():
+    if current_app.config['ADMISSION_TRUST_FORWARDED']:
+        return request.access_route[0]
+    return request.remote_addr
+
+def _rate_limit(endpoint, priority):
+    """Apply the endpoint's token buckets; return seconds to wait, or 0."""
+    limits = current_app.config['ADMISSION_RATE_LIMITS'].get(endpoint)
+    if not limits:
+        return 0
+    buckets = current_app.extensions['rate_limits']
+    wait = 0
+    for scope, burst, period in limits:
+        if scope == 'ip':
+            key = _client_address()
+        else:
+            data = request.get_json(silent=True) or {}
+            key = str(data.get('email', '')).strip().lower()
+            if not key:
+                continue
+        wait = max(wait, buckets.take(f'{endpoint}:{scope}:{key}', burst, period))
+    if wait:
+        metrics.ADMISSION_DECISIONS.labels(endpoint, priority, 'rate_limited').inc()
+    return wait
+
+def _refusal(decision):
+    response = jsonify({'error': 'Service temporarily overloaded'})
+    response.headers['Retry-After'] = str(decision.retry_after)
+    return response, decision.status
+
+def admit_request():
+    """Rate limit and admit the current request; returns the refusal, if any."""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+
+    controller = current_app.extensions['admission']
+    authenticated = 'Authorization' in request.headers
+
+    wait = _rate_limit(endpoint, controller.priority(endpoint, authenticated))
+    if wait:
+        response = jsonify({'error': 'Too many requests'})
+        response.headers['Retry-After'] = str(math.ceil(wait))
+        return response, 429
+
+    decision = controller.admit(endpoint, authenticated, queue_delay(request.headers))
+    if not decision.admitted:
+        return _refusal(decision)
+    g.admission = decision
+    return None
+
+def admit_sub_request():
+    """Apply the route limit to a sub-request run inside an admitted request."""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+
+    controller = current_app.extensions['admission']
+    decision = controller.admit_route(endpoint, 'Authorization' in request.headers)
+    if not decision.admitted:
+        return _refusal(decision)
+    g.admission = decision
+    return None
+
+def _release(exception=None):
+    decision = g.pop('admission', None)
+    if decision is not None:
+        current_app.extensions['admission'].release(decision)
+
+def init_app(app):
+    """Install the admission check and rate limits in front of every view."""
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    app.extensions['admission'] = AdmissionController(app.config)
+    app.extensions['rate_limits'] = TokenBuckets()
+    app.before_request(admit_request)
+    app.teardown_request(_release)
@@ -0,0 +1,166 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import chain
+from app.models import ArchivedOrder, Order, Product, SalesRollup
+
+GRANULARITIES = ('hour', 'day')
+
+def bucket_start(moment, granularity):
+    """Truncate a datetime to the start of its hour or day."""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def parse_range(start=None, end=None, default_days=30):
+    """Parse ISO ``start``/``end`` strings into a [start, end) datetime range.
+
+    Raises ValueError for malformed dates or an empty range.
+    """
+    end_dt = datetime.fromisoformat(end) if end else datetime.utcnow()
+    start_dt = datetime.fromisoformat(start) if start else end_dt - timedelta(days=default_days)
+    if start_dt >= end_dt:
+        raise ValueError('start must be before end')
+    return start_dt, end_dt
+
+def category_map(product_ids=None):
+    """Map product id strings to category id strings in a single query."""
+    products = Product.objects.only('category')
+    if product_ids is not None:
+        products = products.filter(id__in=list(product_ids))
+    return {
+        str(doc['_id']): str(doc['category'])
+        for doc in products.as_pymongo()
+        if doc.get('category')
+    }
+
+def _contribution(doc, status, payment_status, categories):
+    """Return the counters one order adds to its rollup buckets."""
+    counts = Counter({
+        'order_count': 1,
+        f'status_counts__{status}': 1,
+        f'payment_status_counts__{payment_status}': 1
+    })
+    total = doc.get('total_amount', 0)
+    if status != 'cancelled':
+        counts['revenue'] += total
+        for item in doc.get('items', []):
+            product_id = str(item['product'])
+            counts[f'units_by_product__{product_id}'] += item['quantity']
+            category_id = categories.get(product_id, 'unknown')
+            counts[f'units_by_category__{category_id}'] += item['quantity']
+    if payment_status == 'completed':
+        counts['paid_revenue'] += total
+    return counts
+
+def _apply(created_at, counts):
+    """Increment the hourly and daily buckets for ``created_at``."""
+    changes = {f'inc__{key}': value for key, value in counts.items() if value}
+    if not changes:
+        return
+    for granularity in GRANULARITIES:
+        SalesRollup.objects(
+            granularity=granularity,
+            bucket=bucket_start(created_at, granularity)
+        ).update_one(upsert=True, set__updated_at=datetime.utcnow(), **changes)
+
+def track_order(order, previous=None):
+    """Apply a new order, or a change to an existing one, to the rollups.
+
+    ``previous`` is the ``(status, payment_status)`` pair the order had
+    before the change; pass None when the order was just created.
+    Items, totals and ``created_at`` never change after checkout, so the
+    delta between the two states is all that needs to be written.
+    """
+    try:
+        doc = order.to_mongo()
+        categories = category_map(item['product'] for item in doc.get('items', []))
+        counts = _contribution(doc, order.status, order.payment_status, categories)
+        if previous is not None:
+            status, payment_status = previous
+            if (status, payment_status) == (order.status, order.payment_status):
+                return
+            counts.subtract(_contribution(doc, status, payment_status, categories))
+        _apply(order.created_at, counts)
+    except Exception as e:
+        # Rollups can be rebuilt with a backfill; never fail the order for them
+        print(f"Failed to update sales rollups: {str(e)}")
+
+def backfill(start, end):
+    """Rebuild all rollups for whole days overlapping [start, end).
+
+    Returns the number of orders processed.
+    """
+    start = bucket_start(start, 'day')
+    end_day = bucket_start(end, 'day')
+    end = end_day if end_day == end else end_day + timedelta(days=1)
+
+    categories = category_map()
+    buckets = defaultdict(Counter)
+    processed = 0
+    # Archived orders still count towards the sales they were part of
+    orders = chain.from_iterable(
+        model.objects(created_at__gte=start, created_at__lt=end).exclude(
+            'shipping_address'
+        ).as_pymongo().batch_size(1000)
+        for model in (Order, ArchivedOrder)
+    )
+    for doc in orders:
+        counts = _contribution(doc, doc['status'], doc['payment_status'], categories)
+        for granularity in GRANULARITIES:
+            buckets[(granularity, bucket_start(doc['created_at'], granularity))].update(counts)
+        processed += 1
+
+    SalesRollup.objects(bucket__gte=start, bucket__lt=end).delete()
+    rollups = []
+    for (granularity, bucket), counts in buckets.items():
+        rollup = SalesRollup(granularity=granularity, bucket=bucket)
+        for key, value in counts.items():
+            if '__' in key:
+                field, name = key.split('__', 1)
+                if value:
+                    getattr(rollup, field)[name] = value
+            else:
+                setattr(rollup, key, value)
+        rollups.append(rollup)
+    if rollups:
+        SalesRollup.objects.insert(rollups, load_bulk=False)
+    return processed
+
+def get_rollups(granularity, start, end):
+    """Return the rollup documents for [start, end) in bucket order."""
+    return SalesRollup.objects(
+        granularity=granularity,
+        bucket__gte=bucket_start(start, granularity),
+        bucket__lt=end
+    ).order_by('bucket')
+
+def summarize(rollups, limit=10):
+    """Merge a sequence of rollups into totals and top sellers."""
+    totals = Counter()
+    products = Counter()
+    categories = Counter()
+    statuses = Counter()
+    payment_statuses = Counter()
+    for rollup in rollups:
+        totals['order_count'] += rollup.order_count
+        totals['revenue'] += rollup.revenue
+        totals['paid_revenue'] += rollup.paid_revenue
+        products.update(rollup.units_by_product)
+        categories.update(rollup.units_by_category)
+        statuses.update(rollup.status_counts)
+        payment_statuses.update(rollup.payment_status_counts)
+    return {
+        'order_count': totals['order_count'],
+        'revenue': round(totals['revenue'], 2),
+        'paid_revenue': round(totals['paid_revenue'], 2),
+        'status_counts': dict(+statuses),
+        'payment_status_counts': dict(+payment_statuses),
+        'top_products': [
+            {'product': product_id, 'units': units}
+            for product_id, units in products.most_common(limit) if units > 0
+        ],
+        'top_categories': [
+            {'category': category_id, 'units': units}
+            for category_id, units in categories.most_common(limit) if units > 0
+        ]
+    }
@@ -0,0 +1,597 @@
+"""ASGI server with async variants of the hot catalog, cart and order routes.
+
+The routes below query MongoDB through motor, so one event loop serves
+many concurrent requests while they wait on the database. Every other
+path is handed to the regular Flask app, which a2wsgi runs in a thread
+pool. Both paths use the same models: async handlers load raw documents
+with ``_from_son`` and reply with the models' ``to_dict``.
+
+Serve with ``uvicorn asgi:app``; ``run.py`` and gunicorn keep serving the
+WSGI app unchanged.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import wraps
+import jwt as pyjwt
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.convertors import Convertor, register_url_convertor
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route, request_response
+from werkzeug.datastructures import MultiDict
+from mongoengine import ValidationError
+from app import create_app, admission, analytics, catalog, compression, guest_carts, health, live, metrics, recommendations
+from app.db import connection_settings
+from app.models import User, Product, Cart, Order, OrderItem, ArchivedOrder, SETTLED_STATUSES
+from app.routes.order import send_order_confirmation
+from app.routes.product import product_listing
+from app.routing import READ_AFTER_HEADER, WRITE_METHODS, primary_required
+from config import Config
+
+class ObjectIdConvertor(Convertor):
+    """Match only valid ids, so paths like ``/api/products/suggest`` fall through."""
+    regex = '[0-9a-fA-F]{24}'
+
+    def convert(self, value):
+        return ObjectId(value)
+
+    def to_string(self, value):
+        return str(value)
+
+register_url_convertor('objectid', ObjectIdConvertor())
+
+class AuthError(Exception):
+    """A missing or invalid access token, with Flask-JWT-Extended's status."""
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def _identity(flask_app, request):
+    """Decode the bearer token exactly as ``@jwt_required()`` does."""
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        raise AuthError('Missing Authorization Header')
+    try:
+        with flask_app.app_context():
+            claims = decode_token(header[len('Bearer '):])
+            # In memory, apart from a periodic sync of new revocations
+            revoked = flask_app.extensions['revocation'].revoked(claims)
+    except pyjwt.ExpiredSignatureError:
+        raise AuthError('Token has expired')
+    except (pyjwt.PyJWTError, JWTExtendedException) as e:
+        raise AuthError(str(e), 422)
+    if claims.get('type') != 'access':
+        raise AuthError('Only non-refresh tokens are allowed', 422)
+    if revoked:
+        raise AuthError('Token has been revoked')
+    try:
+        return ObjectId(claims[flask_app.config['JWT_IDENTITY_CLAIM']])
+    except (InvalidId, TypeError):
+        raise AuthError('Invalid token identity', 422)
+
+def _collection(request, model, replica=False):
+    """The motor collection for a model, on a secondary when safe to read there."""
+    state = request.app.state
+    collection = state.db.get_collection(model._get_collection_name())
+    if (
+        replica
+        and state.flask_app.config['READ_REPLICA_ENABLED']
+        and not primary_required(request.headers)
+    ):
+        collection = collection.with_options(read_preference=state.flask_app.extensions['read_routing'])
+    return collection
+
+def _load(model, son):
+    # References stay as DBRefs; to_dict only needs their ids
+    return model._from_son(son, _auto_dereference=False)
+
+def _cors_headers(request):
+    if 'Origin' not in request.headers:
+        return {}
+    # Same answer Flask-CORS gives the WSGI routes
+    return {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': f'{READ_AFTER_HEADER}, {guest_carts.HEADER}'
+    }
+
+def _response(request, data, status, background=None):
+    """Serialize like ``jsonify`` and compress like the Flask app."""
+    flask_app = request.app.state.flask_app
+    body = flask_app.json.dumps(data).encode() + b'\n'
+    headers = {}
+    cache = flask_app.extensions.get('compression')
+    if cache is not None:
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding and len(body) >= flask_app.config['COMPRESSION_MIN_SIZE']:
+            body = cache.get(body, encoding, flask_app.config['COMPRESSION_LEVELS'][encoding])
+            headers['Content-Encoding'] = encoding
+    if request.method in WRITE_METHODS and status < 400:
+        window = flask_app.config['READ_REPLICA_MAX_STALENESS']
+        headers[READ_AFTER_HEADER] = str(int(time.time() + window))
+    headers.update(_cors_headers(request))
+    return Response(body, status, headers=headers, media_type='application/json', background=background)
+
+def view(endpoint, auth=False):
+    """Turn ``handler(request) -> (data, status[, background])`` into a route.
+
+    ``endpoint`` is the matching Flask endpoint, so metrics from both
+    servers land on the same series.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            flask_app = request.app.state.flask_app
+            controller = flask_app.extensions.get('admission')
+            decision = None
+            if controller is not None:
+                decision = controller.admit(
+                    endpoint, 'Authorization' in request.headers, admission.queue_delay(request.headers)
+                )
+            try:
+                if decision is not None and not decision.admitted:
+                    result = ({'error': 'Service temporarily overloaded'}, decision.status)
+                else:
+                    if auth:
+                        request.state.user_id = _identity(flask_app, request)
+                    result = await handler(request)
+            except AuthError as e:
+                result = ({'msg': e.message}, e.status)
+            finally:
+                if decision is not None:
+                    controller.release(decision)
+            response = _response(request, *result)
+            if decision is not None and not decision.admitted:
+                response.headers['Retry-After'] = str(decision.retry_after)
+            if flask_app.config['METRICS_ENABLED']:
+                metrics.REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+                metrics.REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+            return response
+        return wrapper
+    return decorator
+
+def _page_ids(flask_app, queryset, page, per_page):
+    with flask_app.app_context():
+        return catalog.page_ids(flask_app, queryset, page, per_page)
+
+@view('product.get_products')
+async def get_products(request):
+    """Get all products with optional filtering and pagination."""
+    queryset, page, per_page = product_listing(MultiDict(request.query_params.multi_items()))
+    products = _collection(request, Product, replica=True)
+    flask_app = request.app.state.flask_app
+
+    listing = None
+    if flask_app.config['CATALOG_ENGINE_ENABLED']:
+        # Builds, syncs and name ranking block on MongoDB or sort every
+        # name; keep them off the event loop
+        listing = await run_in_threadpool(_page_ids, flask_app, queryset, page, per_page)
+    if listing is not None:
+        ids, total = listing
+        docs = await products.find({'_id': {'$in': ids}}).to_list(length=len(ids))
+        if len(docs) < len(ids):
+            # Checks the missing ones on the primary, with a blocking query
+            docs = await run_in_threadpool(catalog.in_order, ids, docs)
+        else:
+            docs = catalog.in_order(ids, docs)
+    else:
+        # The page and the total are independent, so fetch them concurrently
+        docs, total = await asyncio.gather(
+            products.find(
+                queryset._query, sort=queryset._ordering,
+                skip=(page - 1) * per_page, limit=per_page
+            ).to_list(length=per_page),
+            products.count_documents(queryset._query)
+        )
+
+    return {
+        'products': [_load(Product, doc).to_dict() for doc in docs],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total + per_page - 1) // per_page
+    }, 200
+
+@view('product.get_product')
+async def get_product(request):
+    """Get a single product by ID."""
+    doc = await _collection(request, Product, replica=True).find_one({'_id': request.path_params['product_id']})
+
+    if not doc:
+        return {'error': 'Product not found'}, 404
+
+    return _load(Product, doc).to_dict(), 200
+
+@view('cart.get_cart', auth=True)
+async def get_cart(request):
+    """Get the current user's cart."""
+    user_id = request.state.user_id
+    if not await _collection(request, User).find_one({'_id': user_id}, {'_id': 1}):
+        return {'error': 'User not found'}, 404
+
+    # Viewing never writes: the cart is stored with its first item
+    doc = await _collection(request, Cart).find_one({'user': user_id})
+    if not doc:
+        now = datetime.utcnow()
+        doc = {'user': user_id, 'items': [], 'created_at': now, 'updated_at': now}
+
+    return _load(Cart, doc).to_dict(), 200
+
+@view('cart.add_to_cart', auth=True)
+async def add_to_cart(request):
+    """Add a product to the cart."""
+    user_id = request.state.user_id
+    if not await _collection(request, User).find_one({'_id': user_id}, {'_id': 1}):
+        return {'error': 'User not found'}, 404
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not data or 'product_id' not in data or 'quantity' not in data:
+        return {'error': 'Product ID and quantity are required'}, 400
+
+    try:
+        product_id = ObjectId(data['product_id'])
+    except (InvalidId, TypeError):
+        return {'error': 'Product not found'}, 404
+
+    carts = _collection(request, Cart)
+    product, cart = await asyncio.gather(
+        _collection(request, Product).find_one({'_id': product_id}, {'stock': 1}),
+        carts.find_one({'user': user_id})
+    )
+    if not product:
+        return {'error': 'Product not found'}, 404
+
+    quantity = int(data['quantity'])
+    if quantity <= 0:
+        return {'error': 'Quantity must be greater than 0'}, 400
+
+    if quantity > product['stock']:
+        return {'error': 'Requested quantity exceeds available stock'}, 400
+
+    now = datetime.utcnow()
+    existing_item = next(
+        (item for item in (cart or {}).get('items', []) if item['product'] == product_id),
+        None
+    )
+
+    if existing_item:
+        new_quantity = existing_item['quantity'] + quantity
+        if new_quantity > product['stock']:
+            return {'error': 'Total quantity exceeds available stock'}, 400
+        doc = await carts.find_one_and_update(
+            {'_id': cart['_id'], 'user': user_id, 'items.product': product_id},
+            {'$set': {'items.$.quantity': new_quantity, 'items.$.added_at': now, 'updated_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+    else:
+        doc = await carts.find_one_and_update(
+            {'user': user_id},
+            {
+                '$push': {'items': {'product': product_id, 'quantity': quantity, 'added_at': now}},
+                '$set': {'updated_at': now},
+                # A new cart takes its user's id, like Cart.persist
+                '$setOnInsert': {'_id': user_id, 'created_at': now}
+            },
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    return {
+        'message': 'Product added to cart successfully',
+        'cart': _load(Cart, doc).to_dict()
+    }, 200
+
+@view('order.get_orders', auth=True)
+async def get_orders(request):
+    """Get all orders for the current user."""
+    user_id = request.state.user_id
+    user = await _collection(request, User).find_one({'_id': user_id}, {'archived_orders': 1})
+    if not user:
+        return {'error': 'User not found'}, 404
+
+    status = request.query_params.get('status')
+    page = int(request.query_params.get('page', 1))
+    per_page = int(request.query_params.get('per_page', 10))
+    summary = request.query_params.get('view') == 'summary'
+    projection = dict.fromkeys(Order.SUMMARY_FIELDS, 1) if summary else None
+
+    query = {'user': user_id}
+    if status:
+        query['status'] = status
+
+    # Live orders first, then archived ones, which are all older
+    start = (page - 1) * per_page
+    orders = _collection(request, Order)
+    archive = _collection(request, ArchivedOrder)
+    counts = [orders.count_documents(query)]
+    if status in SETTLED_STATUSES:
+        counts.append(archive.count_documents(query))
+    docs, live_total, *archived = await asyncio.gather(
+        orders.find(query, projection, sort=[('created_at', -1)], skip=start, limit=per_page).to_list(length=per_page),
+        *counts
+    )
+    # Same totals as lifecycle.archived_count
+    total = live_total + (sum(archived) if status else user.get('archived_orders', 0))
+    if len(docs) < per_page and total > live_total:
+        docs += await archive.find(
+            query, projection, sort=[('created_at', -1)], skip=max(0, start - live_total), limit=per_page - len(docs)
+        ).to_list(length=per_page - len(docs))
+
+    return {
+        'orders': [
+            _load(Order, doc).to_summary() if summary else _load(Order, doc).to_dict() for doc in docs
+        ],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total + per_page - 1) // per_page
+    }, 200
+
+@view('order.get_order', auth=True)
+async def get_order(request):
+    """Get a specific order by ID."""
+    user_id = request.state.user_id
+    if not await _collection(request, User).find_one({'_id': user_id}, {'_id': 1}):
+        return {'error': 'User not found'}, 404
+
+    query = {'_id': request.path_params['order_id'], 'user': user_id}
+    doc = await _collection(request, Order).find_one(query)
+    if not doc:
+        doc = await _collection(request, ArchivedOrder).find_one(query)
+    if not doc:
+        return {'error': 'Order not found'}, 404
+
+    return _load(Order, doc).to_dict(), 200
+
+async def _restock(product_collection, items):
+    """Give back the stock taken for ``items`` by a checkout that failed."""
+    await asyncio.gather(*(
+        product_collection.update_one({'_id': item['product']}, {'$inc': {'stock': item['quantity'], 'version': 1}})
+        for item in items
+    ))
+
+def _after_checkout(flask_app, order, user):
+    """Rollups, recommendations and the confirmation email, off the event loop."""
+    with flask_app.app_context():
+        analytics.track_order(order)
+        recommendations.record_order(order)
+        send_order_confirmation(user, order)
+
+@view('order.create_order', auth=True)
+async def create_order(request):
+    """Create a new order from the cart."""
+    user_id = request.state.user_id
+    user = await _collection(request, User).find_one({'_id': user_id})
+
+    if not user:
+        return {'error': 'User not found'}, 404
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not data or 'shipping_address' not in data:
+        return {'error': 'Shipping address is required'}, 400
+
+    carts = _collection(request, Cart)
+    cart = await carts.find_one({'user': user_id})
+    if not cart or not cart.get('items'):
+        return {'error': 'Cart is empty'}, 400
+
+    product_collection = _collection(request, Product)
+    products = {
+        doc['_id']: doc
+        async for doc in product_collection.find(
+            {'_id': {'$in': [item['product'] for item in cart['items']]}},
+            {'name': 1, 'price': 1, 'stock': 1, 'images': {'$slice': 1}, 'sku': 1}
+        )
+    }
+
+    # Validate stock and calculate total
+    order_items = []
+    total_amount = 0
+
+    for cart_item in cart['items']:
+        product = products.get(cart_item['product'])
+
+        if not product or cart_item['quantity'] > product['stock']:
+            return {
+                'error': f"Insufficient stock for {product['name'] if product else 'a removed product'}",
+                'product_id': str(cart_item['product'])
+            }, 400
+
+        order_items.append(OrderItem.snapshot(_load(Product, product), cart_item['quantity']))
+        total_amount += product['price'] * cart_item['quantity']
+
+    # Build the document through the model so it is validated the same way
+    order = Order(
+        user=user_id,
+        items=order_items,
+        item_count=sum(item.quantity for item in order_items),
+        total_amount=total_amount,
+        status='pending',
+        shipping_address=data['shipping_address'],
+        payment_status='pending'
+    )
+    try:
+        order.validate()
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    son = order.to_mongo()
+
+    # Each decrement only applies while the stock covers it and bumps the
+    # version, so concurrent checkouts cannot oversell and seller bulk
+    # updates see the sale; if any falls short, the others are undone
+    updated = await asyncio.gather(*(
+        product_collection.find_one_and_update(
+            {'_id': item['product'], 'stock': {'$gte': item['quantity']}},
+            {'$inc': {'stock': -item['quantity'], 'version': 1}},
+            projection={'stock': 1}, return_document=ReturnDocument.AFTER
+        )
+        for item in cart['items']
+    ), return_exceptions=True)
+    applied = [item for item, doc in zip(cart['items'], updated) if isinstance(doc, dict)]
+    if len(applied) < len(cart['items']):
+        await _restock(product_collection, applied)
+        error = next((doc for doc in updated if isinstance(doc, BaseException)), None)
+        if error is not None:
+            raise error
+        short = next(item for item, doc in zip(cart['items'], updated) if doc is None)
+        return {
+            'error': f"Insufficient stock for {products[short['product']]['name']}",
+            'product_id': str(short['product'])
+        }, 400
+    try:
+        result = await _collection(request, Order).insert_one(son)
+    except Exception:
+        await _restock(product_collection, applied)
+        raise
+    son['_id'] = result.inserted_id
+    for doc in updated:
+        live.product_changed(doc['_id'], stock=doc['stock'])
+    await carts.delete_one({'_id': cart['_id'], 'user': user_id})
+
+    order = _load(Order, son)
+    background = BackgroundTask(_after_checkout, request.app.state.flask_app, order, _load(User, user))
+
+    return {
+        'message': 'Order created successfully',
+        'order': order.to_dict()
+    }, 201, background
+
+async def _live_stream(subscription, wake, config, opening):
+    """``live.stream`` for the event loop: woken by the hub instead of blocking a thread."""
+    started = last_change = time.monotonic()
+    yield live.open_stream(config) + opening
+    while True:
+        now = time.monotonic()
+        if now - started >= config['LIVE_MAX_DURATION'] or now - last_change >= config['LIVE_IDLE_TIMEOUT']:
+            return
+        try:
+            await asyncio.wait_for(wake.wait(), config['LIVE_HEARTBEAT'])
+        except asyncio.TimeoutError:
+            yield live.HEARTBEAT
+            continue
+        wake.clear()
+        changes = subscription.drain()
+        if changes:
+            metrics.LIVE_EVENTS.inc(len(changes))
+            last_change = time.monotonic()
+            yield ''.join(live.change_event(change) for change in changes)
+
+async def live_products(request):
+    """Stream stock and price changes for ``?ids=<id>,<id>`` as Server-Sent Events.
+
+    Not wrapped in ``view``: the stream outlives any admission slot, and
+    its limit is ``LIVE_ASGI_MAX_SUBSCRIBERS`` instead.
+    """
+    flask_app = request.app.state.flask_app
+    config = flask_app.config
+    try:
+        product_ids = live.parse_ids(request.query_params.get('ids'), config['LIVE_MAX_PRODUCTS'])
+    except ValueError as e:
+        return _response(request, {'error': str(e)}, 400)
+
+    live.hub.start(flask_app)
+    subscription = live.hub.subscribe(map(str, product_ids), config['LIVE_ASGI_MAX_SUBSCRIBERS'])
+    if subscription is None:
+        response = _response(request, {'error': 'Too many live connections'}, 503)
+        response.headers['Retry-After'] = str(int(config['LIVE_RETRY']))
+        return response
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # The loop closed while the stream was ending
+
+    subscription.notify = notify
+    # Subscribed first, so a change made while this reads is still sent
+    try:
+        docs = await _collection(request, Product).find(
+            {'_id': {'$in': product_ids}}, {field: 1 for field in live.FIELDS}
+        ).to_list(None)
+    except Exception:
+        live.hub.unsubscribe(subscription)
+        raise
+    if config['METRICS_ENABLED']:
+        metrics.REQUESTS.labels('product.live_products', 'GET', '200').inc()
+    return StreamingResponse(
+        _live_stream(subscription, wake, config, live.snapshot_events(docs)),
+        media_type='text/event-stream',
+        headers=dict(live.SSE_HEADERS, **_cors_headers(request)),
+        # Runs once the stream ends or the client disconnects
+        background=BackgroundTask(live.hub.unsubscribe, subscription)
+    )
+
+class SignedInOnly:
+    """Route endpoint that hands requests without a bearer token to Flask.
+
+    Guest carts never touch the cart collection, so the Flask routes serve
+    them from the thread pool; signed-in requests run ``endpoint``.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = request_response(endpoint)
+
+    async def __call__(self, scope, receive, send):
+        if any(name == b'authorization' for name, _ in scope['headers']):
+            await self.endpoint(scope, receive, send)
+        else:
+            await scope['app'].state.wsgi(scope, receive, send)
+
+ROUTES = [
+    Route('/api/products/live', live_products, methods=['GET']),
+    Route('/api/products/', get_products, methods=['GET']),
+    Route('/api/products/{product_id:objectid}', get_product, methods=['GET']),
+    Route('/api/cart/', SignedInOnly(get_cart), methods=['GET']),
+    Route('/api/cart/add', SignedInOnly(add_to_cart), methods=['POST']),
+    Route('/api/orders/', get_orders, methods=['GET']),
+    Route('/api/orders/create', create_order, methods=['POST']),
+    Route('/api/orders/{order_id:objectid}', get_order, methods=['GET'])
+]
+
+def create_asgi_app(config_class=Config):
+    """Build the ASGI app: async hot routes in front of the Flask app."""
+    flask_app = create_app(config_class)
+    if 'admission' in flask_app.extensions:
+        flask_app.extensions['admission'] = admission.AdmissionController(dict(
+            flask_app.config, ADMISSION_MAX_IN_FLIGHT=flask_app.config['ADMISSION_ASGI_MAX_IN_FLIGHT']
+        ))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Created on startup so each server worker gets its own client
+        client = AsyncIOMotorClient(**connection_settings(
+            flask_app.config, flask_app.extensions.get('mongodb_listeners', [])
+        ))
+        app.state.db = client.get_default_database()
+        await run_in_threadpool(health.warm_up, flask_app)
+        yield
+        client.close()
+
+    wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+    app = Starlette(routes=ROUTES + [Mount('', app=wsgi)], lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.wsgi = wsgi
+    return app
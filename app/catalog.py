@@ -0,0 +1,310 @@
+"""In-memory columnar engine for product listings.
+
+For catalogs that fit in RAM, each worker keeps the fields listings
+filter and sort on in NumPy arrays, one row per product, plus an
+id -> row map. A listing is evaluated with vectorized masks and a partial
+sort; only the requested page's documents are then fetched from MongoDB.
+
+The engine follows writes made through this worker immediately, pulls
+products changed elsewhere (by ``updated_at``) every
+``CATALOG_ENGINE_SYNC_INTERVAL`` seconds and reloads in the background
+every ``CATALOG_ENGINE_REBUILD_INTERVAL`` seconds, which also drops
+products deleted through other workers.
+"""
+import copy
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+from pymongo import ReadPreference
+from app.models import Product
+
+SORT_FIELDS = ('name', 'price', 'created_at')
+FIELDS = ('name', 'price', 'category', 'created_at', 'updated_at')
+
+# Re-read this much before the last sync, for writes committed late
+SYNC_OVERLAP = timedelta(seconds=5)
+
+def _millis(value):
+    return np.datetime64(value, 'ms').astype(np.int64)
+
+class _Columns:
+    """One generation of arrays; rows past ``n`` are spare capacity."""
+
+    def __init__(self, capacity):
+        self.n = 0
+        self.ids = np.empty(capacity, dtype=object)
+        self.names = np.empty(capacity, dtype=object)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.created = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.name_rank = None  # Computed on the first name-sorted listing
+
+    def with_rows(self, n):
+        """The same arrays with ``n`` rows in use."""
+        view = copy.copy(self)
+        view.n = n
+        view.name_rank = None
+        return view
+
+    def grown(self):
+        """A copy with twice the capacity, sharing no arrays with this one."""
+        bigger = _Columns(max(1024, 2 * len(self.ids)))
+        bigger.n = self.n
+        for name in ('ids', 'names', 'price', 'category', 'created', 'alive'):
+            getattr(bigger, name)[:self.n] = getattr(self, name)[:self.n]
+        return bigger
+
+class ColumnarCatalog:
+    """Product listing columns for one worker process.
+
+    Listings read the current ``_Columns`` without locking; writes take
+    the lock, update rows in place and publish a new generation when rows
+    are added, so a listing never sees a half-grown array.
+    """
+
+    def __init__(self):
+        self._columns = _Columns(0)
+        self._rows = {}
+        self._categories = {}
+        self._lock = threading.Lock()
+        self.built_at = None
+        self.synced_at = None
+        self.checked = 0.0
+        self._rebuilding = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _category_code(self, category_id):
+        code = self._categories.get(category_id)
+        if code is None:
+            code = self._categories[category_id] = len(self._categories)
+        return code
+
+    def load(self, docs):
+        """Replace every row with raw product documents."""
+        docs = list(docs)
+        columns = _Columns(max(1024, len(docs) + len(docs) // 4))
+        categories = {}
+        n = len(docs)
+        columns.n = n
+        columns.ids[:n] = [doc['_id'] for doc in docs]
+        columns.names[:n] = [doc['name'] for doc in docs]
+        columns.price[:n] = [doc['price'] for doc in docs]
+        columns.category[:n] = [categories.setdefault(doc['category'], len(categories)) for doc in docs]
+        columns.created[:n] = np.array([doc['created_at'] for doc in docs], dtype='datetime64[ms]').astype(np.int64)
+        columns.alive[:n] = True
+        with self._lock:
+            self._columns = columns
+            self._rows = {doc['_id']: row for row, doc in enumerate(docs)}
+            self._categories = categories
+            self.built_at = time.monotonic()
+
+    def upsert(self, doc):
+        """Add or update one product from its raw document."""
+        with self._lock:
+            columns = self._columns
+            row = self._rows.get(doc['_id'])
+            if row is None:
+                if columns.n == len(columns.ids):
+                    columns = columns.grown()
+                row = columns.n
+            if columns.names[row] != doc['name']:
+                columns.name_rank = None
+            columns.ids[row] = doc['_id']
+            columns.names[row] = doc['name']
+            columns.price[row] = doc['price']
+            columns.category[row] = self._category_code(doc['category'])
+            columns.created[row] = _millis(doc['created_at'])
+            columns.alive[row] = True
+            if row == columns.n:
+                # Publish a new generation so readers never see a partial row
+                columns = columns.with_rows(row + 1)
+            self._columns = columns
+            self._rows[doc['_id']] = row
+
+    def remove(self, product_id):
+        with self._lock:
+            row = self._rows.pop(product_id, None)
+            if row is not None:
+                self._columns.alive[row] = False
+
+    def _name_rank(self, columns):
+        rank = columns.name_rank
+        if rank is None:
+            # Code point order, the same as MongoDB's default binary collation
+            names = np.array(columns.names[:columns.n].tolist(), dtype=str)
+            rank = np.empty(columns.n, dtype=np.int64)
+            rank[np.argsort(names, kind='stable')] = np.arange(columns.n)
+            columns.name_rank = rank
+        return rank
+
+    def query(self, category=None, min_price=None, max_price=None,
+              sort_field='created_at', descending=True, skip=0, limit=10):
+        """Return ``(product ids for the page, total matches)``."""
+        columns = self._columns
+        n = columns.n
+        mask = columns.alive[:n].copy()
+        if category is not None:
+            code = self._categories.get(category)
+            if code is None:
+                return [], 0
+            mask &= columns.category[:n] == code
+        if min_price is not None:
+            mask &= columns.price[:n] >= min_price
+        if max_price is not None:
+            mask &= columns.price[:n] <= max_price
+        rows = np.flatnonzero(mask)
+        total = int(rows.size)
+        end = min(skip + limit, total)
+        if skip >= end:
+            return [], total
+
+        if sort_field == 'name':
+            key = self._name_rank(columns)[rows]
+        elif sort_field == 'price':
+            key = columns.price[rows]
+        else:
+            key = columns.created[rows]
+        if descending:
+            key = -key
+        # Only the first ``end`` matches need ordering
+        candidates = np.argpartition(key, end - 1)[:end] if end < total else np.arange(total)
+        ordered = candidates[np.lexsort((rows[candidates], key[candidates]))]
+        return columns.ids[rows[ordered[skip:end]]].tolist(), total
+
+engine = ColumnarCatalog()
+_build_lock = threading.Lock()
+
+def _documents(query=None):
+    # From the primary: a lagging replica would miss this worker's own writes
+    return Product.objects(**(query or {})).read_preference(ReadPreference.PRIMARY).only(
+        *FIELDS
+    ).as_pymongo()
+
+def _latest(docs):
+    return max((doc['updated_at'] for doc in docs), default=None)
+
+def build():
+    """Load every product into the engine."""
+    docs = list(_documents())
+    engine.load(docs)
+    engine.synced_at = _latest(docs)
+    engine.checked = time.monotonic()
+
+def _rebuild_in_background(app):
+    def run():
+        try:
+            with app.app_context():
+                build()
+        except Exception as e:
+            print(f"Failed to rebuild the catalog engine: {str(e)}")
+        finally:
+            engine._rebuilding = False
+
+    engine._rebuilding = True
+    threading.Thread(target=run, daemon=True).start()
+
+def sync():
+    """Apply products created or updated since the last sync."""
+    query = {} if engine.synced_at is None else {'updated_at__gt': engine.synced_at - SYNC_OVERLAP}
+    docs = list(_documents(query))
+    for doc in docs:
+        engine.upsert(doc)
+    latest = _latest(docs)
+    if latest is not None and (engine.synced_at is None or latest > engine.synced_at):
+        engine.synced_at = latest
+    engine.checked = time.monotonic()
+
+def ensure_current(app):
+    """Build the engine on first use and keep it in step with other workers."""
+    config = app.config
+    if engine.built_at is None:
+        with _build_lock:
+            if engine.built_at is None:
+                build()
+        return engine
+    if time.monotonic() - engine.built_at >= config['CATALOG_ENGINE_REBUILD_INTERVAL'] and not engine._rebuilding:
+        with _build_lock:
+            if not engine._rebuilding:
+                _rebuild_in_background(app)
+    if time.monotonic() - engine.checked >= config['CATALOG_ENGINE_SYNC_INTERVAL']:
+        with _build_lock:
+            if time.monotonic() - engine.checked >= config['CATALOG_ENGINE_SYNC_INTERVAL']:
+                sync()
+    return engine
+
+def plan(queryset):
+    """Translate a ``product_listing`` queryset into ``query`` arguments.
+
+    Returns None for listings the engine does not evaluate (text search),
+    which then go to MongoDB.
+    """
+    conditions = dict(queryset._query)
+    arguments = {}
+    if 'category' in conditions:
+        arguments['category'] = conditions.pop('category')
+    price = conditions.pop('price', {})
+    if set(price) - {'$gte', '$lte'}:
+        return None
+    arguments['min_price'] = price.get('$gte')
+    arguments['max_price'] = price.get('$lte')
+    if conditions or len(queryset._ordering) != 1:
+        return None
+    field, direction = queryset._ordering[0]
+    if field not in SORT_FIELDS:
+        return None
+    arguments['sort_field'] = field
+    arguments['descending'] = direction < 0
+    return arguments
+
+def page_ids(app, queryset, page, per_page):
+    """The page's product ids and the total, or None to use MongoDB."""
+    arguments = plan(queryset)
+    if arguments is None:
+        return None
+    return ensure_current(app).query(skip=(page - 1) * per_page, limit=per_page, **arguments)
+
+def in_order(ids, docs):
+    """Order fetched documents like ``ids``; drop ids no longer in MongoDB.
+
+    A product deleted through another worker is removed from the engine
+    here, so it stops appearing before the next rebuild. The page may have
+    come from a lagging secondary that does not have a new product yet, so
+    only products the primary no longer has are removed.
+    """
+    by_id = {doc['_id'] if isinstance(doc, dict) else doc.id: doc for doc in docs}
+    missing = [product_id for product_id in ids if product_id not in by_id]
+    if missing:
+        present = {doc['_id'] for doc in _documents({'id__in': missing})}
+        for product_id in missing:
+            if product_id not in present:
+                engine.remove(product_id)
+    return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+def product_saved(product):
+    """Apply a product created or updated by this worker."""
+    if engine.built_at is None:
+        return
+    engine.upsert({
+        '_id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'category': product.category.id,
+        'created_at': product.created_at
+    })
+
+def products_saved(docs):
+    """Apply raw documents, with ``FIELDS``, of products updated in bulk by this worker."""
+    if engine.built_at is None:
+        return
+    for doc in docs:
+        engine.upsert(doc)
+
+def product_deleted(product_id):
+    """Drop a product deleted by this worker."""
+    if engine.built_at is None:
+        return
+    engine.remove(product_id)
@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from flask import current_app
+from pymongo import ReadPreference
+from app.models import CacheVersion, Category, Product
+
+VERSION_KEY = 'category_tree'
+
+class TreeSnapshot:
+    """The serialized category list and tree at one version, with their ETags."""
+
+    def __init__(self, version, payloads):
+        self.version = version
+        self.checked = time.monotonic()
+        self.bodies = {}
+        self.etags = {}
+        for name, payload in payloads.items():
+            body = current_app.json.dumps(payload).encode()
+            self.bodies[name] = body
+            self.etags[name] = hashlib.sha1(body).hexdigest()[:20]
+
+_snapshot = None
+_lock = threading.Lock()
+
+def _entry(doc):
+    return {
+        'id': str(doc['_id']),
+        'name': doc['name'],
+        'description': doc.get('description'),
+        'parent': str(doc['parent']) if doc.get('parent') else None,
+        'ancestors': [str(ancestor) for ancestor in doc.get('ancestors', [])],
+        'product_count': doc.get('product_count', 0),
+        'created_at': doc['created_at'].isoformat()
+    }
+
+def _build(version):
+    """Read every category and lay them out as a flat list and a nested tree."""
+    # From the primary: a lagging replica would be cached under the new version
+    categories = Category.objects.read_preference(ReadPreference.PRIMARY).order_by('name')
+    entries = [_entry(doc) for doc in categories.as_pymongo()]
+    by_id = {entry['id']: dict(entry, total_count=entry['product_count'], children=[]) for entry in entries}
+    roots = []
+    for node in by_id.values():
+        parent = by_id.get(node['parent'])
+        (parent['children'] if parent else roots).append(node)
+        # Totals include every descendant's products
+        for ancestor in node['ancestors']:
+            if ancestor in by_id:
+                by_id[ancestor]['total_count'] += node['product_count']
+    return TreeSnapshot(version, {'list': {'categories': entries}, 'tree': {'categories': roots}})
+
+def _version():
+    doc = CacheVersion.objects(key=VERSION_KEY).only('version').as_pymongo().first()
+    return doc['version'] if doc else 0
+
+def snapshot():
+    """Return the current category snapshot, from this process's cache.
+
+    Between checks, at most every ``CATEGORY_TREE_MAX_AGE`` seconds, it
+    costs no queries; a check reads one version counter and only reloads
+    the categories when another process (or this one) has bumped it.
+    """
+    global _snapshot
+    current = _snapshot
+    max_age = current_app.config['CATEGORY_TREE_MAX_AGE']
+    if current is not None and time.monotonic() - current.checked < max_age:
+        return current
+    with _lock:
+        if _snapshot is current:
+            version = _version()
+            if current is not None and current.version == version:
+                current.checked = time.monotonic()
+            else:
+                _snapshot = _build(version)
+        return _snapshot
+
+def invalidate():
+    """Tell every process the tree changed; this one reloads on its next read."""
+    CacheVersion.objects(key=VERSION_KEY).update_one(inc__version=1, upsert=True)
+    with _lock:
+        if _snapshot is not None:
+            _snapshot.checked = 0.0
+
+def ancestors_of(parent):
+    """The ``ancestors`` list for a new child of ``parent``; a root has no parent."""
+    if parent is None:
+        return []
+    return list(parent.ancestors) + [parent.id]
+
+def _count(category_id, delta):
+    Category.objects(id=category_id).update_one(inc__product_count=delta)
+
+def product_added(category_id):
+    _count(category_id, 1)
+    invalidate()
+
+def product_removed(category_id):
+    _count(category_id, -1)
+    invalidate()
+
+def product_moved(old_category_id, new_category_id):
+    if old_category_id == new_category_id:
+        return
+    _count(old_category_id, -1)
+    _count(new_category_id, 1)
+    invalidate()
+
+def recount():
+    """Recompute every category's product count from the products collection."""
+    counts = {
+        row['_id']: row['count']
+        for row in Product.objects.aggregate([{'$group': {'_id': '$category', 'count': {'$sum': 1}}}])
+    }
+    updated = 0
+    for doc in Category.objects.only('id', 'product_count').as_pymongo():
+        count = counts.get(doc['_id'], 0)
+        if doc.get('product_count') != count:
+            Category.objects(id=doc['_id']).update_one(set__product_count=count)
+            updated += 1
+    invalidate()
+    return updated
@@ -0,0 +1,284 @@
+import itertools
+import random
+import time
+import tracemalloc
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from mongoengine import get_connection
+from app import analytics, categories, export, indexes, lifecycle, recommendations, routing, snapshots, suggest
+from app.models import Product, RelatedProducts
+
+analytics_cli = AppGroup('analytics', help='Sales analytics maintenance.')
+
+@analytics_cli.command('backfill')
+@click.option('--start', help='First day to rebuild (ISO date). Defaults to 30 days ago.')
+@click.option('--end', help='Day after the last day to rebuild (ISO date). Defaults to now.')
+def backfill_command(start, end):
+    """Rebuild sales rollups from the orders collection."""
+    try:
+        start_dt, end_dt = analytics.parse_range(start, end)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    processed = analytics.backfill(start_dt, end_dt)
+    click.echo(f'Rebuilt rollups from {processed} orders '
+               f'({start_dt.date().isoformat()} to {end_dt.date().isoformat()}).')
+
+orders_cli = AppGroup('orders', help='Order data maintenance.')
+
+@orders_cli.command('export')
+@click.option('--start', help='Start of the range (ISO date). Defaults to 30 days ago.')
+@click.option('--end', help='End of the range, exclusive (ISO date). Defaults to now.')
+@click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='csv')
+@click.option('--batch-size', default=1000, show_default=True, help='Orders fetched per round trip.')
+@click.option('--output', type=click.File('w'), default='-', help='Output file. Defaults to stdout.')
+def export_command(start, end, fmt, batch_size, output):
+    """Stream orders created in a date range to CSV or NDJSON."""
+    try:
+        start_dt, end_dt = analytics.parse_range(start, end)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    for line in export.export_lines(start_dt, end_dt, fmt, batch_size):
+        output.write(line)
+
+@orders_cli.command('archive')
+@click.option('--days', type=int, help='Archive settled orders older than this. '
+              'Defaults to ORDER_ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', default=500, show_default=True, help='Orders moved per round trip.')
+def archive_command(days, batch_size):
+    """Move old delivered and cancelled orders to the archive collection."""
+    if days is None:
+        days = current_app.config['ORDER_ARCHIVE_AFTER_DAYS']
+    moved = lifecycle.archive_orders(days, batch_size)
+    click.echo(f'Archived {moved} orders older than {days} days.')
+
+@orders_cli.command('backfill-items')
+@click.option('--batch-size', default=500, show_default=True, help='Orders updated per round trip.')
+def backfill_items_command(batch_size):
+    """Copy product details into the items of orders placed before they were kept."""
+    updated = lifecycle.backfill_order_items(batch_size)
+    click.echo(f'Backfilled items of {updated} orders.')
+
+recommendations_cli = AppGroup('recommendations', help='"Frequently bought together" maintenance.')
+
+@recommendations_cli.command('build')
+@click.option('--top-k', default=recommendations.TOP_K, show_default=True)
+def build_recommendations_command(top_k):
+    """Rebuild product pair counts and related lists from all orders."""
+    started = time.perf_counter()
+    products = recommendations.build(k=top_k)
+    click.echo(f'Built related lists for {products} products '
+               f'in {time.perf_counter() - started:.1f}s.')
+
+@recommendations_cli.command('benchmark')
+@click.option('--orders', default=1000000, show_default=True, help='Synthetic orders to generate.')
+@click.option('--products', default=50000, show_default=True, help='Synthetic catalog size.')
+@click.option('--lookups', default=100000, show_default=True, help='In-memory lookups to time.')
+@click.option('--db-lookups', default=1000, show_default=True,
+              help='Lookups to time against the related_products collection; 0 skips them.')
+@click.option('--seed', default=42, show_default=True)
+def benchmark_recommendations_command(orders, products, lookups, db_lookups, seed):
+    """Time the build on synthetic baskets, then lookups in memory and in the database.
+
+    The build and the in-memory lookups never touch the database. Database
+    lookups read the related lists already stored (``flask recommendations
+    build``) the way ``/related`` does, serialization included.
+    """
+    rng = random.Random(seed)
+    # Skewed popularity so that some pairs are much more common than others
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(products)))
+    catalog = list(range(products))
+    baskets = [
+        rng.choices(catalog, cum_weights=cum_weights, k=rng.randint(1, 6))
+        for _ in range(orders)
+    ]
+
+    started = time.perf_counter()
+    ids, items, sizes = recommendations.encode_baskets(baskets)
+    encoded = time.perf_counter()
+    rows, cols, counts = recommendations.count_pairs(items, sizes, len(ids))
+    counted = time.perf_counter()
+    table = recommendations.build_table(ids, *recommendations.top_k(rows, cols, counts))
+    built = time.perf_counter()
+
+    keys = [rng.randrange(products) for _ in range(lookups)]
+    lookup_started = time.perf_counter()
+    for key in keys:
+        table.get(key, [])[:10]
+    lookup_seconds = time.perf_counter() - lookup_started
+
+    click.echo(f'orders={orders} products={products} pairs={len(rows)} '
+               f'related_lists={len(table)}')
+    click.echo(f'encode={encoded - started:.2f}s count={counted - encoded:.2f}s '
+               f'top_k={built - counted:.2f}s total={built - started:.2f}s')
+    click.echo(f'in_memory_lookup={lookup_seconds / lookups * 1e6:.2f}us per product')
+
+    if not db_lookups:
+        return
+    product_ids = list(RelatedProducts.objects.scalar('product').limit(db_lookups))
+    if not product_ids:
+        click.echo('db_lookup=skipped (no related lists stored; run flask recommendations build)')
+        return
+    keys = [rng.choice(product_ids) for _ in range(db_lookups)]
+    lookup_started = time.perf_counter()
+    for key in keys:
+        [item.to_dict() for item in recommendations.get_related(key)]
+    lookup_seconds = time.perf_counter() - lookup_started
+    click.echo(f'db_lookup={lookup_seconds / db_lookups * 1e3:.3f}ms per product '
+               f'({len(product_ids)} stored lists sampled)')
+
+categories_cli = AppGroup('categories', help='Category tree maintenance.')
+
+@categories_cli.command('recount')
+def recount_categories_command():
+    """Recompute per-category product counts from the products collection."""
+    updated = categories.recount()
+    click.echo(f'Corrected product counts on {updated} categories.')
+
+catalog_cli = AppGroup('catalog', help='Static catalog snapshots.')
+
+@catalog_cli.command('snapshot')
+@click.option('--output', help='Snapshot directory. Defaults to SNAPSHOT_DIR.')
+@click.option('--full', is_flag=True, help='Rebuild every page, not only changed scopes.')
+@click.option('--every', type=float, help='Keep running, updating the snapshot every this many seconds.')
+def snapshot_catalog_command(output, full, every):
+    """Write the catalog as content-hashed JSON pages plus a manifest."""
+    directory = output or current_app.config['SNAPSHOT_DIR']
+    while True:
+        started = time.perf_counter()
+        stats = snapshots.generate(directory, current_app.config['SNAPSHOT_PAGE_SIZE'], full=full)
+        click.echo(f"Rebuilt {stats['scopes']} scopes, wrote {stats['written']} files and "
+                   f"removed {stats['removed']} in {time.perf_counter() - started:.1f}s.")
+        if not every:
+            return
+        full = False
+        time.sleep(every)
+
+suggest_cli = AppGroup('suggest', help='Search suggestion index tools.')
+
+@suggest_cli.command('benchmark')
+@click.option('--products', default=100000, show_default=True, help='Synthetic products to index.')
+@click.option('--queries', default=10000, show_default=True, help='Lookups to time per prefix length.')
+@click.option('--seed', default=42, show_default=True)
+def benchmark_suggest_command(products, queries, seed):
+    """Report the index's memory footprint and query latency (no database)."""
+    rng = random.Random(seed)
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9)))
+             for _ in range(5000)]
+    entries = [
+        ('product', f'{i:024x}', ' '.join(rng.choices(words, k=rng.randint(2, 4))), rng.randint(0, 1000))
+        for i in range(products)
+    ]
+
+    tracemalloc.start()
+    index = suggest.PrefixIndex()
+    index.load(entries)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    click.echo(f'products={products} terms={len(index._terms)} memory={size / 2 ** 20:.1f}MiB '
+               f'({size / products * 100000 / 2 ** 20:.1f}MiB per 100k products)')
+
+    for length in range(1, 6):
+        prefixes = [rng.choice(words)[:length] for _ in range(queries)]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            index.search(prefix)
+        click.echo(f'{length}-char prefix: {(time.perf_counter() - started) / queries * 1e6:.1f}us per query')
+
+    sample = rng.sample(entries, 1000)
+    started = time.perf_counter()
+    for kind, entry_id, label, popularity in sample:
+        index.upsert(kind, entry_id, label + ' renamed', popularity)
+    click.echo(f'rename: {(time.perf_counter() - started) / len(sample) * 1e3:.2f}ms per write')
+
+db_cli = AppGroup('db', help='Database deployment tasks.')
+
+@db_cli.command('ensure-indexes')
+@click.option('--prune', is_flag=True, help='Drop indexes that are no longer declared on the models.')
+def ensure_indexes_command(prune):
+    """Create the declared indexes for every collection."""
+    undeclared = indexes.ensure_indexes(prune=prune)
+    for collection, names in undeclared.items():
+        for name in names:
+            action = 'Dropped' if prune else 'Undeclared'
+            click.echo(f'{action} index {collection}.{name}')
+    click.echo(f'Indexes ensured for {len(undeclared)} collections.')
+
+@db_cli.command('check-indexes')
+def check_indexes_command():
+    """Explain each hot route query; fail on a COLLSCAN or in-memory SORT.
+
+    Run after ensure-indexes: queries on a missing collection plan as EOF.
+    """
+    problems = indexes.check_query_plans()
+    for route, stages in problems.items():
+        click.echo(f'{route}: {", ".join(stages)}')
+    if problems:
+        raise SystemExit(1)
+    click.echo(f'All {len(indexes.QUERY_SHAPES)} query shapes use indexes.')
+
+@db_cli.command('shard')
+def shard_command():
+    """Shard carts and orders on hashed user and products on hashed id.
+
+    Run through mongos after ensure-indexes.
+    """
+    if not get_connection().is_mongos:
+        raise click.ClickException('Not connected to mongos')
+    for namespace in indexes.shard_collections():
+        click.echo(f'Sharded {namespace}')
+    click.echo(f'Shard keys set for {len(indexes.SHARD_KEYS)} collections.')
+
+@db_cli.command('check-targeting')
+def check_targeting_command():
+    """Explain the hot per-user and per-product queries through mongos.
+
+    Fails when one of them is sent to more than one shard.
+    """
+    if not get_connection().is_mongos:
+        raise click.ClickException('Not connected to mongos')
+    broadcasts = indexes.check_targeting()
+    for route, shards in broadcasts.items():
+        click.echo(f'{route}: sent to {", ".join(shards)}')
+    if broadcasts:
+        raise SystemExit(1)
+    click.echo(f'All {len(indexes.TARGETED_SHAPES)} targeted query shapes go to a single shard.')
+
+@db_cli.command('check-routing')
+def check_routing_command():
+    """Show which replica set member serves routed catalog reads.
+
+    Routed reads should land on a secondary, and reads from a client that
+    just wrote should land on the primary.
+    """
+    def routed_read_address(headers):
+        with current_app.test_request_context('/api/products/', headers=headers):
+            routing.route_to_replica()
+            products = Product.objects.limit(1)
+            list(products)
+            return products._cursor.address
+
+    client = get_connection()
+    replica = routed_read_address({})
+    after_write = routed_read_address({routing.READ_AFTER_HEADER: str(time.time() + 60)})
+
+    click.echo(f'primary:           {client.primary}')
+    click.echo(f'secondaries:       {sorted(client.secondaries)}')
+    click.echo(f'routed read:       {replica}')
+    click.echo(f'read after write:  {after_write}')
+
+    if after_write != client.primary or (client.secondaries and replica not in client.secondaries):
+        raise SystemExit(1)
+
+def register_cli(app):
+    """Attach the maintenance command groups to the app's ``flask`` CLI."""
+    app.cli.add_command(db_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(orders_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(suggest_cli)
+    app.cli.add_command(categories_cli)
+    app.cli.add_command(catalog_cli)
@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+import brotli
+import zstandard
+from flask import current_app, request
+
+# Server preference when the client accepts several encodings equally
+ENCODINGS = ('zstd', 'br', 'gzip')
+
+# Everything else (images, archives, PDFs) is already compressed or binary
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'application/xml', 'image/svg+xml'
+}
+
+def negotiate(accept_encoding):
+    """Pick the best supported encoding from an ``Accept-Encoding`` header."""
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        weights[name] = q
+    wildcard = weights.get('*', 0)
+    best, best_q = None, 0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def compressible(response):
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+class StreamCompressor:
+    """Incremental compressor whose output is flushed after every chunk.
+
+    Flushing keeps streamed responses streaming: each generator chunk
+    reaches the client as soon as it is produced instead of waiting for
+    the compressor's internal buffer to fill.
+    """
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        if self.encoding == 'gzip':
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress(data, encoding, level):
+    """Compress a complete body in one call."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by encoding and the body's identity.
+
+    Responses with a strong ETag are keyed by it; others by a SHA-256 of
+    the body, which is hardware accelerated and costs a fraction of
+    compressing. Either way bodies that repeat (category lists, popular
+    product pages, cached responses) are compressed once per encoding.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data, encoding, level, etag=None):
+        identity = ('etag', etag) if etag else ('sha256', hashlib.sha256(data).digest())
+        key = (encoding, level, identity)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            self.misses += 1
+        compressed = compress(data, encoding, level)
+        if len(compressed) > self.max_bytes:
+            return compressed
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self.size += len(compressed)
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return compressed
+
+def _stream(iterable, compressor):
+    for chunk in iterable:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if chunk:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
+
+def _compress_response(response):
+    config = current_app.config
+    if (
+        request.method == 'HEAD'
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or not compressible(response)
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    level = config['COMPRESSION_LEVELS'][encoding]
+
+    if response.is_streamed:
+        response.response = _stream(response.response, StreamCompressor(encoding, level))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESSION_MIN_SIZE']:
+            return response
+        etag, weak = response.get_etag()
+        response.set_data(current_app.extensions['compression'].get(
+            data, encoding, level, etag=None if weak else etag
+        ))
+
+    response.headers['Content-Encoding'] = encoding
+    if response.headers.get('ETag'):
+        # The compressed body differs byte-for-byte from the identity one
+        response.set_etag(response.get_etag()[0], weak=True)
+    return response
+
+def init_app(app):
+    """Compress eligible responses in an ``after_request`` hook.
+
+    Register this before the other extensions: Flask runs ``after_request``
+    hooks in reverse order, so it then sees each response last.
+    """
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    app.extensions['compression'] = CompressedCache(app.config['COMPRESSION_CACHE_BYTES'])
+    app.after_request(_compress_response)
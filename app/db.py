@@ -0,0 +1,147 @@
+import threading
+import time
+from mongoengine import DEFAULT_CONNECTION_NAME, disconnect, register_connection
+from pymongo import ReadPreference, monitoring
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST
+}
+
+# Upper bounds (ms) of the checkout-wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool listener that measures how long checkouts wait.
+
+    A checkout that waits means every pooled connection was busy, so a
+    rising wait time (or any timeouts) says ``maxPoolSize`` is too small
+    for the worker's concurrency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.in_use = 0
+            self.open = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def _wait(self):
+        started = getattr(self._started, 'value', None)
+        self._started.value = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._wait()
+        wait_ms = wait * 1000
+        bucket = next(
+            (i for i, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms <= bound),
+            len(WAIT_BUCKETS_MS)
+        )
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_buckets[bucket] += 1
+
+    def connection_check_out_failed(self, event):
+        self._wait()
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkout_timeouts': self.checkout_timeouts,
+                'connections_in_use': self.in_use,
+                'connections_open': self.open,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+                'wait_histogram_ms': {
+                    **{f'le_{bound}': count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)},
+                    'inf': self.wait_buckets[-1]
+                }
+            }
+
+pool_stats = PoolStats()
+
+def connection_settings(config, listeners=()):
+    """Build the MongoClient keyword arguments from the app config."""
+    settings = dict(config['MONGODB_SETTINGS'])
+    settings['read_preference'] = READ_PREFERENCES[config.get('MONGODB_READ_PREFERENCE', 'primary')]
+    settings['event_listeners'] = (
+        list(settings.get('event_listeners', [])) + [pool_stats] + list(listeners)
+    )
+    return settings
+
+def init_app(app):
+    """Register the MongoDB connection without opening it.
+
+    mongoengine creates the MongoClient on the first query, so under
+    ``gunicorn --preload`` each worker gets its own client, pool and
+    monitor threads after the fork instead of inheriting the master's.
+    Nothing in ``create_app`` may query the database for this to hold.
+    Extensions add pymongo listeners to ``app.extensions['mongodb_listeners']``
+    before this runs.
+    """
+    listeners = app.extensions.get('mongodb_listeners', [])
+    register_connection(DEFAULT_CONNECTION_NAME, **connection_settings(app.config, listeners))
+
+def reset_after_fork(app):
+    """Give a forked worker a fresh, unopened connection and clean statistics.
+
+    Normally the master never connects, but if anything queried MongoDB
+    while the app was preloaded, the worker would inherit that client,
+    which pymongo does not support across a fork. Dropping and
+    re-registering the connection is cheap either way.
+    """
+    disconnect(DEFAULT_CONNECTION_NAME)
+    init_app(app)
+    pool_stats.reset()
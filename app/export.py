@@ -0,0 +1,111 @@
+import csv
+import heapq
+import io
+import json
+from app.models import ArchivedOrder, Order, User
+
+SHIPPING_FIELDS = ['street', 'city', 'state', 'zip', 'country']
+
+ORDER_COLUMNS = [
+    'id', 'user', 'user_email', 'status', 'payment_status', 'payment_id',
+    'total_amount', 'created_at', 'updated_at'
+]
+
+CSV_COLUMNS = ORDER_COLUMNS + [f'shipping_{field}' for field in SHIPPING_FIELDS] + ['items']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+def _user_emails(batch):
+    """Resolve the emails for one batch of orders in a single query."""
+    user_ids = {doc['user'] for doc in batch if doc.get('user')}
+    users = User.objects(id__in=list(user_ids)).only('email').as_pymongo()
+    return {user['_id']: user['email'] for user in users}
+
+def _record(doc, emails):
+    """Serialize a raw order document like ``Order.to_dict()`` does."""
+    return {
+        'id': str(doc['_id']),
+        'user': str(doc['user']),
+        'user_email': emails.get(doc['user']),
+        'items': [
+            {
+                'product': str(item['product']),
+                'quantity': item['quantity'],
+                'price_at_time': item['price_at_time']
+            }
+            for item in doc.get('items', [])
+        ],
+        'total_amount': doc['total_amount'],
+        'status': doc['status'],
+        'shipping_address': doc.get('shipping_address', {}),
+        'payment_status': doc['payment_status'],
+        'payment_id': doc.get('payment_id'),
+        'created_at': doc['created_at'].isoformat(),
+        'updated_at': doc['updated_at'].isoformat()
+    }
+
+def iter_orders(start, end, batch_size=1000):
+    """Yield serialized orders created in [start, end) in ``created_at`` order.
+
+    Documents are read straight from a cursor as raw dicts, and the users
+    for each batch are fetched with one query, so memory stays bounded by
+    ``batch_size`` no matter how many orders are in the range. Live and
+    archived orders are merged from one cursor each.
+    """
+    cursor = heapq.merge(*(
+        model.objects(
+            created_at__gte=start,
+            created_at__lt=end
+        ).order_by('created_at').as_pymongo().batch_size(batch_size)
+        for model in (Order, ArchivedOrder)
+    ), key=lambda doc: doc['created_at'])
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            emails = _user_emails(batch)
+            for order in batch:
+                yield _record(order, emails)
+            batch = []
+    if batch:
+        emails = _user_emails(batch)
+        for order in batch:
+            yield _record(order, emails)
+
+def ndjson_lines(records):
+    """Encode records as newline-delimited JSON."""
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+def csv_lines(records):
+    """Encode records as CSV with a header row, one line at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for record in records:
+        address = record['shipping_address']
+        writer.writerow(
+            [record[column] for column in ORDER_COLUMNS] +
+            [address.get(field, '') for field in SHIPPING_FIELDS] +
+            [json.dumps(record['items'])]
+        )
+        yield flush()
+
+def export_lines(start, end, fmt='csv', batch_size=1000):
+    """Return a generator of encoded export lines in the requested format."""
+    records = iter_orders(start, end, batch_size=batch_size)
+    if fmt == 'ndjson':
+        return ndjson_lines(records)
+    return csv_lines(records)
@@ -0,0 +1,127 @@
+"""Carts for shoppers who are not signed in, kept by the client.
+
+A guest cart lives in a signed, zlib-compressed token that the client
+sends in the ``X-Guest-Cart`` header and receives back, updated, in the
+same header. Nothing is stored server-side: a guest cart request costs one
+product lookup, which checks the cart against current stock. On login the
+guest cart is merged into the user's stored cart with one atomic update.
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from mongoengine import NotUniqueError
+from app.models import Cart, CartItem, CART_TTL_DAYS, Product
+
+HEADER = 'X-Guest-Cart'
+EPOCH = datetime(1970, 1, 1)
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='guest-cart')
+
+def _seconds(value):
+    return int((value - EPOCH).total_seconds())
+
+def dump(cart):
+    """The token for ``cart``: ``[created, [[product id, quantity, added], ...]]``."""
+    return _serializer().dumps([
+        _seconds(cart.created_at),
+        [[str(item.product.id), item.quantity, _seconds(item.added_at)] for item in cart.items]
+    ])
+
+def _decode(token):
+    if not token:
+        return None
+    try:
+        # Untouched guest carts expire like stored ones
+        created, items = _serializer().loads(token, max_age=CART_TTL_DAYS * 24 * 3600)
+        return created, [(product_id, int(quantity), added) for product_id, quantity, added in items]
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+def load(token, *product_ids):
+    """The guest cart in ``token``, checked against current stock.
+
+    Fetches the cart's products and any other ``product_ids`` in one query
+    and returns ``(cart, {product id: product})``. Items whose product is
+    gone or sold out are dropped, and quantities above the stock lowered.
+    A missing, tampered or expired token gives an empty cart.
+    """
+    now = datetime.utcnow()
+    created, items = _decode(token) or (_seconds(now), [])
+    wanted = {product_id for product_id, _, _ in items} | set(product_ids)
+    products = {
+        str(product.id): product
+        for product in Product.objects(id__in=[ObjectId(i) for i in wanted if ObjectId.is_valid(i)])
+    }
+
+    cart = Cart(items=[], created_at=EPOCH + timedelta(seconds=created), updated_at=now)
+    for product_id, quantity, added in items:
+        product = products.get(product_id)
+        if product is None or product.stock <= 0 or quantity <= 0:
+            continue
+        cart.items.append(CartItem(
+            product=product, quantity=min(quantity, product.stock), added_at=EPOCH + timedelta(seconds=added)
+        ))
+    return cart, products
+
+def headers(cart):
+    """Response headers carrying a guest cart back to the client; none for a stored cart."""
+    return {} if cart.user else {HEADER: dump(cart)}
+
+def _merged_items(guest):
+    """Update expression for the stored items with the guest ``items`` folded in.
+
+    Quantities of products in both are added, up to the stock read when
+    the guest cart was loaded; other guest items are appended.
+    """
+    items = {'$ifNull': ['$items', []]}
+    products = [item['product'] for item in guest]
+
+    def guest_field(name):
+        return {'$arrayElemAt': [{'$literal': [item[name] for item in guest]}, '$$at']}
+
+    return {'$concatArrays': [
+        {'$map': {'input': items, 'as': 'item', 'in': {'$let': {
+            'vars': {'at': {'$indexOfArray': [{'$literal': products}, '$$item.product']}},
+            'in': {'$cond': [
+                {'$lt': ['$$at', 0]},
+                '$$item',
+                {'$mergeObjects': ['$$item', {
+                    'quantity': {'$min': [{'$add': ['$$item.quantity', guest_field('quantity')]}, guest_field('stock')]},
+                    'added_at': guest_field('added_at')
+                }]}
+            ]}
+        }}}},
+        {'$filter': {
+            'input': {'$literal': [{key: item[key] for key in ('product', 'quantity', 'added_at')} for item in guest]},
+            'as': 'new',
+            'cond': {'$not': [{'$in': ['$$new.product', {'$map': {'input': items, 'as': 'item', 'in': '$$item.product'}}]}]}
+        }}
+    ]}
+
+def merge(user, token):
+    """Fold the guest cart in ``token`` into ``user``'s stored cart.
+
+    An existing cart is changed by a single pipeline update, so items
+    added concurrently from another session are not lost. Without one the
+    guest cart is inserted as the user's cart. Returns the number of guest
+    items merged.
+    """
+    cart, _ = load(token)
+    if not cart.items:
+        return 0
+    guest = [
+        {'product': item.product.id, 'quantity': item.quantity, 'added_at': item.added_at, 'stock': item.product.stock}
+        for item in cart.items
+    ]
+    update = [{'$set': {'items': _merged_items(guest), 'updated_at': datetime.utcnow()}}]
+    carts = Cart._get_collection()
+    if carts.update_one({'user': user.id}, update).matched_count:
+        return len(guest)
+    try:
+        Cart(id=user.id, user=user, items=cart.items, created_at=cart.created_at).save(force_insert=True)
+    except NotUniqueError:
+        # Another session stored the user's first cart meanwhile
+        carts.update_one({'user': user.id}, update)
+    return len(guest)
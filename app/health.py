@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from flask import jsonify
+from mongoengine import get_connection
+from app import indexes, suggest
+
+_state = {'warming': False, 'warmed_at': None, 'timings': {}}
+_lock = threading.Lock()
+
+def _step(timings, name, func, *args):
+    started = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        # A failed step only leaves that cost to the first real request
+        print(f"Failed to warm up {name}: {str(e)}")
+    timings[name] = round(time.perf_counter() - started, 4)
+
+def warm_up(app):
+    """Prepare a freshly started worker before it serves traffic.
+
+    Always builds the suggestion index, so no ``/suggest`` request waits
+    for it. With ``WARMUP_ENABLED`` it also opens the MongoDB connection,
+    creates any missing indexes if ``WARMUP_ENSURE_INDEXES`` is set and
+    sends ``WARMUP_PATHS`` through the app, so the first real requests do
+    not pay for imports, connections or caches. Returns the seconds spent
+    on each step.
+    """
+    warm = app.config['WARMUP_ENABLED']
+    with _lock:
+        _state['warming'] = True
+    timings = {}
+    started = time.perf_counter()
+    with app.app_context():
+        if warm:
+            _step(timings, 'connect', lambda: get_connection().admin.command('ping'))
+            if app.config['WARMUP_ENSURE_INDEXES']:
+                _step(timings, 'indexes', indexes.ensure_indexes)
+        _step(timings, 'suggest', suggest.ensure_built, app)
+    client = app.test_client()
+    for path in app.config['WARMUP_PATHS'] if warm else ():
+        _step(timings, path, client.get, path)
+    timings['total'] = round(time.perf_counter() - started, 4)
+    with _lock:
+        _state.update(warming=False, warmed_at=time.time(), timings=timings)
+    return timings
+
+def live():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok', 'pid': os.getpid()}), 200
+
+def ready():
+    """Readiness probe: warm-up has finished and MongoDB answers."""
+    if _state['warming']:
+        return jsonify({'status': 'warming', 'pid': os.getpid()}), 503
+    try:
+        get_connection().admin.command('ping')
+    except Exception as e:
+        print(f"Readiness check failed: {str(e)}")
+        return jsonify({'status': 'unavailable', 'pid': os.getpid()}), 503
+    return jsonify({
+        'status': 'ready',
+        'pid': os.getpid(),
+        'warmed_at': _state['warmed_at'],
+        'warmup': _state['timings']
+    }), 200
+
+def init_app(app):
+    """Add the unauthenticated ``/health/live`` and ``/health/ready`` probes."""
+    app.add_url_rule('/health/live', 'health_live', live)
+    app.add_url_rule('/health/ready', 'health_ready', ready)
@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.models import (
+    User, Category, Product, Cart, Order, ArchivedOrder, SETTLED_STATUSES, Lease,
+    SalesRollup, ProductPair, RelatedProducts, CacheVersion, RevokedToken
+)
+
+# Every collection; indexes are created here rather than lazily on first use
+MODELS = [
+    User, Category, Product, Cart, Order, ArchivedOrder, Lease,
+    SalesRollup, ProductPair, RelatedProducts, CacheVersion, RevokedToken
+]
+
+# Placeholder values; the planner only needs the shape of each query
+_ID = ObjectId()
+_NOW = datetime(2024, 1, 1)
+
+# The queries behind each hot route, built the same way the routes build them
+QUERY_SHAPES = {
+    'get_products': lambda: Product.objects().order_by('-created_at'),
+    'get_products?sort_by=price': lambda: Product.objects().order_by('price'),
+    'get_products?sort_by=name': lambda: Product.objects().order_by('name'),
+    'get_products?min_price&max_price': lambda: Product.objects(
+        price__gte=10, price__lte=100).order_by('-created_at'),
+    'get_products?min_price&sort_by=price': lambda: Product.objects(
+        price__gte=10).order_by('-price'),
+    'get_products?category': lambda: Product.objects(
+        category=str(_ID)).order_by('-created_at'),
+    'get_products?category&min_price&max_price': lambda: Product.objects(
+        category=str(_ID), price__gte=10, price__lte=100).order_by('-created_at'),
+    'get_products?category&sort_by=price': lambda: Product.objects(
+        category=str(_ID)).order_by('price'),
+    'get_products?category&sort_by=name': lambda: Product.objects(
+        category=str(_ID)).order_by('name'),
+    'get_product': lambda: Product.objects(id=_ID),
+    'bulk_update_products?sku': lambda: Product.objects(seller=_ID, sku__in=['SKU-1', 'SKU-2']),
+    'get_orders': lambda: Order.objects(user=_ID).order_by('-created_at'),
+    'get_orders?status': lambda: Order.objects(user=_ID, status='pending').order_by('-created_at'),
+    'get_order': lambda: Order.objects(id=_ID, user=_ID),
+    'export_orders': lambda: Order.objects(
+        created_at__gte=_NOW, created_at__lt=_NOW + timedelta(days=30)).order_by('created_at'),
+    'get_orders?archived': lambda: ArchivedOrder.objects(user=_ID).order_by('-created_at'),
+    'get_order?archived': lambda: ArchivedOrder.objects(id=_ID, user=_ID),
+    'archive_orders': lambda: Order.objects(
+        created_at__lt=_NOW, status__in=list(SETTLED_STATUSES), updated_at__lt=_NOW),
+    'catalog_engine_sync': lambda: Product.objects(updated_at__gt=_NOW),
+    'get_cart': lambda: Cart.objects(user=_ID),
+    'login': lambda: User.objects(email='user@example.com'),
+    'verify_email': lambda: User.objects(verification_token='token'),
+    'reset_password': lambda: User.objects(reset_token='token', reset_token_expires__gt=_NOW),
+    'get_sales': lambda: SalesRollup.objects(
+        granularity='day', bucket__gte=_NOW, bucket__lt=_NOW + timedelta(days=30)).order_by('bucket'),
+    'sync_revocations': lambda: RevokedToken.objects(revoked_at__gt=_NOW),
+    'get_related_products': lambda: RelatedProducts.objects(product=_ID),
+    'refresh_related_products': lambda: ProductPair.objects(product=_ID).order_by('-count').limit(20)
+}
+
+# Shard keys for ``flask db shard``; each is also declared as a hashed index
+SHARD_KEYS = {
+    Product: {'_id': 'hashed'},
+    Cart: {'user': 'hashed'},
+    Order: {'user': 'hashed'},
+    ArchivedOrder: {'user': 'hashed'}
+}
+
+# Query shapes that carry their collection's shard key, so a sharded
+# cluster sends them to one shard; listings cannot and ask every shard
+TARGETED_SHAPES = (
+    'get_product', 'get_cart', 'get_orders', 'get_orders?status', 'get_order',
+    'get_orders?archived', 'get_order?archived'
+)
+
+def _key(fields):
+    # The server may report directions as floats; hashed/text keys are strings
+    return tuple(
+        (name, int(direction) if isinstance(direction, float) else direction)
+        for name, direction in fields
+    )
+
+def ensure_indexes(prune=False):
+    """Create every declared index, optionally dropping undeclared ones.
+
+    Returns ``{collection: [undeclared index names]}``; with ``prune``
+    those indexes have been dropped.
+    """
+    undeclared = {}
+    for model in MODELS:
+        model.ensure_indexes()
+        collection = model._get_collection()
+        declared = {_key(spec) for spec in model.list_indexes()}
+        extra = [
+            name for name, info in collection.index_information().items()
+            if _key(info['key']) not in declared
+        ]
+        if prune:
+            for name in extra:
+                collection.drop_index(name)
+        undeclared[collection.name] = extra
+    return undeclared
+
+def _stages(plan):
+    """Yield every stage name in a winning plan tree."""
+    plan = plan.get('queryPlan', plan)
+    yield plan.get('stage')
+    # Through mongos, each shard's own plan sits under ``shards``
+    children = [shard['winningPlan'] for shard in plan.get('shards', [])]
+    children = children + plan.get('inputStages', [])
+    if 'inputStage' in plan:
+        children = children + [plan['inputStage']]
+    for child in children:
+        yield from _stages(child)
+
+def check_query_plans():
+    """Explain every hot route query and report the ones that need fixing.
+
+    Returns ``{route: [problem stages]}`` for each query whose winning plan
+    contains a collection scan or an in-memory sort.
+    """
+    problems = {}
+    for route, build_query in QUERY_SHAPES.items():
+        plan = build_query().explain()['queryPlanner']['winningPlan']
+        bad = [stage for stage in _stages(plan) if stage in ('COLLSCAN', 'SORT')]
+        if bad:
+            problems[route] = bad
+    return problems
+
+def shard_collections():
+    """Shard each collection in ``SHARD_KEYS``; run through mongos.
+
+    Collections already sharded are left alone. Run ensure-indexes first:
+    sharding a non-empty collection needs its shard key index. Returns the
+    namespaces sharded by this call.
+    """
+    sharded = []
+    for model, key in SHARD_KEYS.items():
+        collection = model._get_collection()
+        admin = collection.database.client.admin
+        admin.command('enableSharding', collection.database.name)
+        if collection.database.client.config.collections.find_one(
+                {'_id': collection.full_name, 'dropped': {'$ne': True}}):
+            continue
+        admin.command('shardCollection', collection.full_name, key=key)
+        sharded.append(collection.full_name)
+    return sharded
+
+def check_targeting():
+    """Explain the targeted query shapes through mongos; report broadcasts.
+
+    Returns ``{route: [shard names]}`` for each shape that mongos sends to
+    more than one shard.
+    """
+    broadcasts = {}
+    for route in TARGETED_SHAPES:
+        plan = QUERY_SHAPES[route]().explain()['queryPlanner']['winningPlan']
+        shards = [shard['shardName'] for shard in plan.get('shards', [])]
+        if len(shards) > 1:
+            broadcasts[route] = shards
+    return broadcasts
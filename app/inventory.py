@@ -0,0 +1,232 @@
+"""Bulk stock and price updates pushed by sellers.
+
+Rows arrive as NDJSON or CSV, each naming one of the seller's products by
+``id`` or ``sku`` and giving a new ``stock``, a ``stock_delta`` and/or a
+new ``price``. They are applied a batch at a time: the batch's products
+are read with one query per kind of identifier, rows that cannot apply
+are answered from what was read, and the rest are written with a single
+unordered ``bulk_write``.
+
+Every write is conditional on the product's ``version`` still being the
+one read and increments it, so a product changed in between is reported
+as a conflict instead of being overwritten. Checkouts and cancellations
+bump ``version`` too, so sellers who pass the ``version`` they last saw
+have their edits checked against sales made since as well as other edits.
+A negative ``stock_delta`` only applies while enough stock is left.
+"""
+import csv
+import json
+import math
+import time
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from app import catalog, live, snapshots
+from app.models import Product
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Read back after each batch: the outcome of each write, and what the hooks need
+_READ_BACK = {'version': 1, 'stock': 1, 'price': 1, 'updated_at': 1, 'name': 1, 'category': 1, 'created_at': 1}
+
+def _decoded(lines):
+    for line in lines:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+def ndjson_rows(lines):
+    """Rows of an NDJSON body; a line that is not JSON gives ``None``."""
+    for line in _decoded(lines):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+def csv_rows(lines):
+    """Rows of a CSV body with a header row; empty cells are left out."""
+    for row in csv.DictReader(_decoded(lines)):
+        yield {key.strip(): value for key, value in row.items() if key and value not in (None, '')}
+
+def _number(raw, name, kind):
+    value = raw.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        if isinstance(value, bool):
+            raise TypeError(name)
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(number) or (kind is int and not number.is_integer()):
+        raise ValueError(f'{name} must be {"an integer" if kind is int else "a number"}')
+    return kind(number)
+
+def parse_row(raw):
+    """The checked fields of one row; raises ValueError saying what is wrong."""
+    if not isinstance(raw, dict):
+        raise ValueError('Row is not a JSON object')
+    row = {}
+    if raw.get('id') not in (None, ''):
+        if not ObjectId.is_valid(str(raw['id'])):
+            raise ValueError('Invalid product id')
+        row['id'] = ObjectId(str(raw['id']))
+    elif raw.get('sku') not in (None, ''):
+        row['sku'] = str(raw['sku'])
+    else:
+        raise ValueError('An id or a sku is required')
+
+    for name, kind in (('stock', int), ('stock_delta', int), ('price', float), ('version', int)):
+        value = _number(raw, name, kind)
+        if value is not None:
+            row[name] = value
+    if 'stock' in row and 'stock_delta' in row:
+        raise ValueError('Give stock or stock_delta, not both')
+    if not {'stock', 'stock_delta', 'price'} & row.keys():
+        raise ValueError('Nothing to update: give stock, stock_delta or price')
+    if row.get('stock', 0) < 0 or row.get('price', 0) < 0:
+        raise ValueError('Stock and price cannot be negative')
+    return row
+
+def _find(seller_id, rows):
+    """``{row number: [matching product documents]}`` for one batch."""
+    collection = Product._get_collection()
+    fields = {'version': 1, 'stock': 1, 'sku': 1}
+    ids = [row['id'] for _, row in rows if 'id' in row]
+    skus = [row['sku'] for _, row in rows if 'sku' in row]
+    by_id, by_sku = {}, {}
+    if ids:
+        # Carries the shard key, so each product is read from its own shard
+        for doc in collection.find({'_id': {'$in': ids}, 'seller': seller_id}, fields):
+            by_id[doc['_id']] = doc
+    if skus:
+        for doc in collection.find({'seller': seller_id, 'sku': {'$in': skus}}, fields):
+            by_sku.setdefault(doc['sku'], []).append(doc)
+    return {
+        number: [by_id[row['id']]] if row.get('id') in by_id else by_sku.get(row.get('sku'), [])
+        for number, row in rows
+    }
+
+def _failure(number, row, doc):
+    """The result of a row that did not or would not apply to ``doc``."""
+    if doc is None:
+        return {'row': number, 'status': 'not_found'}
+    result = {'row': number, 'id': str(doc['_id']), 'version': doc.get('version') or 0}
+    if row.get('stock_delta', 0) < 0 and doc['stock'] + row['stock_delta'] < 0:
+        return dict(result, status='insufficient_stock', stock=doc['stock'])
+    return dict(result, status='conflict')
+
+def apply_batch(seller_id, rows):
+    """Apply one batch of ``(row number, parsed row)``.
+
+    Returns ``(results, deferred)``: rows naming a product already written
+    in this batch are deferred to the next, since the first write bumps the
+    version the second would be checked against.
+    """
+    matches = _find(seller_id, rows)
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # As stored
+    results, deferred, writes, targets = [], [], [], {}
+
+    for number, row in rows:
+        found = matches[number]
+        if len(found) > 1:
+            results.append({'row': number, 'status': 'invalid', 'error': 'SKU matches several products'})
+            continue
+        doc = found[0] if found else None
+        if doc is not None and doc['_id'] in targets:
+            deferred.append((number, row))
+            continue
+        version = (doc.get('version') or 0) if doc else None
+        if doc is None or row.get('version', version) != version or (
+                row.get('stock_delta', 0) < 0 and doc['stock'] + row['stock_delta'] < 0):
+            results.append(_failure(number, row, doc))
+            continue
+
+        update = {'$set': {'updated_at': now}, '$inc': {'version': 1}}
+        query = {'_id': doc['_id'], 'seller': seller_id, 'version': doc.get('version')}
+        if 'stock' in row:
+            update['$set']['stock'] = row['stock']
+        if 'stock_delta' in row:
+            update['$inc']['stock'] = row['stock_delta']
+            if row['stock_delta'] < 0:
+                query['stock'] = {'$gte': -row['stock_delta']}
+        if 'price' in row:
+            update['$set']['price'] = row['price']
+        writes.append(UpdateOne(query, update))
+        targets[doc['_id']] = (number, row, version)
+
+    if not writes:
+        return results, deferred
+    collection = Product._get_collection()
+    collection.bulk_write(writes, ordered=False)
+
+    # A write applied if it left this batch's version and timestamp behind
+    after = {doc['_id']: doc for doc in collection.find({'_id': {'$in': list(targets)}}, _READ_BACK)}
+    repriced = []
+    for product_id, (number, row, version) in targets.items():
+        doc = after.get(product_id)
+        if doc is None or (doc.get('version'), doc['updated_at']) != (version + 1, now):
+            results.append(_failure(number, row, doc))
+            continue
+        results.append({
+            'row': number, 'status': 'updated', 'id': str(product_id),
+            'version': doc['version'], 'stock': doc['stock'], 'price': doc['price']
+        })
+        live.product_changed(product_id, stock=doc['stock'], price=doc['price'])
+        if 'price' in row:
+            repriced.append(doc)
+    if repriced:
+        # Stock is not in listings or snapshots; prices are
+        catalog.products_saved(repriced)
+        snapshots.products_saved(doc['category'] for doc in repriced)
+    return results, deferred
+
+def apply(seller, raw_rows, batch_size=1000):
+    """Apply ``raw_rows`` to ``seller``'s products, a batch at a time.
+
+    Yields one result per row, in batch order rather than row order, and
+    then ``{'stats': ...}`` with the counts per status and the throughput.
+    """
+    started = time.perf_counter()
+    counts = Counter()
+    batches = 0
+    rows = 0
+    pending = []
+
+    def flush(final):
+        nonlocal pending, batches
+        while pending and (final or len(pending) >= batch_size):
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            results, deferred = apply_batch(seller.id, batch)
+            pending = deferred + pending
+            batches += 1
+            yield from results
+
+    for number, raw in enumerate(raw_rows, start=1):
+        rows = number
+        try:
+            pending.append((number, parse_row(raw)))
+        except ValueError as e:
+            counts['invalid'] += 1
+            yield {'row': number, 'status': 'invalid', 'error': str(e)}
+            continue
+        for result in flush(final=False):
+            counts[result['status']] += 1
+            yield result
+    for result in flush(final=True):
+        counts[result['status']] += 1
+        yield result
+
+    seconds = time.perf_counter() - started
+    yield {'stats': {
+        'rows': rows,
+        **{status: counts[status] for status in ('updated', 'conflict', 'insufficient_stock', 'not_found', 'invalid')},
+        'batches': batches,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None
+    }}
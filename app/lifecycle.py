@@ -0,0 +1,191 @@
+import os
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.models import ArchivedOrder, Lease, Order, Product, SETTLED_STATUSES, User
+
+ARCHIVER_LEASE = 'order_archiver'
+
+def archive_orders(older_than_days, batch_size=500):
+    """Move settled orders untouched for ``older_than_days`` to ``orders_archive``.
+
+    Each batch is copied first and then deleted only where ``updated_at``
+    still matches the copy, so an order changed mid-move stays live (and
+    its copy is dropped) and a crash between the two steps is repaired by
+    the next run. Returns the number of orders moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    orders = Order._get_collection()
+    archive = ArchivedOrder._get_collection()
+    query = {
+        'created_at': {'$lt': cutoff},  # Served by the created_at index
+        'status': {'$in': list(SETTLED_STATUSES)},
+        'updated_at': {'$lt': cutoff}
+    }
+    moved = 0
+    while True:
+        docs = list(orders.find(query).limit(batch_size))
+        if not docs:
+            return moved
+        # With the shard key, so each write goes to one shard when sharded
+        archive.bulk_write([
+            ReplaceOne({'_id': doc['_id'], 'user': doc['user']}, doc, upsert=True) for doc in docs
+        ], ordered=False)
+        orders.bulk_write([
+            DeleteOne({'_id': doc['_id'], 'user': doc['user'], 'updated_at': doc['updated_at']}) for doc in docs
+        ], ordered=False)
+
+        remaining = {doc['_id'] for doc in orders.find({'_id': {'$in': [doc['_id'] for doc in docs]}}, {'_id': 1})}
+        if remaining:
+            # Their copies are stale, and listings would show them twice
+            archive.bulk_write([
+                DeleteOne({'_id': doc['_id'], 'user': doc['user']}) for doc in docs if doc['_id'] in remaining
+            ], ordered=False)
+        per_user = Counter(doc['user'] for doc in docs if doc['_id'] not in remaining)
+        if per_user:
+            User._get_collection().bulk_write([
+                UpdateOne({'_id': user_id}, {'$inc': {'archived_orders': count}})
+                for user_id, count in per_user.items()
+            ], ordered=False)
+        moved += sum(per_user.values())
+        if len(remaining) == len(docs):
+            # Everything left changed under us; it is no longer old enough
+            return moved
+
+def backfill_order_items(batch_size=500):
+    """Copy product names, thumbnails and SKUs into orders placed before items kept them.
+
+    Orders without ``item_count`` are updated in ``_id`` order, live and
+    archived, a batch per round trip. Items of deleted products keep a null
+    name. Returns the number of orders updated.
+    """
+    updated = 0
+    for collection in (Order._get_collection(), ArchivedOrder._get_collection()):
+        query = {'item_count': {'$exists': False}}
+        while True:
+            docs = list(collection.find(query, {'user': 1, 'items': 1}).sort('_id', 1).limit(batch_size))
+            if not docs:
+                break
+            products = {
+                doc['_id']: doc for doc in Product._get_collection().find(
+                    {'_id': {'$in': list({item['product'] for doc in docs for item in doc.get('items', [])})}},
+                    {'name': 1, 'images': {'$slice': 1}, 'sku': 1}
+                )
+            }
+            writes = []
+            for doc in docs:
+                fields = {'item_count': sum(item['quantity'] for item in doc.get('items', []))}
+                for i, item in enumerate(doc.get('items', [])):
+                    product = products.get(item['product'], {})
+                    fields[f'items.{i}.name'] = product.get('name')
+                    fields[f'items.{i}.thumbnail'] = next(iter(product.get('images') or []), None)
+                    fields[f'items.{i}.sku'] = product.get('sku')
+                # With the shard key, so each write goes to one shard when sharded
+                writes.append(UpdateOne({'_id': doc['_id'], 'user': doc['user']}, {'$set': fields}))
+            collection.bulk_write(writes, ordered=False)
+            updated += len(docs)
+            query['_id'] = {'$gt': docs[-1]['_id']}
+    return updated
+
+def archived_count(user, status=None):
+    """How many of the user's orders (with ``status``, if given) are archived."""
+    if status is None:
+        return user.archived_orders or 0
+    if status not in SETTLED_STATUSES:
+        return 0
+    return ArchivedOrder.objects(user=user, status=status).count()
+
+def find_order(**query):
+    """The matching live order, else the archived one, else None."""
+    return Order.objects(**query).first() or ArchivedOrder.objects(**query).first()
+
+def list_orders(user, status, page, per_page, fields=None):
+    """One page of the user's orders, newest first, with the total.
+
+    Archived orders are older than live ones, so they follow them: the
+    archive is only read once a page runs past the last live order. With
+    ``fields``, only those are loaded.
+    """
+    query = {'user': user}
+    if status:
+        query['status'] = status
+    start = (page - 1) * per_page
+    live_total = Order.objects(**query).count()
+    total = live_total + archived_count(user, status)
+
+    def page_of(model, skip, limit):
+        queryset = model.objects(**query).order_by('-created_at').skip(skip).limit(limit)
+        return list(queryset.only(*fields) if fields else queryset)
+
+    orders = []
+    if start < live_total:
+        orders = page_of(Order, start, per_page)
+    if len(orders) < per_page and total > live_total:
+        orders += page_of(ArchivedOrder, max(0, start - live_total), per_page - len(orders))
+    return orders, total
+
+def acquire_lease(key, seconds):
+    """Take or renew the named lease; False while another process holds it."""
+    now = datetime.utcnow()
+    holder = f'{socket.gethostname()}:{os.getpid()}'
+    try:
+        Lease._get_collection().find_one_and_update(
+            {'_id': key, '$or': [{'expires_at': {'$lt': now}}, {'holder': holder}]},
+            {'$set': {'holder': holder, 'expires_at': now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held elsewhere, so the upsert collided
+        return False
+    return True
+
+_archiver = {'pid': None, 'thread': None}
+_archiver_lock = threading.Lock()
+
+def _run_archiver(app):
+    interval = app.config['ORDER_ARCHIVE_INTERVAL']
+    # Spread the first run so restarted workers do not all try at once
+    time.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        with app.app_context():
+            try:
+                if acquire_lease(ARCHIVER_LEASE, interval):
+                    moved = archive_orders(
+                        app.config['ORDER_ARCHIVE_AFTER_DAYS'], app.config['ORDER_ARCHIVE_BATCH_SIZE']
+                    )
+                    if moved:
+                        print(f"Archived {moved} orders")
+            except Exception as e:
+                print(f"Failed to archive orders: {str(e)}")
+        time.sleep(interval)
+
+def start_archiver(app):
+    """Run the archiver in a daemon thread of this process, once per process.
+
+    Every worker starts one, and the lease lets one of them work each
+    interval across all processes and hosts.
+    """
+    if _archiver['pid'] == os.getpid():
+        return
+    with _archiver_lock:
+        if _archiver['pid'] == os.getpid():
+            return
+        _archiver['thread'] = threading.Thread(target=_run_archiver, args=(app,), daemon=True)
+        _archiver['thread'].start()
+        _archiver['pid'] = os.getpid()
+
+def init_app(app):
+    """Start the order archiver with the first request of each worker."""
+    if not app.config['ORDER_ARCHIVE_INTERVAL']:
+        return
+
+    # Threads do not survive gunicorn's fork, so start after it
+    def _ensure_archiver():
+        start_archiver(app)
+
+    app.before_request(_ensure_archiver)
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import OperationFailure, PyMongoError
+from app import metrics
+from app.models import Product
+
+# Fields pushed to viewers; any other product change is not streamed
+FIELDS = ('stock', 'price')
+
+# Server error for change streams on a standalone server
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+_PIPELINE = [
+    {'$match': {'$or': [
+        {'operationType': {'$in': ['replace', 'delete']}},
+        *({f'updateDescription.updatedFields.{field}': {'$exists': True}} for field in FIELDS)
+    ]}},
+    {'$project': {
+        'operationType': 1,
+        'documentKey': 1,
+        **{f'updateDescription.updatedFields.{field}': 1 for field in FIELDS},
+        **{f'fullDocument.{field}': 1 for field in FIELDS}
+    }}
+]
+
+class Subscription:
+    """One viewer's pending changes, coalesced per product.
+
+    A new change replaces any undelivered one for the same product, so a
+    slow client holds at most one change per subscribed product and only
+    ever sees the latest stock and price, never an unbounded backlog.
+    """
+
+    def __init__(self, product_ids):
+        self.product_ids = frozenset(product_ids)
+        self.ready = threading.Event()
+        self.notify = None  # Set by async consumers to wake their event loop
+        self.closed = False
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def offer(self, change):
+        with self._lock:
+            if change['id'] in self._pending:
+                metrics.LIVE_COALESCED.inc()
+            self._pending[change['id']] = dict(self._pending.get(change['id'], {}), **change)
+            self.ready.set()
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self):
+        with self._lock:
+            changes = list(self._pending.values())
+            self._pending = {}
+            self.ready.clear()
+        return changes
+
+class Hub:
+    """Per-process fan-out from one product change feed to every viewer.
+
+    The feed is a MongoDB change stream on ``products`` started by the
+    first subscriber in the process. Where change streams are unavailable
+    (a standalone server) or disabled, the write paths publish their own
+    changes instead; viewers then only see writes made by this process.
+    """
+
+    def __init__(self):
+        self.source = None  # 'change_stream' or 'local' once started
+        self._subscriptions = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+
+    def subscribe(self, product_ids, limit):
+        """Register a viewer, or return None when ``limit`` viewers are connected."""
+        subscription = Subscription(product_ids)
+        with self._lock:
+            if self._count >= limit:
+                return None
+            self._count += 1
+            for product_id in subscription.product_ids:
+                self._subscriptions.setdefault(product_id, set()).add(subscription)
+        metrics.LIVE_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a viewer; safe to call more than once."""
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            self._count -= 1
+            for product_id in subscription.product_ids:
+                viewers = self._subscriptions.get(product_id)
+                if viewers is not None:
+                    viewers.discard(subscription)
+                    if not viewers:
+                        del self._subscriptions[product_id]
+        metrics.LIVE_SUBSCRIBERS.dec()
+
+    def publish(self, change):
+        with self._lock:
+            viewers = list(self._subscriptions.get(change['id'], ()))
+        for subscription in viewers:
+            subscription.offer(change)
+
+    def start(self, app):
+        """Start this process's watcher once; threads do not survive a fork."""
+        if self._watcher_pid == os.getpid() and (self.source == 'local' or self._watcher.is_alive()):
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid() and (self.source == 'local' or self._watcher.is_alive()):
+                return
+            self._watcher_pid = os.getpid()
+            if not app.config['LIVE_CHANGE_STREAM']:
+                self.source = 'local'
+                return
+            self.source = 'change_stream'
+            self._watcher = threading.Thread(target=self._watch, args=(app,), daemon=True)
+            self._watcher.start()
+
+    def _watch(self, app):
+        with app.app_context():
+            collection = Product._get_collection()
+        resume_token = None
+        while True:
+            try:
+                with collection.watch(_PIPELINE, resume_after=resume_token) as stream:
+                    for event in stream:
+                        resume_token = stream.resume_token
+                        change = _from_event(event)
+                        if change is not None:
+                            self.publish(change)
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    print(f"Change streams unavailable, publishing local writes only: {str(e)}")
+                    self.source = 'local'
+                    return
+                print(f"Product change stream failed: {str(e)}")
+                resume_token = None
+                time.sleep(1)
+            except PyMongoError as e:
+                print(f"Product change stream failed: {str(e)}")
+                time.sleep(1)
+
+def _from_event(event):
+    product_id = str(event['documentKey']['_id'])
+    if event['operationType'] == 'delete':
+        return {'id': product_id, 'deleted': True}
+    fields = event.get('updateDescription', {}).get('updatedFields') or event.get('fullDocument') or {}
+    change = {field: fields[field] for field in FIELDS if field in fields}
+    return dict(change, id=product_id) if change else None
+
+hub = Hub()
+
+def product_changed(product_id, **fields):
+    """Publish a write to this process's viewers when no change stream does it.
+
+    ``fields`` are the new values of ``FIELDS``; ``deleted=True`` marks a
+    deleted product. A no-op while the change stream is running.
+    """
+    if hub.source == 'change_stream':
+        return
+    change = {key: value for key, value in fields.items() if key in FIELDS or key == 'deleted'}
+    if change:
+        hub.publish(dict(change, id=str(product_id)))
+
+def parse_ids(value, limit):
+    """Parse the comma-separated ``ids`` argument into unique ObjectIds."""
+    ids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            product_id = ObjectId(part)
+        except InvalidId:
+            raise ValueError(f'Invalid product id {part}')
+        if product_id not in ids:
+            ids.append(product_id)
+    if not ids:
+        raise ValueError('ids is required')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} products per stream')
+    return ids
+
+def event(name, data):
+    """One Server-Sent Events message."""
+    return f'event: {name}\ndata: {json.dumps(data, default=str)}\n\n'
+
+def snapshot_events(docs):
+    """The opening ``product`` events: current values for every subscribed product."""
+    return ''.join(
+        event('product', dict({field: doc.get(field) for field in FIELDS}, id=str(doc['_id'])))
+        for doc in docs
+    )
+
+def change_event(change):
+    if change.get('deleted'):
+        return event('deleted', {'id': change['id']})
+    return event('product', change)
+
+def stream(subscription, config, opening):
+    """Yield the stream's text: ``opening``, then changes and heartbeats.
+
+    Ends after ``LIVE_IDLE_TIMEOUT`` seconds without a change or
+    ``LIVE_MAX_DURATION`` overall; the client's EventSource reconnects.
+    The caller unsubscribes when the response closes, which also covers
+    clients that disconnect before the first chunk.
+    """
+    started = last_change = time.monotonic()
+    yield open_stream(config) + opening
+    while True:
+        now = time.monotonic()
+        if now - started >= config['LIVE_MAX_DURATION'] or now - last_change >= config['LIVE_IDLE_TIMEOUT']:
+            return
+        if not subscription.ready.wait(config['LIVE_HEARTBEAT']):
+            yield HEARTBEAT
+            continue
+        changes = subscription.drain()
+        if changes:
+            metrics.LIVE_EVENTS.inc(len(changes))
+            last_change = time.monotonic()
+            yield ''.join(change_event(change) for change in changes)
+
+def open_stream(config):
+    """The first line every stream sends: how long clients wait to reconnect."""
+    return f"retry: {int(config['LIVE_RETRY'] * 1000)}\n\n"
+
+HEARTBEAT = ': keep-alive\n\n'
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+}
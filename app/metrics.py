@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from flask import Response, abort, current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency per endpoint.',
+    ['endpoint', 'method'], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requests per endpoint and status code.',
+    ['endpoint', 'method', 'status']
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command latency.',
+    ['collection', 'command', 'endpoint'], buckets=COMMAND_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    'mongodb_command_failures_total', 'Failed MongoDB commands.',
+    ['collection', 'command', 'endpoint']
+)
+MONGO_DOCUMENTS = Counter(
+    'mongodb_documents_returned_total', 'Documents returned by MongoDB reads.',
+    ['collection', 'command', 'endpoint']
+)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total', 'Admission decisions per endpoint, priority and outcome.',
+    ['endpoint', 'priority', 'decision']
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight_requests', 'Admitted requests currently being served.',
+    ['priority'], multiprocess_mode='livesum'
+)
+ADMISSION_LOAD = Gauge(
+    'admission_load_ratio', 'Queue delay or latency as a multiple of the target, at the last decision.',
+    multiprocess_mode='livemax'
+)
+LIVE_SUBSCRIBERS = Gauge(
+    'live_subscribers', 'Open live product update streams.', multiprocess_mode='livesum'
+)
+LIVE_EVENTS = Counter('live_events_total', 'Live product update events sent to clients.')
+LIVE_COALESCED = Counter(
+    'live_coalesced_total', 'Live updates replaced by a newer one before a slow client read them.'
+)
+
+# Commands whose first argument is not the collection name
+_COLLECTION_KEYS = {'getMore': 'collection'}
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+def _documents(reply):
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+    if 'value' in reply:  # findAndModify
+        return 1 if reply['value'] is not None else 0
+    return 0
+
+class CommandMetrics(monitoring.CommandListener):
+    """Record per-collection command counts, latency and documents returned.
+
+    Events fire on the thread that runs the command, so the Flask request
+    (and its endpoint) active when the command started is the one charged.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        key = _COLLECTION_KEYS.get(event.command_name, event.command_name)
+        collection = event.command.get(key)
+        labels = (
+            collection if isinstance(collection, str) else event.database_name,
+            event.command_name,
+            _endpoint()
+        )
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = labels
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.request_id, event.connection_id), None)
+
+    def succeeded(self, event):
+        labels = self._finish(event)
+        if labels is None:
+            return
+        MONGO_COMMAND_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+        documents = _documents(event.reply)
+        if documents:
+            MONGO_DOCUMENTS.labels(*labels).inc(documents)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        if labels is None:
+            return
+        MONGO_COMMAND_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+command_metrics = CommandMetrics()
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    return response
+
+def metrics_view():
+    """Serve all metrics in the Prometheus text format.
+
+    With ``PROMETHEUS_MULTIPROC_DIR`` set (as under gunicorn), every
+    worker writes its samples to memory-mapped files in that directory and
+    this view merges them, so whichever worker is scraped reports totals
+    for all of them.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+    """Install the request hooks, the MongoDB listener and ``/metrics``."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.extensions.setdefault('mongodb_listeners', []).append(command_metrics)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
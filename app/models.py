@@ -3,9 +3,15 @@ from mongoengine import (
     Document, StringField, EmailField, FloatField, 
     IntField, ListField, ReferenceField, DateTimeField,
     BooleanField, EmbeddedDocument, EmbeddedDocumentField,
-    DictField
+    DictField, ObjectIdField
 )
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.routing import RoutedQuerySet
+
+def reference_id(document, name):
+    """The id held by a ReferenceField, without loading the referenced document."""
+    value = document._data.get(name)
+    return getattr(value, 'id', value)
 
 class User(Document):
     """User model for authentication and user management."""
@@ -21,8 +27,17 @@ class User(Document):
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
     role = StringField(default='buyer', choices=['buyer', 'seller', 'admin'])
+    archived_orders = IntField(default=0)  # Orders moved to orders_archive
     
-    meta = {'collection': 'users'}
+    meta = {
+        'collection': 'users',
+        'auto_create_index': False,  # Created at deploy time by `flask db ensure-indexes`
+        'indexes': [
+            # Tokens are unset once used, so sparse indexes stay small
+            {'fields': ['verification_token'], 'sparse': True},
+            {'fields': ['reset_token'], 'sparse': True}
+        ]
+    }
 
     def set_password(self, password):
         """Hash and set the user's password."""
@@ -49,18 +64,59 @@ class Category(Document):
     """Product category model."""
     name = StringField(required=True, unique=True)
     description = StringField()
+    parent = ReferenceField('self')
+    ancestors = ListField(ObjectIdField())  # Root first, ending with the parent
+    product_count = IntField(default=0)  # Products directly in this category
     created_at = DateTimeField(default=datetime.utcnow)
     
-    meta = {'collection': 'categories'}
+    meta = {
+        'collection': 'categories',
+        'auto_create_index': False,
+        'queryset_class': RoutedQuerySet
+    }
 
     def to_dict(self):
         return {
             'id': str(self.id),
             'name': self.name,
             'description': self.description,
+            'parent': str(self.parent.id) if self.parent else None,
+            'ancestors': [str(ancestor) for ancestor in self.ancestors],
+            'product_count': self.product_count,
             'created_at': self.created_at.isoformat()
         }
 
+class CacheVersion(Document):
+    """Counter bumped whenever data behind a per-process cache changes."""
+    key = StringField(primary_key=True)
+    version = IntField(default=0)
+
+    meta = {
+        'collection': 'cache_versions',
+        'auto_create_index': False
+    }
+
+class RevokedToken(Document):
+    """A revoked token, or every token a user was issued before a point in time.
+
+    ``key`` is ``jti:<jti>`` for one token and ``user:<id>`` for a user,
+    whose tokens with an ``iat`` below ``not_before`` are revoked. Entries
+    are deleted by the TTL index once no token they cover can be valid.
+    """
+    key = StringField(primary_key=True)
+    not_before = IntField()
+    revoked_at = DateTimeField(default=datetime.utcnow)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'revoked_tokens',
+        'auto_create_index': False,
+        'indexes': [
+            'revoked_at',
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0}
+        ]
+    }
+
 class Review(EmbeddedDocument):
     """Product review embedded document."""
     user = ReferenceField(User, required=True)
@@ -88,13 +144,24 @@ class Product(Document):
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
     seller = ReferenceField(User, required=True)
+    sku = StringField()  # The seller's stock keeping unit
+    version = IntField(default=0)  # Bumped by every edit; bulk updates check it
     
     meta = {
         'collection': 'products',
+        'auto_create_index': False,
+        'queryset_class': RoutedQuerySet,
+        # Equality, then sort, then range fields, matching get_products
         'indexes': [
             'name',
-            'category',
-            ('name', 'category')  # Compound index
+            'price',
+            ('-created_at', 'price'),
+            ('category', 'price'),
+            ('category', '-created_at', 'price'),
+            ('category', 'name'),
+            'updated_at',  # Catalog engine sync
+            ('seller', 'sku'),  # Seller bulk updates
+            '#id'  # Shard key
         ]
     }
 
@@ -105,7 +172,9 @@ class Product(Document):
             'description': self.description,
             'price': self.price,
             'category': str(self.category.id),
+            'sku': self.sku,
             'stock': self.stock,
+            'version': self.version,
             'images': self.images,
             'reviews': [review.to_dict() for review in self.reviews],
             'created_at': self.created_at.isoformat(),
@@ -125,39 +194,90 @@ class CartItem(EmbeddedDocument):
             'added_at': self.added_at.isoformat()
         }
 
+# Carts untouched for this long are removed by MongoDB's TTL monitor
+CART_TTL_DAYS = 30
+
 class Cart(Document):
-    """Shopping cart model."""
-    user = ReferenceField(User, required=True, unique=True)
+    """Shopping cart model.
+
+    Only carts with items are stored: a user without one is shown an
+    unsaved empty cart, and ``persist`` deletes a cart once it is emptied.
+    A new cart takes its user's id as its own, which keeps it one per user
+    without a unique index on ``user``; a collection sharded on hashed
+    ``user`` cannot have one.
+    """
+    user = ReferenceField(User, required=True)
     items = ListField(EmbeddedDocumentField(CartItem))
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
     
-    meta = {'collection': 'carts'}
+    meta = {
+        'collection': 'carts',
+        'auto_create_index': False,
+        # Saves and deletes include the shard key, so they go to one shard
+        'shard_key': ('user',),
+        'indexes': [
+            '#user',  # Lookups and shard key
+            {'fields': ['updated_at'], 'expireAfterSeconds': CART_TTL_DAYS * 24 * 3600}
+        ]
+    }
+
+    def persist(self):
+        """Save the cart, or delete it when it has no items left."""
+        if self.items:
+            if self.id is None:
+                self.id = self.user.id
+            self.save()
+        elif self.id is not None:
+            self.delete()
+            self.id = None
 
     def to_dict(self):
         return {
-            'id': str(self.id),
-            'user': str(self.user.id),
+            'id': str(self.id) if self.id else None,
+            'user': str(self.user.id) if self.user else None,  # None for a guest cart
             'items': [item.to_dict() for item in self.items],
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 class OrderItem(EmbeddedDocument):
-    """Order item embedded document."""
+    """Order item embedded document.
+
+    Name, thumbnail and SKU are copied from the product at checkout, so
+    orders render without reading products, even deleted ones.
+    """
     product = ReferenceField(Product, required=True)
     quantity = IntField(required=True, min_value=1)
     price_at_time = FloatField(required=True)  # Price when order was placed
+    name = StringField()
+    thumbnail = StringField()  # The product's first image
+    sku = StringField()
+
+    @classmethod
+    def snapshot(cls, product, quantity):
+        """An item for ``quantity`` of ``product`` at its current price."""
+        return cls(
+            product=product.id,
+            quantity=quantity,
+            price_at_time=product.price,
+            name=product.name,
+            thumbnail=product.images[0] if product.images else None,
+            sku=product.sku
+        )
 
     def to_dict(self):
         return {
-            'product': str(self.product.id),
+            'product': str(reference_id(self, 'product')),
             'quantity': self.quantity,
-            'price_at_time': self.price_at_time
+            'price_at_time': self.price_at_time,
+            'name': self.name,
+            'thumbnail': self.thumbnail,
+            'sku': self.sku
         }
 
-class Order(Document):
-    """Order model for tracking purchases."""
+class BaseOrder(Document):
+    """Fields shared by live orders and archived ones."""
     user = ReferenceField(User, required=True)
     items = ListField(EmbeddedDocumentField(OrderItem))
     total_amount = FloatField(required=True)
@@ -169,24 +289,32 @@ class Order(Document):
         'pending', 'completed', 'failed', 'refunded'
     ])
     payment_id = StringField()  # For payment gateway reference
+    item_count = IntField()  # Units across all items, for summaries without them
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
     
-    meta = {
-        'collection': 'orders',
-        'indexes': [
-            'user',
-            'status',
-            'payment_status',
-            'created_at'
-        ]
-    }
+    meta = {'abstract': True}
+
+    # Loaded for order lists; to_summary needs nothing else
+    SUMMARY_FIELDS = ('item_count', 'total_amount', 'status', 'payment_status', 'created_at', 'updated_at')
+
+    def to_summary(self):
+        return {
+            'id': str(self.id),
+            'item_count': self.item_count,
+            'total_amount': self.total_amount,
+            'status': self.status,
+            'payment_status': self.payment_status,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
 
     def to_dict(self):
         return {
             'id': str(self.id),
-            'user': str(self.user.id),
+            'user': str(reference_id(self, 'user')),
             'items': [item.to_dict() for item in self.items],
+            'item_count': self.item_count,
             'total_amount': self.total_amount,
             'status': self.status,
             'shipping_address': self.shipping_address,
@@ -194,4 +322,131 @@ class Order(Document):
             'payment_id': self.payment_id,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        } 
\ No newline at end of file
+        }
+
+class Order(BaseOrder):
+    """Order model for tracking purchases."""
+    meta = {
+        'collection': 'orders',
+        'auto_create_index': False,
+        'shard_key': ('user',),
+        'indexes': [
+            ('user', '-created_at'),
+            ('user', 'status', '-created_at'),
+            'created_at',
+            '#user'  # Shard key
+        ]
+    }
+
+# Statuses that no longer change, so such orders can leave the hot collection
+SETTLED_STATUSES = ('delivered', 'cancelled')
+
+class ArchivedOrder(BaseOrder):
+    """A settled order moved out of ``orders`` by the archiver."""
+    meta = {
+        'collection': 'orders_archive',
+        'auto_create_index': False,
+        'shard_key': ('user',),
+        'indexes': [
+            ('user', '-created_at'),
+            ('user', 'status', '-created_at'),
+            'created_at',
+            '#user'  # Shard key
+        ]
+    }
+
+class Lease(Document):
+    """A named lock with an expiry, so only one process runs a periodic job."""
+    key = StringField(primary_key=True)
+    holder = StringField()
+    expires_at = DateTimeField()
+
+    meta = {'collection': 'leases', 'auto_create_index': False}
+
+class SalesRollup(Document):
+    """Pre-aggregated sales figures for one hour or one day of orders.
+
+    Orders are attributed to the bucket of their ``created_at`` so that
+    status and payment changes adjust the same bucket they were counted in.
+    """
+    granularity = StringField(required=True, choices=['hour', 'day'])
+    bucket = DateTimeField(required=True)  # Start of the hour/day (UTC)
+    order_count = IntField(default=0)
+    revenue = FloatField(default=0)  # Total of non-cancelled orders
+    paid_revenue = FloatField(default=0)  # Total of orders with completed payment
+    units_by_product = DictField()
+    units_by_category = DictField()
+    status_counts = DictField()
+    payment_status_counts = DictField()
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'sales_rollups',
+        'auto_create_index': False,
+        'queryset_class': RoutedQuerySet,
+        'indexes': [
+            {'fields': ['granularity', 'bucket'], 'unique': True}
+        ]
+    }
+
+    def to_dict(self):
+        return {
+            'granularity': self.granularity,
+            'bucket': self.bucket.isoformat(),
+            'order_count': self.order_count,
+            'revenue': round(self.revenue, 2),
+            'paid_revenue': round(self.paid_revenue, 2),
+            'units_by_product': self.units_by_product,
+            'units_by_category': self.units_by_category,
+            'status_counts': self.status_counts,
+            'payment_status_counts': self.payment_status_counts
+        }
+
+class ProductPair(Document):
+    """How many orders contained both ``product`` and ``other``.
+
+    Stored in both directions so the neighbours of a product are a single
+    indexed range scan.
+    """
+    product = ObjectIdField(required=True)
+    other = ObjectIdField(required=True)
+    count = IntField(default=0)
+
+    meta = {
+        'collection': 'product_pairs',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['product', 'other'], 'unique': True},
+            ('product', '-count')
+        ]
+    }
+
+class RelatedProduct(EmbeddedDocument):
+    """A product frequently bought together with another one."""
+    product = ObjectIdField(required=True)
+    score = IntField(required=True)  # Number of orders containing both
+
+    def to_dict(self):
+        return {
+            'product': str(self.product),
+            'score': self.score
+        }
+
+class RelatedProducts(Document):
+    """Precomputed top-k "frequently bought together" list for a product."""
+    product = ObjectIdField(required=True, unique=True)
+    related = ListField(EmbeddedDocumentField(RelatedProduct))
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'related_products',
+        'auto_create_index': False,
+        'queryset_class': RoutedQuerySet
+    }
+
+    def to_dict(self):
+        return {
+            'product': str(self.product),
+            'related': [item.to_dict() for item in self.related],
+            'updated_at': self.updated_at.isoformat()
+        }
@@ -0,0 +1,269 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from mongoengine import get_connection
+from pymongo import monitoring
+
+# Commands that can be re-run under the explain command
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'findAndModify', 'update', 'delete'}
+
+# Driver-added fields that explain rejects or that describe the original session
+_SESSION_FIELDS = {'$db', 'lsid', '$clusterTime', 'txnNumber', '$readPreference', 'readConcern', '$query'}
+
+# Parts of a command that carry field values (filters, updates, $match
+# stages), which may be tokens or password hashes; only their shape is kept
+_DATA_KEYS = {'filter', 'query', 'q', 'u', 'update', '$match'}
+
+# Placeholder per value type; the planner only needs the type
+_PLACEHOLDERS = (
+    (str, '?'), (bytes, b''), (ObjectId, ObjectId('0' * 24)),
+    (datetime, datetime(1970, 1, 1)), (re.Pattern, re.compile(''))
+)
+
+def command_shape(value, data=False):
+    """``value`` with the field values in its data parts replaced by typed placeholders."""
+    if isinstance(value, dict):
+        return {
+            key: command_shape(item, data or (key in _DATA_KEYS and isinstance(item, (dict, list))))
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [command_shape(item, data) for item in value]
+    if data:
+        for kind, placeholder in _PLACEHOLDERS:
+            if isinstance(value, kind):
+                return placeholder
+    return value
+
+ENTRY_ID = re.compile(r'^\d{13}-[0-9a-f]{8}$')
+
+class RingBuffer:
+    """Directory of profile and slow-query entries that keeps the newest N.
+
+    Each entry is a ``<id>.json`` metadata file plus, for profiles, a
+    ``<id>.prof`` file in the format read by ``pstats``. Ids start with a
+    millisecond timestamp, so name order is age order and workers sharing
+    the directory never collide.
+    """
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def new_id():
+        return f'{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}'
+
+    def path(self, entry_id, extension):
+        if not ENTRY_ID.match(entry_id):
+            raise ValueError('Invalid entry id')
+        return os.path.join(self.directory, f'{entry_id}.{extension}')
+
+    def write(self, entry_id, metadata, profile=None):
+        if profile is not None:
+            profile.dump_stats(self.path(entry_id, 'prof'))
+        # Write the metadata last so a listed entry is always complete
+        temporary = self.path(entry_id, 'json') + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(dict(metadata, id=entry_id), f, default=str)
+        os.replace(temporary, self.path(entry_id, 'json'))
+        self.prune()
+
+    def prune(self):
+        with self._lock:
+            entries = self.ids()
+            for entry_id in entries[:max(0, len(entries) - self.max_entries)]:
+                for extension in ('json', 'prof'):
+                    try:
+                        os.remove(self.path(entry_id, extension))
+                    except FileNotFoundError:
+                        pass
+
+    def ids(self):
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def read(self, entry_id):
+        try:
+            with open(self.path(entry_id, 'json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self, kind=None, limit=100):
+        entries = []
+        for entry_id in reversed(self.ids()):
+            entry = self.read(entry_id)
+            if entry is None or (kind and entry['kind'] != kind):
+                continue
+            entry.pop('explain', None)
+            entry.pop('top', None)
+            entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
+
+def _top_functions(profile, limit=25):
+    """The most expensive functions by cumulative time, as text."""
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue().splitlines()
+
+class SlowQueries(monitoring.CommandListener):
+    """Record MongoDB commands slower than a threshold with their plans.
+
+    The listener runs on the thread that issued the command, so it only
+    queues the command; a background thread runs ``explain`` and writes
+    the entry to keep the request from paying for it.
+    """
+
+    def __init__(self):
+        self.buffer = None
+        self.threshold = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+        self._worker_pid = None
+
+    def configure(self, buffer, threshold_ms):
+        self.buffer = buffer
+        self.threshold = threshold_ms / 1000
+
+    def started(self, event):
+        if self.buffer is None or event.command_name not in EXPLAINABLE:
+            return
+        context = {'endpoint': None, 'method': None, 'path': None, 'profile_id': None}
+        if has_request_context():
+            context.update(
+                endpoint=request.endpoint, method=request.method,
+                path=request.full_path.rstrip('?'), profile_id=g.get('profile_id')
+            )
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (event.command, context)
+
+    def succeeded(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None or event.duration_micros / 1e6 < self.threshold:
+            return
+        command, context = pending
+        entry = dict(
+            context,
+            kind='slow_query',
+            created_at=datetime.utcnow().isoformat(),
+            database=event.database_name,
+            command_name=event.command_name,
+            duration_ms=round(event.duration_micros / 1000, 3),
+            # Explained and stored as a shape, so no value reaches disk
+            command=command_shape({key: value for key, value in command.items() if key not in _SESSION_FIELDS})
+        )
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            pass  # Drop entries rather than block a request
+
+    def failed(self, event):
+        with self._lock:
+            self._pending.pop((event.request_id, event.connection_id), None)
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._worker_pid != os.getpid() or not self._worker.is_alive():
+            with self._lock:
+                if self._worker_pid != os.getpid() or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, daemon=True)
+                    self._worker.start()
+                    self._worker_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                entry['explain'] = get_connection()[entry['database']].command(
+                    {'explain': entry['command'], 'verbosity': 'queryPlanner'}
+                )
+            except Exception as e:
+                entry['explain_error'] = str(e)
+            try:
+                self.buffer.write(self.buffer.new_id(), entry)
+            except OSError as e:
+                print(f"Failed to record slow query: {str(e)}")
+
+slow_queries = SlowQueries()
+
+def _wants_profile():
+    """Sample this request, or profile it when an admin asks by header."""
+    config = current_app.config
+    if config['PROFILING_SAMPLE_RATE'] and random.random() < config['PROFILING_SAMPLE_RATE']:
+        return True
+    if config['PROFILING_HEADER'] not in request.headers:
+        return False
+    from app.models import User
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return False
+    user = User.objects(id=identity).first() if identity else None
+    return bool(user and user.is_admin)
+
+def _start_profile():
+    if not _wants_profile():
+        return
+    g.profile_id = RingBuffer.new_id()
+    g.profile_started = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+def _finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    duration = time.perf_counter() - g.pop('profile_started')
+    entry = {
+        'kind': 'profile',
+        'created_at': datetime.utcnow().isoformat(),
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'top': _top_functions(profiler)
+    }
+    try:
+        current_app.extensions['profiling'].write(g.profile_id, entry, profile=profiler)
+        response.headers['X-Profile-Id'] = g.profile_id
+    except OSError as e:
+        print(f"Failed to record profile: {str(e)}")
+    return response
+
+def init_app(app):
+    """Install the profiling hooks and slow-query listener when enabled.
+
+    With ``PROFILING_ENABLED`` off nothing is registered, so requests and
+    MongoDB commands run exactly as they would without this module.
+    """
+    if not app.config['PROFILING_ENABLED']:
+        return
+    buffer = RingBuffer(app.config['PROFILING_DIR'], app.config['PROFILING_MAX_ENTRIES'])
+    app.extensions['profiling'] = buffer
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    slow_queries.configure(buffer, app.config['SLOW_QUERY_MS'])
+    app.extensions.setdefault('mongodb_listeners', []).append(slow_queries)
@@ -0,0 +1,156 @@
+from datetime import datetime
+from itertools import chain, permutations
+import numpy as np
+from pymongo import UpdateOne
+from app.models import ArchivedOrder, Order, ProductPair, RelatedProduct, RelatedProducts
+
+TOP_K = 20
+MAX_BASKET_SIZE = 50  # Larger baskets are truncated to bound the pair count
+WRITE_BATCH_SIZE = 10000
+
+def encode_baskets(baskets):
+    """Turn an iterable of product-id baskets into flat integer arrays.
+
+    Returns ``(ids, items, sizes)`` where ``ids`` maps integer codes back
+    to product ids, ``items`` holds the de-duplicated codes of every basket
+    back to back and ``sizes`` holds the length of each basket.
+    """
+    codes = {}
+    ids = []
+    items = []
+    sizes = []
+    for basket in baskets:
+        basket_codes = []
+        for product_id in basket:
+            code = codes.get(product_id)
+            if code is None:
+                code = codes[product_id] = len(ids)
+                ids.append(product_id)
+            basket_codes.append(code)
+        basket_codes = list(dict.fromkeys(basket_codes))[:MAX_BASKET_SIZE]
+        if len(basket_codes) > 1:
+            items.extend(basket_codes)
+            sizes.append(len(basket_codes))
+    return ids, np.asarray(items, dtype=np.int64), np.asarray(sizes, dtype=np.int64)
+
+def count_pairs(items, sizes, n_products):
+    """Count co-occurring product pairs across all baskets.
+
+    Baskets of equal size are stacked into a 2-D array so the pairs for
+    all of them are gathered with one fancy-indexing step per size. Pair
+    ``(a, b)`` is encoded as ``a * n_products + b`` and counted with
+    ``np.unique``, which gives the non-zero entries of the symmetric
+    co-occurrence matrix as ``(rows, cols, counts)``.
+    """
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    keys = []
+    for size in np.unique(sizes):
+        rows = items[starts[sizes == size][:, None] + np.arange(size)]
+        left, right = np.triu_indices(size, k=1)
+        a = rows[:, left].ravel()
+        b = rows[:, right].ravel()
+        keys.append(a * n_products + b)
+        keys.append(b * n_products + a)
+    if not keys:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    pair_keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+    return pair_keys // n_products, pair_keys % n_products, counts
+
+def top_k(rows, cols, counts, k=TOP_K):
+    """Keep the ``k`` highest-count neighbours of every row.
+
+    Returns the surviving ``(rows, cols, counts)`` sorted by row and then
+    by descending count.
+    """
+    order = np.lexsort((-counts, rows))
+    rows, cols, counts = rows[order], cols[order], counts[order]
+    if not len(rows):
+        return rows, cols, counts
+    group_start = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    group_sizes = np.diff(np.r_[group_start, len(rows)])
+    rank = np.arange(len(rows)) - np.repeat(group_start, group_sizes)
+    keep = rank < k
+    return rows[keep], cols[keep], counts[keep]
+
+def build_table(ids, rows, cols, counts):
+    """Group top-k arrays into ``{product_id: [(related_id, score), ...]}``."""
+    table = {}
+    for row, col, count in zip(rows.tolist(), cols.tolist(), counts.tolist()):
+        table.setdefault(ids[row], []).append((ids[col], count))
+    return table
+
+def _write_in_batches(model, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= WRITE_BATCH_SIZE:
+            model.objects.insert(batch, load_bulk=False)
+            batch = []
+    if batch:
+        model.objects.insert(batch, load_bulk=False)
+
+def build(k=TOP_K):
+    """Rebuild pair counts and related-product lists from all orders.
+
+    Returns the number of products that received a related list.
+    """
+    orders = chain.from_iterable(
+        model.objects.only('items.product').as_pymongo().batch_size(1000)
+        for model in (Order, ArchivedOrder)
+    )
+    baskets = ([item['product'] for item in doc.get('items', [])] for doc in orders)
+    ids, items, sizes = encode_baskets(baskets)
+    rows, cols, counts = count_pairs(items, sizes, len(ids))
+
+    ProductPair.objects.delete()
+    _write_in_batches(ProductPair, (
+        ProductPair(product=ids[row], other=ids[col], count=count)
+        for row, col, count in zip(rows.tolist(), cols.tolist(), counts.tolist())
+    ))
+
+    table = build_table(ids, *top_k(rows, cols, counts, k))
+    now = datetime.utcnow()
+    RelatedProducts.objects.delete()
+    _write_in_batches(RelatedProducts, (
+        RelatedProducts(
+            product=product_id,
+            related=[RelatedProduct(product=other, score=score) for other, score in related],
+            updated_at=now
+        )
+        for product_id, related in table.items()
+    ))
+    return len(table)
+
+def refresh(product_id, k=TOP_K):
+    """Recompute one product's related list from its pair counts."""
+    pairs = ProductPair.objects(product=product_id).order_by('-count').limit(k)
+    related = [RelatedProduct(product=pair.other, score=pair.count) for pair in pairs]
+    RelatedProducts.objects(product=product_id).update_one(
+        upsert=True, set__related=related, set__updated_at=datetime.utcnow()
+    )
+
+def record_order(order):
+    """Add a new order's basket to the pair counts and refresh its products."""
+    try:
+        product_ids = list(dict.fromkeys(
+            item['product'] for item in order.to_mongo().get('items', [])
+        ))[:MAX_BASKET_SIZE]
+        if len(product_ids) < 2:
+            return
+        ProductPair._get_collection().bulk_write([
+            UpdateOne({'product': a, 'other': b}, {'$inc': {'count': 1}}, upsert=True)
+            for a, b in permutations(product_ids, 2)
+        ], ordered=False)
+        for product_id in product_ids:
+            refresh(product_id)
+    except Exception as e:
+        # A full build() recovers any missed update
+        print(f"Failed to update product recommendations: {str(e)}")
+
+def get_related(product_id, limit=10):
+    """Return up to ``limit`` ``RelatedProduct`` entries for a product."""
+    entry = RelatedProducts.objects(product=product_id).first()
+    if not entry:
+        return []
+    return entry.related[:limit]
@@ -0,0 +1,177 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app.models import RevokedToken
+
+JTI_PREFIX = 'jti:'
+USER_PREFIX = 'user:'
+
+# Re-read this much before the last sync, for revocations committed late
+SYNC_OVERLAP = timedelta(seconds=5)
+
+class BloomFilter:
+    """A fixed-size set that can only answer "no" or "maybe".
+
+    Sized for ``capacity`` keys at ``error_rate`` false positives; every
+    lookup hashes the key once and tests a fixed number of bits.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class Blocklist:
+    """This process's mirror of ``revoked_tokens``.
+
+    Revoked jtis are held in a Bloom filter rebuilt from the collection
+    every ``REVOCATION_REBUILD_INTERVAL`` seconds, plus an exact set of
+    the ones synced since. Per-user cut-offs, which are few, are all kept
+    exactly. A check syncs at most every ``REVOCATION_SYNC_INTERVAL``
+    seconds with one query for newer revocations; otherwise it is a
+    lookup in memory. Only a jti the Bloom filter may contain, that is a
+    revoked one or a rare false positive, is confirmed in the database.
+    """
+
+    def __init__(self, config):
+        self.capacity = config['REVOCATION_BLOOM_CAPACITY']
+        self.error_rate = config['REVOCATION_BLOOM_ERROR_RATE']
+        self.sync_interval = config['REVOCATION_SYNC_INTERVAL']
+        self.rebuild_interval = config['REVOCATION_REBUILD_INTERVAL']
+        self.recent_max = config['REVOCATION_RECENT_MAX']
+        self.bloom = None
+        self.recent = set()
+        self.users = {}
+        self.synced_at = None
+        self.checked = 0.0
+        self.rebuilt = 0.0
+        self._lock = threading.Lock()
+
+    def _apply(self, doc):
+        key = doc['_id']
+        if key.startswith(USER_PREFIX):
+            user_id = key[len(USER_PREFIX):]
+            self.users[user_id] = max(self.users.get(user_id, 0), doc['not_before'])
+        else:
+            self.recent.add(key[len(JTI_PREFIX):])
+        if self.synced_at is None or doc['revoked_at'] > self.synced_at:
+            self.synced_at = doc['revoked_at']
+
+    def _rebuild(self):
+        now = datetime.utcnow()
+        docs = list(RevokedToken.objects(expires_at__gt=now).as_pymongo())
+        jtis = [doc['_id'][len(JTI_PREFIX):] for doc in docs if doc['_id'].startswith(JTI_PREFIX)]
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.recent = set()
+        self.users = {}
+        self.synced_at = None
+        for doc in docs:
+            if doc['_id'].startswith(USER_PREFIX):
+                self._apply(doc)
+            elif self.synced_at is None or doc['revoked_at'] > self.synced_at:
+                self.synced_at = doc['revoked_at']
+        self.rebuilt = time.monotonic()
+
+    def _sync(self):
+        if self.bloom is None or time.monotonic() - self.rebuilt >= self.rebuild_interval:
+            self._rebuild()
+        else:
+            query = {} if self.synced_at is None else {'revoked_at__gt': self.synced_at - SYNC_OVERLAP}
+            for doc in RevokedToken.objects(**query).as_pymongo():
+                self._apply(doc)
+            if len(self.recent) > self.recent_max:
+                # Fold into the filter; their lookups then go to the database
+                for jti in self.recent:
+                    self.bloom.add(jti)
+                self.recent = set()
+        self.checked = time.monotonic()
+
+    def refresh(self):
+        """Pull newer revocations if the last sync is older than the interval."""
+        if time.monotonic() - self.checked < self.sync_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self.checked >= self.sync_interval:
+                self._sync()
+
+    def add_token(self, jti):
+        """Record a jti revoked by this process, ahead of the next sync."""
+        with self._lock:
+            self.recent.add(jti)
+
+    def add_user(self, user_id, not_before):
+        """Record a per-user cut-off set by this process."""
+        with self._lock:
+            self.users[user_id] = max(self.users.get(user_id, 0), not_before)
+
+    def revoked(self, jwt_data):
+        self.refresh()
+        jti = jwt_data.get('jti')
+        user_id = jwt_data.get(current_app.config['JWT_IDENTITY_CLAIM'])
+        if user_id is not None and jwt_data.get('iat', 0) < self.users.get(str(user_id), 0):
+            return True
+        if jti is None:
+            return False
+        if jti in self.recent:
+            return True
+        if jti in self.bloom:
+            return RevokedToken.objects(key=f'{JTI_PREFIX}{jti}').only('key').first() is not None
+        return False
+
+def revoke_token(jwt_data):
+    """Revoke one token until it would have expired anyway."""
+    jti = jwt_data.get('jti')
+    if jti is None:
+        return
+    now = datetime.utcnow()
+    expires_at = datetime.utcfromtimestamp(jwt_data['exp']) if 'exp' in jwt_data else now + _longest_lifetime()
+    RevokedToken.objects(key=f'{JTI_PREFIX}{jti}').update_one(
+        upsert=True, set__revoked_at=now, set__expires_at=expires_at
+    )
+    # Applied here at once; other workers see it on their next sync
+    current_app.extensions['revocation'].add_token(jti)
+
+def revoke_user(user_id):
+    """Revoke every token issued to the user before the current second.
+
+    ``iat`` has one-second resolution; tokens issued within this second
+    stay valid, so tokens handed out right after the call work.
+    """
+    now = datetime.utcnow()
+    not_before = int(time.time())
+    RevokedToken.objects(key=f'{USER_PREFIX}{user_id}').update_one(
+        upsert=True, set__not_before=not_before, set__revoked_at=now,
+        set__expires_at=now + _longest_lifetime()
+    )
+    current_app.extensions['revocation'].add_user(str(user_id), not_before)
+
+def _longest_lifetime():
+    config = current_app.config
+    return max(config['JWT_ACCESS_TOKEN_EXPIRES'], config['JWT_REFRESH_TOKEN_EXPIRES'])
+
+def init_app(app, jwt):
+    """Check every token Flask-JWT-Extended verifies against the blocklist."""
+    app.extensions['revocation'] = Blocklist(app.config)
+
+    @jwt.token_in_blocklist_loader
+    def _token_revoked(jwt_header, jwt_data):
+        return current_app.extensions['revocation'].revoked(jwt_data)
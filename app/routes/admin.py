@@ -0,0 +1,129 @@
+import os
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import User
+from app.users import load_user
+from app.db import pool_stats
+from app import revocation
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/db/pool', methods=['GET'])
+@jwt_required()
+def get_pool_stats():
+    """Get this worker's MongoDB connection pool statistics (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    settings = current_app.config['MONGODB_SETTINGS']
+    
+    return jsonify({
+        'pid': os.getpid(),
+        'max_pool_size': settings.get('maxPoolSize'),
+        'min_pool_size': settings.get('minPoolSize'),
+        'wait_queue_timeout_ms': settings.get('waitQueueTimeoutMS'),
+        'pool': pool_stats.to_dict()
+    }), 200
+
+def _profiling_buffer():
+    """The profiling ring buffer, or None when profiling is disabled."""
+    return current_app.extensions.get('profiling')
+
+@admin_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    """List recorded request profiles and slow queries, newest first (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    buffer = _profiling_buffer()
+    if buffer is None:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    
+    kind = request.args.get('kind')
+    if kind not in (None, 'profile', 'slow_query'):
+        return jsonify({'error': 'Invalid kind'}), 400
+    limit = min(int(request.args.get('limit', 100)), buffer.max_entries)
+    
+    return jsonify({'entries': buffer.list(kind=kind, limit=limit)}), 200
+
+@admin_bp.route('/profiles/<entry_id>', methods=['GET'])
+@jwt_required()
+def get_profile(entry_id):
+    """Get one entry, including a slow query's explain plan (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    buffer = _profiling_buffer()
+    try:
+        entry = buffer.read(entry_id) if buffer else None
+    except ValueError:
+        entry = None
+    if not entry:
+        return jsonify({'error': 'Entry not found'}), 404
+    
+    return jsonify(entry), 200
+
+@admin_bp.route('/profiles/<entry_id>/download', methods=['GET'])
+@jwt_required()
+def download_profile(entry_id):
+    """Download an entry's pstats file, or its JSON for slow queries (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    buffer = _profiling_buffer()
+    try:
+        entry = buffer.read(entry_id) if buffer else None
+    except ValueError:
+        entry = None
+    if not entry:
+        return jsonify({'error': 'Entry not found'}), 404
+    
+    extension = 'prof' if entry['kind'] == 'profile' else 'json'
+    path = buffer.path(entry_id, extension)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Entry not found'}), 404
+    
+    return send_file(path, as_attachment=True, download_name=f'{entry_id}.{extension}')
+
+@admin_bp.route('/users/<user_id>/active', methods=['PUT'])
+@jwt_required()
+def set_user_active(user_id):
+    """Activate or deactivate a user; deactivating revokes their tokens (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json()
+    if not data or not isinstance(data.get('is_active'), bool):
+        return jsonify({'error': 'is_active must be true or false'}), 400
+    
+    target = User.objects(id=user_id).first()
+    if not target:
+        return jsonify({'error': 'User not found'}), 404
+    
+    target.is_active = data['is_active']
+    target.updated_at = datetime.utcnow()
+    target.save()
+    if not target.is_active:
+        revocation.revoke_user(target.id)
+    
+    return jsonify({
+        'message': 'User updated successfully',
+        'user': target.to_dict()
+    }), 200
@@ -0,0 +1,59 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.users import load_user
+from app import analytics
+from app.routing import route_reads
+
+analytics_bp = Blueprint('analytics', __name__)
+route_reads(analytics_bp)  # Dashboards tolerate replication lag
+
+@analytics_bp.route('/sales', methods=['GET'])
+@jwt_required()
+def get_sales():
+    """Get hourly or daily sales rollups for a date range (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in analytics.GRANULARITIES:
+        return jsonify({'error': 'Invalid granularity'}), 400
+
+    try:
+        start, end = analytics.parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    rollups = analytics.get_rollups(granularity, start, end)
+
+    return jsonify({
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': [rollup.to_dict() for rollup in rollups]
+    }), 200
+
+@analytics_bp.route('/summary', methods=['GET'])
+@jwt_required()
+def get_summary():
+    """Get sales totals and top sellers for a date range (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        start, end = analytics.parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    limit = int(request.args.get('limit', 10))
+
+    # Daily buckets keep the dashboard cost proportional to days, not orders
+    summary = analytics.summarize(analytics.get_rollups('day', start, end), limit=limit)
+    summary.update({'start': start.isoformat(), 'end': end.isoformat()})
+
+    return jsonify(summary), 200
@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,
-    jwt_required, get_jwt_identity
+    jwt_required, get_jwt, get_jwt_identity
 )
 from app.models import User
-from app import mail
+from app.users import load_user
+from app import guest_carts, mail, revocation
 from flask_mail import Message
 from datetime import datetime, timedelta
 import secrets
@@ -77,6 +78,15 @@ def login():
     if not user.is_active:
         return jsonify({'error': 'Account is not active'}), 401
     
+    # Move what the shopper carted as a guest into their stored cart
+    headers = {}
+    if request.headers.get(guest_carts.HEADER):
+        try:
+            guest_carts.merge(user, request.headers[guest_carts.HEADER])
+            headers[guest_carts.HEADER] = ''  # Tells the client to drop its guest cart
+        except Exception as e:
+            print(f"Failed to merge guest cart: {str(e)}")
+    
     # Create access and refresh tokens
     access_token = create_access_token(identity=str(user.id))
     refresh_token = create_refresh_token(identity=str(user.id))
@@ -85,7 +95,7 @@ def login():
         'access_token': access_token,
         'refresh_token': refresh_token,
         'user': user.to_dict()
-    }), 200
+    }), 200, headers
 
 @auth_bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
@@ -95,12 +105,19 @@ def refresh():
     access_token = create_access_token(identity=current_user)
     return jsonify({'access_token': access_token}), 200
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the access or refresh token sent with the request."""
+    revocation.revoke_token(get_jwt())
+    return jsonify({'message': 'Token revoked'}), 200
+
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
     """Get user profile."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -112,7 +129,7 @@ def get_profile():
 def update_profile():
     """Update user profile."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -132,10 +149,17 @@ def update_profile():
     user.updated_at = datetime.utcnow()
     user.save()
     
-    return jsonify({
+    response = {
         'message': 'Profile updated successfully',
         'user': user.to_dict()
-    }), 200
+    }
+    if 'password' in data:
+        # Sign out every other session; this one continues with new tokens
+        revocation.revoke_user(user.id)
+        response['access_token'] = create_access_token(identity=str(user.id))
+        response['refresh_token'] = create_refresh_token(identity=str(user.id))
+    
+    return jsonify(response), 200
 
 @auth_bp.route('/verify-email/<token>', methods=['GET'])
 def verify_email(token):
@@ -214,5 +238,7 @@ def reset_password(token):
     user.reset_token = None
     user.reset_token_expires = None
     user.save()
+    # Tokens issued before the reset, possibly to whoever knew the old password
+    revocation.revoke_user(user.id)
     
     return jsonify({'message': 'Password reset successful'}), 200 
\ No newline at end of file
@@ -0,0 +1,186 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from flask import Blueprint, current_app, g, request, jsonify
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from werkzeug.routing import RequestRedirect
+from werkzeug.test import EnvironBuilder
+from app import admission
+from app.models import User
+from app.routing import READ_AFTER_HEADER, READ_METHODS, WRITE_METHODS, read_after
+from app.users import USERS_KEY
+
+batch_bp = Blueprint('batch', __name__)
+
+# Sub-requests see the batch's credentials and read-after state, nothing else
+FORWARDED_HEADERS = ('Authorization', READ_AFTER_HEADER, 'Accept-Language')
+
+# Responses that stream for as long as the client listens, or whose size is
+# unbounded; a batch would hold them open and buffer them whole
+STREAMING_ENDPOINTS = {'product.live_products', 'order.export_orders', 'product.bulk_update_products'}
+
+_pool = {'pid': None, 'executor': None}
+_pool_lock = threading.Lock()
+
+def _executor():
+    # Threads do not survive a fork, so each worker process builds its own pool
+    with _pool_lock:
+        if _pool['pid'] != os.getpid():
+            _pool['executor'] = ThreadPoolExecutor(
+                max_workers=current_app.config['BATCH_MAX_WORKERS'], thread_name_prefix='batch'
+            )
+            _pool['pid'] = os.getpid()
+        return _pool['executor']
+
+def _identity():
+    """The batch's user id, or None when it has no valid token."""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        # Sub-requests that need a token report the error themselves
+        return None
+
+def _validate(entry):
+    if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+        return 'Each request needs a path'
+    method = str(entry.get('method', 'GET')).upper()
+    if method not in READ_METHODS + WRITE_METHODS:
+        return f'Unsupported method {method}'
+    if not entry['path'].startswith('/api/') or entry['path'].split('?')[0].rstrip('/') == '/api/batch':
+        return 'Path must be an API route other than /api/batch'
+    return None
+
+def _environ(entry, headers, users):
+    builder = EnvironBuilder(
+        path=entry['path'],
+        base_url=request.host_url,
+        method=str(entry.get('method', 'GET')).upper(),
+        headers=headers,
+        json=entry.get('body'),
+        environ_overrides={'REMOTE_ADDR': request.remote_addr}
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    environ[USERS_KEY] = users
+    try:
+        current_app.url_map.bind_to_environ(environ).match()
+    except RequestRedirect as e:
+        # Follow a strict-slashes redirect here; a batch cannot return one
+        location = urlsplit(e.new_url)
+        environ['PATH_INFO'] = location.path[len(environ.get('SCRIPT_NAME', '')):]
+        environ['QUERY_STRING'] = location.query
+    except Exception:
+        # Not found and method errors come back from the sub-request itself
+        pass
+    return environ
+
+def _preprocess(app):
+    # Blueprint hooks (read routing) and route limits run per sub-request;
+    # the batch's own admission slot covers them, and the other app-wide
+    # hooks (metrics, compression, CORS) ran for the batch
+    if 'admission' in app.extensions:
+        rv = admission.admit_sub_request()
+        if rv is not None:
+            return rv
+    for name in reversed(request.blueprints):
+        for func in app.url_value_preprocessors.get(name, ()):
+            func(request.endpoint, request.view_args)
+        for func in app.before_request_funcs.get(name, ()):
+            rv = func()
+            if rv is not None:
+                return rv
+    return None
+
+def _dispatch(app, environ):
+    """Run one sub-request through its view and return ``(status, body)``."""
+    # A fresh app context, so ``g`` (admission slot, read preference) is the sub-request's own
+    with app.app_context(), app.request_context(environ):
+        if request.endpoint in app.config['ADMISSION_RATE_LIMITS'] or request.endpoint in STREAMING_ENDPOINTS:
+            rv = jsonify({'error': 'Not allowed in a batch'}), 400
+        else:
+            try:
+                rv = _preprocess(app)
+                if rv is None:
+                    rv = app.dispatch_request()
+            except Exception as e:
+                try:
+                    rv = app.handle_user_exception(e)
+                except Exception as e:
+                    print(f"Failed to dispatch batch request {request.path}: {str(e)}")
+                    rv = jsonify({'error': 'Internal server error'}), 500
+        response = app.make_response(rv)
+        try:
+            if response.is_streamed:
+                return 400, {'error': 'Streamed responses are not allowed in a batch'}
+            if response.is_json:
+                return response.status_code, response.get_json()
+            return response.status_code, response.get_data(as_text=True)
+        finally:
+            # Runs the view's call_on_close cleanups, e.g. ending a subscription
+            response.close()
+
+@batch_bp.route('', methods=['POST'])
+def batch():
+    """Serve several API calls in one round trip.
+
+    Takes ``{"requests": [{"method", "path", "body"}]}`` and returns
+    ``{"responses": [{"status", "body"}]}`` in the same order. Consecutive
+    reads run concurrently; each write runs alone, in order, and the reads
+    after it see its result. Every sub-request carries the batch's
+    ``Authorization`` header and shares one lookup of the user.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('requests')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'requests must be a non-empty list'}), 400
+    if len(entries) > current_app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({'error': f"At most {current_app.config['BATCH_MAX_REQUESTS']} requests per batch"}), 400
+    for index, entry in enumerate(entries):
+        error = _validate(entry)
+        if error:
+            return jsonify({'error': f'Request {index}: {error}'}), 400
+
+    app = current_app._get_current_object()
+    identity = _identity()
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    users = {}
+    results = [None] * len(entries)
+    wrote = False
+
+    index = 0
+    while index < len(entries):
+        if identity is not None and identity not in users:
+            users[identity] = User.objects(id=identity).first()
+
+        method = str(entries[index].get('method', 'GET')).upper()
+        if method in WRITE_METHODS:
+            status, body = _dispatch(app, _environ(entries[index], headers, users))
+            results[index] = {'status': status, 'body': body}
+            if status < 400:
+                wrote = True
+                # Later reads go to the primary, and see the updated user
+                headers[READ_AFTER_HEADER] = read_after()
+                users.clear()
+            index += 1
+            continue
+
+        wave = []
+        while index < len(entries) and str(entries[index].get('method', 'GET')).upper() in READ_METHODS:
+            wave.append(index)
+            index += 1
+        if len(wave) == 1:
+            outcomes = [_dispatch(app, _environ(entries[wave[0]], headers, users))]
+        else:
+            executor = _executor()
+            futures = [executor.submit(_dispatch, app, _environ(entries[i], headers, users)) for i in wave]
+            outcomes = [future.result() for future in futures]
+        for i, (status, body) in zip(wave, outcomes):
+            results[i] = {'status': status, 'body': body}
+
+    if not wrote:
+        g.read_only = True
+    return jsonify({'responses': results}), 200
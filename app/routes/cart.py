@@ -1,44 +1,60 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Cart, CartItem, Product, User
+from app.models import Cart, CartItem, Product
+from app.users import load_user
+from app import guest_carts
 from datetime import datetime
 
 cart_bp = Blueprint('cart', __name__)
 
-@cart_bp.route('/', methods=['GET'])
-@jwt_required()
-def get_cart():
-    """Get the current user's cart."""
+def _current_cart(*product_ids):
+    """The signed-in user's cart, or the guest cart sent with the request.
+
+    Returns ``(cart, {product id: product or None})`` for ``product_ids``,
+    or ``(None, None)`` when the token's user no longer exists.
+    """
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    if current_user_id is None:
+        return guest_carts.load(request.headers.get(guest_carts.HEADER), *product_ids)
     
+    user = load_user(current_user_id)
     if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    cart = Cart.objects(user=user).first()
+        return None, None
+    products = {product_id: Product.objects(id=product_id).first() for product_id in product_ids}
+    return Cart.objects(user=user).first() or Cart(user=user, items=[]), products
+
+def _save(cart):
+    """Store a user's cart; a guest cart goes back in the returned headers."""
+    if cart.user:
+        cart.persist()
+    return guest_carts.headers(cart)
+
+@cart_bp.route('/', methods=['GET'])
+@jwt_required(optional=True)
+def get_cart():
+    """Get the current user's or guest's cart."""
+    # Viewing never writes: the cart is stored with its first item
+    cart, _ = _current_cart()
     
     if not cart:
-        cart = Cart(user=user, items=[])
-        cart.save()
+        return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(cart.to_dict()), 200
+    return jsonify(cart.to_dict()), 200, guest_carts.headers(cart)
 
 @cart_bp.route('/add', methods=['POST'])
-@jwt_required()
+@jwt_required(optional=True)
 def add_to_cart():
     """Add a product to the cart."""
-    current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
     data = request.get_json()
     
     if not data or 'product_id' not in data or 'quantity' not in data:
         return jsonify({'error': 'Product ID and quantity are required'}), 400
     
-    product = Product.objects(id=data['product_id']).first()
+    cart, products = _current_cart(data['product_id'])
+    if not cart:
+        return jsonify({'error': 'User not found'}), 404
+    
+    product = products.get(data['product_id'])
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
@@ -49,11 +65,6 @@ def add_to_cart():
     if quantity > product.stock:
         return jsonify({'error': 'Requested quantity exceeds available stock'}), 400
     
-    # Get or create cart
-    cart = Cart.objects(user=user).first()
-    if not cart:
-        cart = Cart(user=user, items=[])
-    
     # Check if product is already in cart
     existing_item = next(
         (item for item in cart.items if str(item.product.id) == data['product_id']),
@@ -68,6 +79,9 @@ def add_to_cart():
         existing_item.quantity = new_quantity
         existing_item.added_at = datetime.utcnow()
     else:
+        if not cart.user and len(cart.items) >= current_app.config['GUEST_CART_MAX_ITEMS']:
+            return jsonify({'error': 'Guest cart is full; log in to add more products'}), 400
+        
         # Add new item to cart
         cart_item = CartItem(
             product=product,
@@ -76,33 +90,27 @@ def add_to_cart():
         cart.items.append(cart_item)
     
     cart.updated_at = datetime.utcnow()
-    cart.save()
+    headers = _save(cart)
     
     return jsonify({
         'message': 'Product added to cart successfully',
         'cart': cart.to_dict()
-    }), 200
+    }), 200, headers
 
 @cart_bp.route('/update', methods=['PUT'])
-@jwt_required()
+@jwt_required(optional=True)
 def update_cart_item():
     """Update cart item quantity."""
-    current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
     data = request.get_json()
     
     if not data or 'product_id' not in data or 'quantity' not in data:
         return jsonify({'error': 'Product ID and quantity are required'}), 400
     
-    cart = Cart.objects(user=user).first()
+    cart, products = _current_cart(data['product_id'])
     if not cart:
-        return jsonify({'error': 'Cart not found'}), 404
+        return jsonify({'error': 'User not found'}), 404
     
-    product = Product.objects(id=data['product_id']).first()
+    product = products.get(data['product_id'])
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
@@ -125,56 +133,46 @@ def update_cart_item():
     cart_item.quantity = quantity
     cart_item.added_at = datetime.utcnow()
     cart.updated_at = datetime.utcnow()
-    cart.save()
+    headers = _save(cart)
     
     return jsonify({
         'message': 'Cart updated successfully',
         'cart': cart.to_dict()
-    }), 200
+    }), 200, headers
 
 @cart_bp.route('/remove/<product_id>', methods=['DELETE'])
-@jwt_required()
+@jwt_required(optional=True)
 def remove_from_cart(product_id):
     """Remove a product from the cart."""
-    current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    cart, _ = _current_cart()
     
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    cart = Cart.objects(user=user).first()
     if not cart:
-        return jsonify({'error': 'Cart not found'}), 404
+        return jsonify({'error': 'User not found'}), 404
     
     # Remove item from cart
     cart.items = [item for item in cart.items if str(item.product.id) != product_id]
     cart.updated_at = datetime.utcnow()
-    cart.save()
+    headers = _save(cart)
     
     return jsonify({
         'message': 'Product removed from cart successfully',
         'cart': cart.to_dict()
-    }), 200
+    }), 200, headers
 
 @cart_bp.route('/clear', methods=['DELETE'])
-@jwt_required()
+@jwt_required(optional=True)
 def clear_cart():
     """Clear all items from the cart."""
-    current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    cart, _ = _current_cart()
     
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    cart = Cart.objects(user=user).first()
     if not cart:
-        return jsonify({'error': 'Cart not found'}), 404
+        return jsonify({'error': 'User not found'}), 404
     
     cart.items = []
     cart.updated_at = datetime.utcnow()
-    cart.save()
+    headers = _save(cart)
     
     return jsonify({
         'message': 'Cart cleared successfully',
         'cart': cart.to_dict()
-    }), 200 
\ No newline at end of file
+    }), 200, headers 
\ No newline at end of file
@@ -1,15 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Category, User
+from app.models import Category
+from app.users import load_user
+from app import categories, suggest
+from app.routing import route_reads
 from datetime import datetime
 
 category_bp = Blueprint('category', __name__)
+route_reads(category_bp)
 
 @category_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_category():
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     if not user or not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
 
@@ -20,15 +24,37 @@ def create_category():
     if Category.objects(name=data['name']).first():
         return jsonify({'error': 'Category already exists'}), 400
 
+    parent = None
+    if data.get('parent'):
+        parent = Category.objects(id=data['parent']).first()
+        if not parent:
+            return jsonify({'error': 'Invalid parent category'}), 400
+
     category = Category(
         name=data['name'],
         description=data.get('description', ''),
+        parent=parent,
+        ancestors=categories.ancestors_of(parent),
         created_at=datetime.utcnow()
     )
     category.save()
+    categories.invalidate()
+    suggest.category_saved(category)
     return jsonify({'message': 'Category created', 'category': category.to_dict()}), 201
 
+def _cached(name):
+    snapshot = categories.snapshot()
+    response = current_app.response_class(snapshot.bodies[name], mimetype='application/json')
+    response.set_etag(snapshot.etags[name])
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate with If-None-Match
+    return response.make_conditional(request)
+
 @category_bp.route('/', methods=['GET'])
 def get_categories():
-    categories = Category.objects()
-    return jsonify({'categories': [cat.to_dict() for cat in categories]}), 200 
\ No newline at end of file
+    """List every category with its parent, ancestors and product count."""
+    return _cached('list')
+
+@category_bp.route('/tree', methods=['GET'])
+def get_category_tree():
+    """Nested categories for the navigation menu, with per-subtree totals."""
+    return _cached('tree') 
\ No newline at end of file
@@ -1,18 +1,59 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Order, OrderItem, Cart, Product, User
-from app import mail
+from app.models import Order, OrderItem, Cart, Product, reference_id
+from app.users import load_user
+from app import mail, analytics, export, lifecycle, live, recommendations
 from flask_mail import Message
+from bson import ObjectId
 from datetime import datetime
 
 order_bp = Blueprint('order', __name__)
 
+def send_order_confirmation(user, order):
+    """Email the order summary to the customer."""
+    try:
+        msg = Message(
+            'Order Confirmation',
+            recipients=[user.email]
+        )
+        msg.body = f'''Hello {user.first_name},
+
+Thank you for your order! Your order details are as follows:
+
+Order ID: {order.id}
+Total Amount: ${order.total_amount:.2f}
+Status: {order.status}
+
+Shipping Address:
+{order.shipping_address.get('street')}
+{order.shipping_address.get('city')}, {order.shipping_address.get('state')} {order.shipping_address.get('zip')}
+{order.shipping_address.get('country')}
+
+We will notify you when your order ships.
+
+Thank you for shopping with us!
+'''
+        mail.send(msg)
+    except Exception as e:
+        print(f"Failed to send order confirmation email: {str(e)}")
+
+def restock(items):
+    """Give back the stock taken for ``items``; returns the updated products."""
+    products = []
+    for item in items:
+        product = Product.objects(id=reference_id(item, 'product')).modify(
+            new=True, inc__stock=item.quantity, inc__version=1
+        )
+        if product:
+            products.append(product)
+    return products
+
 @order_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_orders():
     """Get all orders for the current user."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -21,35 +62,61 @@ def get_orders():
     status = request.args.get('status')
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 10))
+    # ?view=summary: counts and totals only, without the items
+    summary = request.args.get('view') == 'summary'
     
-    # Build query
-    query = {'user': user}
-    if status:
-        query['status'] = status
-    
-    # Get orders with pagination
-    orders = Order.objects(**query).order_by('-created_at').skip((page - 1) * per_page).limit(per_page)
-    total = Order.objects(**query).count()
+    # Live orders first, then archived ones, which are all older
+    orders, total = lifecycle.list_orders(
+        user, status, page, per_page, fields=Order.SUMMARY_FIELDS if summary else None
+    )
     
     return jsonify({
-        'orders': [order.to_dict() for order in orders],
+        'orders': [order.to_summary() if summary else order.to_dict() for order in orders],
         'total': total,
         'page': page,
         'per_page': per_page,
         'total_pages': (total + per_page - 1) // per_page
     }), 200
 
+@order_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_orders():
+    """Stream all orders in a date range as CSV or NDJSON (admin only)."""
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': 'Invalid export format'}), 400
+    
+    try:
+        start, end = analytics.parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+    
+    batch_size = min(max(int(request.args.get('batch_size', 1000)), 100), 10000)
+    
+    filename = f'orders-{start.date().isoformat()}-{end.date().isoformat()}.{fmt}'
+    return Response(
+        stream_with_context(export.export_lines(start, end, fmt, batch_size)),
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @order_bp.route('/<order_id>', methods=['GET'])
 @jwt_required()
 def get_order(order_id):
     """Get a specific order by ID."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    order = Order.objects(id=order_id, user=user).first()
+    order = lifecycle.find_order(id=order_id, user=user)
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
@@ -60,7 +127,7 @@ def get_order(order_id):
 def create_order():
     """Create a new order from the cart."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -89,63 +156,55 @@ def create_order():
                 'product_id': str(product.id)
             }), 400
         
-        # Create order item
-        order_item = OrderItem(
-            product=product,
-            quantity=cart_item.quantity,
-            price_at_time=product.price
-        )
+        # Create order item, with what order history shows of the product
+        order_item = OrderItem.snapshot(product, cart_item.quantity)
         order_items.append(order_item)
         
         # Update total
         total_amount += product.price * cart_item.quantity
-        
-        # Update product stock
-        product.stock -= cart_item.quantity
-        product.save()
+    
+    # Each decrement only applies while the stock covers it and bumps the
+    # version, so concurrent checkouts cannot oversell and seller bulk
+    # updates see the sale; if any falls short, the others are undone
+    updated = []
+    for order_item in order_items:
+        product_id = reference_id(order_item, 'product')
+        product = Product.objects(id=product_id, stock__gte=order_item.quantity).modify(
+            new=True, __raw__={'$inc': {'stock': -order_item.quantity, 'version': 1}}
+        )
+        if not product:
+            restock(order_items[:len(updated)])
+            return jsonify({
+                'error': f'Insufficient stock for {order_item.name}',
+                'product_id': str(product_id)
+            }), 400
+        updated.append(product)
     
     # Create order
     order = Order(
         user=user,
         items=order_items,
+        item_count=sum(item.quantity for item in order_items),
         total_amount=total_amount,
         status='pending',
         shipping_address=data['shipping_address'],
         payment_status='pending'
     )
-    order.save()
+    try:
+        order.save()
+    except Exception:
+        restock(order_items)
+        raise
+    for product in updated:
+        live.product_changed(product.id, stock=product.stock)
+    analytics.track_order(order)
+    recommendations.record_order(order)
     
     # Clear cart
-    cart.items = []
-    cart.updated_at = datetime.utcnow()
-    cart.save()
+    cart.delete()
     
     # Send order confirmation email
-    try:
-        msg = Message(
-            'Order Confirmation',
-            recipients=[user.email]
-        )
-        msg.body = f'''Hello {user.first_name},
-
-Thank you for your order! Your order details are as follows:
-
-Order ID: {order.id}
-Total Amount: ${order.total_amount:.2f}
-Status: {order.status}
-
-Shipping Address:
-{order.shipping_address.get('street')}
-{order.shipping_address.get('city')}, {order.shipping_address.get('state')} {order.shipping_address.get('zip')}
-{order.shipping_address.get('country')}
-
-We will notify you when your order ships.
-
-Thank you for shopping with us!
-'''
-        mail.send(msg)
-    except Exception as e:
-        print(f"Failed to send order confirmation email: {str(e)}")
+    send_order_confirmation(user, order)
     
     return jsonify({
         'message': 'Order created successfully',
@@ -157,7 +216,7 @@ Thank you for shopping with us!
 def cancel_order(order_id):
     """Cancel an order."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -171,16 +230,17 @@ def cancel_order(order_id):
         return jsonify({'error': 'Order cannot be cancelled in its current status'}), 400
     
     # Update order status
+    previous = (order.status, order.payment_status)
     order.status = 'cancelled'
     order.updated_at = datetime.utcnow()
     
+    order.save()
+    
     # Restore product stock
-    for item in order.items:
-        product = item.product
-        product.stock += item.quantity
-        product.save()
+    for product in restock(order.items):
+        live.product_changed(product.id, stock=product.stock)
     
-    order.save()
+    analytics.track_order(order, previous)
     
     # Send cancellation email
     try:
@@ -210,17 +270,23 @@ Thank you for your understanding.
 def update_order_status(order_id):
     """Update order status (admin only)."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user or not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    order = Order.objects(id=order_id).first()
+    data = request.get_json()
+    
+    # With the order's user the lookup goes to one shard instead of all
+    query = {'id': order_id}
+    if data and data.get('user'):
+        if not ObjectId.is_valid(str(data['user'])):
+            return jsonify({'error': 'Invalid user id'}), 400
+        query['user'] = ObjectId(str(data['user']))
+    order = Order.objects(**query).first()
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
-    data = request.get_json()
-    
     if not data or 'status' not in data:
         return jsonify({'error': 'Status is required'}), 400
     
@@ -229,9 +295,11 @@ def update_order_status(order_id):
         return jsonify({'error': 'Invalid status'}), 400
     
     # Update order status
+    previous = (order.status, order.payment_status)
     order.status = new_status
     order.updated_at = datetime.utcnow()
     order.save()
+    analytics.track_order(order, previous)
     
     # Send status update email
     try:
@@ -261,7 +329,7 @@ Thank you for shopping with us!
 def update_payment_status(order_id):
     """Update order payment status."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -280,6 +348,7 @@ def update_payment_status(order_id):
         return jsonify({'error': 'Invalid payment status'}), 400
     
     # Update payment status
+    previous = (order.status, order.payment_status)
     order.payment_status = new_payment_status
     order.payment_id = data['payment_id']
     order.updated_at = datetime.utcnow()
@@ -289,6 +358,7 @@ def update_payment_status(order_id):
         order.status = 'processing'
     
     order.save()
+    analytics.track_order(order, previous)
     
     return jsonify({
         'message': 'Payment status updated successfully',
@@ -1,6 +1,11 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Product, Category, User, Review
+from mongoengine.errors import SaveConditionError
+from mongoengine.queryset.visitor import Q
+from app.models import Product, Category, Review
+from app.users import load_user
+from app import catalog, categories, export, inventory, live, recommendations, snapshots, suggest
+from app.routing import replica_reads
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
@@ -12,41 +17,56 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-@product_bp.route('/', methods=['GET'])
-def get_products():
-    """Get all products with optional filtering and pagination."""
-    # Get query parameters
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
-    category = request.args.get('category')
-    search = request.args.get('search')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    sort_by = request.args.get('sort_by', 'created_at')
-    sort_order = request.args.get('sort_order', 'desc')
+def product_listing(args):
+    """Build the product listing query from request arguments.
+
+    Returns the unevaluated queryset with its page and page size; the
+    async server compiles the same queryset to a raw MongoDB filter.
+    """
+    page = int(args.get('page', 1))
+    per_page = int(args.get('per_page', 10))
+    category = args.get('category')
+    search = args.get('search')
+    min_price = args.get('min_price', type=float)
+    max_price = args.get('max_price', type=float)
+    sort_by = args.get('sort_by', 'created_at')
+    sort_order = args.get('sort_order', 'desc')
     
     # Build query
     query = {}
     if category:
         query['category'] = category
-    if search:
-        query['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'description': {'$regex': search, '$options': 'i'}}
-        ]
     if min_price is not None:
-        query['price'] = {'$gte': min_price}
+        query['price__gte'] = min_price
     if max_price is not None:
-        query['price'] = query.get('price', {})
-        query['price']['$lte'] = max_price
+        query['price__lte'] = max_price
     
     # Determine sort order
-    sort_direction = -1 if sort_order == 'desc' else 1
+    sort_direction = '-' if sort_order == 'desc' else ''
     sort_field = sort_by if sort_by in ['name', 'price', 'created_at'] else 'created_at'
     
-    # Get products with pagination
-    products = Product.objects(**query).order_by(f"{sort_direction * sort_field}").skip((page - 1) * per_page).limit(per_page)
-    total = Product.objects(**query).count()
+    queryset = Product.objects(**query)
+    if search:
+        queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
+    return queryset.order_by(f"{sort_direction}{sort_field}"), page, per_page
+
+@product_bp.route('/', methods=['GET'])
+@replica_reads
+def get_products():
+    """Get all products with optional filtering and pagination."""
+    queryset, page, per_page = product_listing(request.args)
+    
+    listing = None
+    if current_app.config['CATALOG_ENGINE_ENABLED']:
+        listing = catalog.page_ids(current_app._get_current_object(), queryset, page, per_page)
+    if listing is not None:
+        # Filtered and sorted in memory; only the page is read from MongoDB
+        ids, total = listing
+        products = catalog.in_order(ids, Product.objects(id__in=ids))
+    else:
+        # Get products with pagination
+        products = queryset.skip((page - 1) * per_page).limit(per_page)
+        total = queryset.count()
     
     return jsonify({
         'products': [product.to_dict() for product in products],
@@ -56,7 +76,22 @@ def get_products():
         'total_pages': (total + per_page - 1) // per_page
     }), 200
 
+@product_bp.route('/suggest', methods=['GET'])
+@replica_reads
+def suggest_products():
+    """Suggest product and category names matching a typed prefix."""
+    query = request.args.get('q', '')
+    limit = min(int(request.args.get('limit', 10)), suggest.MAX_RESULTS)
+    
+    index = suggest.ensure_built(current_app._get_current_object())
+    
+    return jsonify({
+        'query': query,
+        'suggestions': index.search(query, limit=limit)
+    }), 200
+
 @product_bp.route('/<product_id>', methods=['GET'])
+@replica_reads
 def get_product(product_id):
     """Get a single product by ID."""
     product = Product.objects(id=product_id).first()
@@ -66,12 +101,63 @@ def get_product(product_id):
     
     return jsonify(product.to_dict()), 200
 
+@product_bp.route('/<product_id>/related', methods=['GET'])
+@replica_reads
+def get_related_products(product_id):
+    """Get products frequently bought together with a product."""
+    limit = min(int(request.args.get('limit', 10)), recommendations.TOP_K)
+    
+    product = Product.objects(id=product_id).only('id').first()
+    if not product:
+        return jsonify({'error': 'Product not found'}), 404
+    
+    related = recommendations.get_related(product.id, limit=limit)
+    products = {p.id: p for p in Product.objects(id__in=[item.product for item in related])}
+    
+    return jsonify({
+        'product_id': product_id,
+        'related': [
+            {'score': item.score, 'product': products[item.product].to_dict()}
+            for item in related if item.product in products
+        ]
+    }), 200
+
+@product_bp.route('/live', methods=['GET'])
+def live_products():
+    """Stream stock and price changes for ``?ids=<id>,<id>`` as Server-Sent Events."""
+    try:
+        product_ids = live.parse_ids(request.args.get('ids'), current_app.config['LIVE_MAX_PRODUCTS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    app = current_app._get_current_object()
+    live.hub.start(app)
+    subscription = live.hub.subscribe(map(str, product_ids), app.config['LIVE_MAX_SUBSCRIBERS'])
+    if subscription is None:
+        response = jsonify({'error': 'Too many live connections'})
+        response.headers['Retry-After'] = str(int(app.config['LIVE_RETRY']))
+        return response, 503
+
+    # Subscribed first, so a change made while this reads is still sent
+    try:
+        docs = list(Product.objects(id__in=product_ids).only(*live.FIELDS).as_pymongo())
+    except Exception:
+        live.hub.unsubscribe(subscription)
+        raise
+    response = Response(
+        live.stream(subscription, app.config, live.snapshot_events(docs)),
+        mimetype='text/event-stream',
+        headers=live.SSE_HEADERS
+    )
+    response.call_on_close(lambda: live.hub.unsubscribe(subscription))
+    return response
+
 @product_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_product():
     """Create a new product (seller or admin only)."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     if not user or user.role not in ['seller', 'admin']:
         return jsonify({'error': 'Unauthorized'}), 403
 
@@ -106,21 +192,55 @@ def create_product():
         category=category,
         stock=int(data['stock']),
         images=image_urls,
+        sku=data.get('sku') or None,
         seller=user
     )
     product.save()
+    categories.product_added(category.id)
+    catalog.product_saved(product)
+    snapshots.product_saved(product)
+    suggest.product_saved(product)
 
     return jsonify({
         'message': 'Product created successfully',
         'product': product.to_dict()
     }), 201
 
+@product_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_update_products():
+    """Apply a stream of stock and price changes to the seller's own products.
+    
+    The body is NDJSON, or CSV with a header row (``text/csv`` or
+    ``?format=csv``), with one change per row: ``id`` or ``sku``, then
+    ``stock``, ``stock_delta`` and/or ``price``, and optionally the
+    ``version`` the change was based on. Streams back one NDJSON result per
+    row and a final ``stats`` line.
+    """
+    current_user_id = get_jwt_identity()
+    user = load_user(current_user_id)
+    
+    if not user or not (user.is_admin or user.role in ('seller', 'admin')):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in inventory.FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    
+    lines = request.stream
+    rows = inventory.csv_rows(lines) if fmt == 'csv' else inventory.ndjson_rows(lines)
+    results = inventory.apply(user, rows, current_app.config['BULK_UPDATE_BATCH_SIZE'])
+    return Response(
+        stream_with_context(export.ndjson_lines(results)),
+        mimetype=inventory.FORMATS['ndjson']
+    )
+
 @product_bp.route('/<product_id>', methods=['PUT'])
 @jwt_required()
 def update_product(product_id):
     """Update a product (admin only)."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user or not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
@@ -131,6 +251,7 @@ def update_product(product_id):
     
     data = request.form.to_dict()
     files = request.files.getlist('images')
+    previous_category_id = product.category.id
     
     # Update fields if provided
     if 'name' in data:
@@ -141,6 +262,8 @@ def update_product(product_id):
         product.price = float(data['price'])
     if 'stock' in data:
         product.stock = int(data['stock'])
+    if 'sku' in data:
+        product.sku = data['sku'] or None
     if 'category' in data:
         category = Category.objects(id=data['category']).first()
         if not category:
@@ -167,8 +290,21 @@ def update_product(product_id):
                 file.save(file_path)
                 product.images.append(f"/static/uploads/{unique_filename}")
     
+    # Only over the version read: a sale or a bulk update since then wins,
+    # and the admin retries on top of it (documents from before versioning
+    # have no version field)
+    read_version = product.version
     product.updated_at = datetime.utcnow()
-    product.save()
+    product.version += 1
+    try:
+        product.save(save_condition={'version__in': [read_version, None]})
+    except SaveConditionError:
+        return jsonify({'error': 'Product was changed in the meantime, please retry'}), 409
+    categories.product_moved(previous_category_id, product.category.id)
+    live.product_changed(product.id, stock=product.stock, price=product.price)
+    catalog.product_saved(product)
+    snapshots.product_saved(product, previous_category_id)
+    suggest.product_saved(product)
     
     return jsonify({
         'message': 'Product updated successfully',
@@ -180,7 +316,7 @@ def update_product(product_id):
 def delete_product(product_id):
     """Delete a product (admin only)."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user or not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
@@ -197,6 +333,11 @@ def delete_product(product_id):
             pass
     
     product.delete()
+    categories.product_removed(product.category.id)
+    live.product_changed(product_id, deleted=True)
+    catalog.product_deleted(product.id)
+    snapshots.product_deleted(product)
+    suggest.product_deleted(product_id)
     
     return jsonify({'message': 'Product deleted successfully'}), 200
 
@@ -205,7 +346,7 @@ def delete_product(product_id):
 def add_review(product_id):
     """Add a review to a product."""
     current_user_id = get_jwt_identity()
-    user = User.objects(id=current_user_id).first()
+    user = load_user(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -243,7 +384,9 @@ def add_review(product_id):
         )
         product.reviews.append(review)
     
+    product.updated_at = datetime.utcnow()
     product.save()
+    snapshots.product_saved(product)
     
     return jsonify({
         'message': 'Review added successfully',
@@ -262,7 +405,9 @@ def delete_review(product_id):
     
     # Find and remove the user's review
     product.reviews = [review for review in product.reviews if str(review.user.id) != current_user_id]
+    product.updated_at = datetime.utcnow()
     product.save()
+    snapshots.product_saved(product)
     
     return jsonify({
         'message': 'Review deleted successfully',
@@ -0,0 +1,74 @@
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from mongoengine import QuerySet
+from pymongo.read_preferences import SecondaryPreferred
+
+# Sent on every successful write and echoed back by the client; until the
+# timestamp it carries, that client's reads stay on the primary
+READ_AFTER_HEADER = 'X-Read-Primary-Until'
+
+READ_METHODS = ('GET', 'HEAD')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+class RoutedQuerySet(QuerySet):
+    """QuerySet that uses the read preference chosen for the current request.
+
+    Models opt in with ``'queryset_class': RoutedQuerySet``; outside a
+    routed request the client's default (primary) applies as before.
+    """
+
+    def __init__(self, document, collection):
+        super().__init__(document, collection)
+        if has_app_context():
+            self._read_preference = g.get('read_preference')
+
+def primary_required(headers):
+    """Whether this client wrote recently enough to need its own writes."""
+    try:
+        return float(headers.get(READ_AFTER_HEADER, 0)) > time.time()
+    except ValueError:
+        return False
+
+def route_to_replica():
+    """Send the current request's reads to a secondary when it is safe to."""
+    if not current_app.config['READ_REPLICA_ENABLED']:
+        return
+    if request.method not in READ_METHODS or primary_required(request.headers):
+        # Clear any choice made earlier in the same context
+        g.read_preference = None
+        return
+    g.read_preference = current_app.extensions['read_routing']
+
+def replica_reads(view):
+    """Route a read-only view's queries to secondaries."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        route_to_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+def route_reads(blueprint):
+    """Route the queries of every GET/HEAD view in a blueprint to secondaries."""
+    blueprint.before_request(route_to_replica)
+
+def read_after():
+    """The ``READ_AFTER_HEADER`` value for a write made now."""
+    return str(int(time.time() + current_app.config['READ_REPLICA_MAX_STALENESS']))
+
+def _mark_write(response):
+    # A POST that wrote nothing (an all-read /api/batch) sets g.read_only
+    if request.method in WRITE_METHODS and response.status_code < 400 and not g.get('read_only'):
+        response.headers[READ_AFTER_HEADER] = read_after()
+    return response
+
+def init_app(app):
+    """Build the replica read preference and tag write responses.
+
+    A secondary may lag by up to ``READ_REPLICA_MAX_STALENESS`` seconds,
+    so a client that has just written reads from the primary for that long.
+    """
+    app.extensions['read_routing'] = SecondaryPreferred(
+        max_staleness=app.config['READ_REPLICA_MAX_STALENESS']
+    )
+    app.after_request(_mark_write)
@@ -0,0 +1,246 @@
+"""Static catalog snapshots for anonymous browsing.
+
+``generate`` writes the catalog as JSON files a CDN or the frontend's web
+server can serve without touching the API::
+
+    manifest.json                          # Rewritten every run; short cache
+    categories.<hash>.json                 # The category tree
+    products/all/<page>.<hash>.json        # Every product, oldest first
+    products/<category id>/<page>.<hash>.json
+
+Every file except the manifest is named after its content, so it never
+changes once written and can be cached forever. The manifest lists, for
+each scope (``all`` or a category id), its pages in order with their
+sizes; clients read them from the end to list newest first.
+
+Product writes bump a version per affected scope, and a run only re-reads
+scopes whose version moved since the last manifest, and within them the
+pages holding products written since. Pages are fixed ``_id`` ranges, so
+a new product only changes the last page and an edit only its own.
+"""
+import bisect
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReadPreference
+from app import categories
+from app.models import CacheVersion, Category, Product
+
+ALL = 'all'
+MANIFEST = 'manifest.json'
+VERSION_PREFIX = 'snapshot:'
+# Bumped when a scope loses a product, which every page is re-read for
+REMOVALS_PREFIX = 'snapshot-removals:'
+
+# Product writes are found by updated_at, set by each app server's clock
+CLOCK_SKEW = timedelta(seconds=5)
+
+def _mark(*scopes, prefix=VERSION_PREFIX):
+    for scope in set(scopes):
+        CacheVersion.objects(key=f'{prefix}{scope}').update_one(inc__version=1, upsert=True)
+
+def product_saved(product, previous_category_id=None):
+    """Mark the product's pages stale; pass the old category after a move."""
+    scopes = [ALL, str(product.category.id)]
+    if previous_category_id is not None and previous_category_id != product.category.id:
+        scopes.append(str(previous_category_id))
+        _mark(str(previous_category_id), prefix=REMOVALS_PREFIX)
+    _mark(*scopes)
+
+def products_saved(category_ids):
+    """Mark stale the pages of products updated in place, each scope once."""
+    _mark(ALL, *(str(category_id) for category_id in category_ids))
+
+def product_deleted(product):
+    _mark(ALL, str(product.category.id))
+    _mark(ALL, str(product.category.id), prefix=REMOVALS_PREFIX)
+
+def _entry(doc):
+    """A product as listed in a snapshot page.
+
+    Stock is left out: it changes with every order and the product page
+    reads it live. Reviews are reduced to their average and count.
+    """
+    ratings = [review['rating'] for review in doc.get('reviews', [])]
+    return {
+        'id': str(doc['_id']),
+        'name': doc['name'],
+        'description': doc['description'],
+        'price': doc['price'],
+        'category': str(doc['category']),
+        'images': doc.get('images', []),
+        'rating': round(sum(ratings) / len(ratings), 1) if ratings else None,
+        'review_count': len(ratings),
+        'created_at': doc['created_at'].isoformat(),
+        'updated_at': doc['updated_at'].isoformat()
+    }
+
+def _encode(payload):
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return body, hashlib.sha1(body).hexdigest()[:20]
+
+def _write(directory, path, body, replace=False):
+    """Write ``body`` to ``path`` unless a file with that name exists; True if written."""
+    target = os.path.join(directory, path)
+    if os.path.exists(target) and not replace:
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(body)
+    # Atomic, so a CDN never fetches a half-written file
+    os.replace(temporary, target)
+    return True
+
+def _products(scope, start=None, end=None):
+    """The scope's products with ``start <= _id < end``, oldest first."""
+    query = {} if scope == ALL else {'category': scope}
+    if start is not None:
+        query['id__gte'] = start
+    if end is not None:
+        query['id__lt'] = end
+    return Product.objects(**query).read_preference(ReadPreference.PRIMARY).only(
+        'name', 'description', 'price', 'category', 'images', 'reviews.rating', 'created_at', 'updated_at'
+    ).order_by('id').as_pymongo()
+
+def _build_scope(directory, scope, page_size, stats, known=None, dirty=None):
+    """Write the pages of ``scope`` and return its manifest entry.
+
+    Pages hold products oldest first and are ``_id`` ranges that never
+    move: page i runs from ``starts[i]`` up to the next page's start, so
+    an edit or delete only changes its own page and new products only
+    ever land in the last one, which is split once it reaches
+    ``page_size``. With ``known``, the scope's entry in the last manifest,
+    the pages listed in ``dirty`` (all of them when None) and the last
+    page are re-read; the others are kept as they are.
+    """
+    starts = [ObjectId(start) for start in known['starts']] if known else []
+    entry = {'total': 0, 'pages': [], 'starts': [], 'sizes': []}
+
+    def add(path, start, size):
+        entry['pages'].append(path)
+        entry['starts'].append(str(start))
+        entry['sizes'].append(size)
+        entry['total'] += size
+
+    def write_page(docs):
+        number = len(entry['pages']) + 1
+        body, digest = _encode({'scope': scope, 'page': number, 'products': [_entry(doc) for doc in docs]})
+        path = f'products/{scope}/{number}.{digest}.json'
+        stats['written'] += _write(directory, path, body)
+        return path
+
+    for i in range(len(starts) - 1):
+        if dirty is not None and i not in dirty:
+            add(known['pages'][i], starts[i], known['sizes'][i])
+            continue
+        docs = list(_products(scope, starts[i] if i else None, starts[i + 1]))
+        add(write_page(docs), starts[i], len(docs))
+
+    # The last page keeps its start even when emptied, so no page moves
+    tail = len(starts) - 1
+    batch = []
+    for doc in _products(scope, starts[tail] if tail > 0 else None).batch_size(page_size):
+        batch.append(doc)
+        if len(batch) >= page_size:
+            add(write_page(batch), starts[tail] if len(entry['pages']) == tail else batch[0]['_id'], len(batch))
+            batch = []
+    if batch or len(entry['pages']) == tail:
+        add(write_page(batch), starts[tail] if len(entry['pages']) == tail else batch[0]['_id'], len(batch))
+    return entry
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _files(manifest):
+    if not manifest:
+        return set()
+    files = {manifest['categories']}
+    for scope in manifest['scopes'].values():
+        files.update(scope['pages'])
+    return files
+
+def _prune(directory, keep):
+    """Delete snapshot files referenced by neither of the last two manifests."""
+    removed = 0
+    for root, _, names in os.walk(directory):
+        names = [name for name in names if not name.endswith('.tmp')]
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+            if path == MANIFEST or path in keep:
+                continue
+            if path.startswith('products/') or path.startswith('categories.'):
+                os.remove(os.path.join(directory, path))
+                removed += 1
+    return removed
+
+def _changed(since):
+    """``{scope: [product id]}`` for products written since ``since``."""
+    changed = {}
+    for doc in Product.objects(updated_at__gte=since - CLOCK_SKEW).only('id', 'category').as_pymongo():
+        for scope in (ALL, str(doc['category'])):
+            changed.setdefault(scope, []).append(doc['_id'])
+    return changed
+
+def generate(directory, page_size, full=False):
+    """Bring the snapshot in ``directory`` up to date with the database.
+
+    Rebuilds the scopes whose version changed since the previous manifest
+    (all of them with ``full``), writes the new manifest, then removes
+    files that neither it nor the previous one reference. A scope that
+    only gained or changed products re-reads just the pages holding them;
+    one that lost products re-reads every page, keeping their ranges.
+    Returns counts of ``scopes`` rebuilt and files ``written`` and
+    ``removed``.
+    """
+    last = _read_manifest(directory)
+    previous = last if last and not full and last.get('page_size') == page_size and last.get('synced_at') else None
+
+    # Read before the products, so a write during the run is picked up next time
+    synced_at = datetime.utcnow()
+    versions = {
+        doc['_id']: doc['version']
+        for doc in CacheVersion.objects(key__startswith='snapshot').as_pymongo()
+    }
+    scopes = [ALL] + [str(doc['_id']) for doc in Category.objects.only('id').as_pymongo()]
+    changed = _changed(datetime.fromisoformat(previous['synced_at'])) if previous else {}
+
+    stats = {'scopes': 0, 'written': 0, 'removed': 0}
+    manifest_scopes = {}
+    for scope in scopes:
+        version = versions.get(f'{VERSION_PREFIX}{scope}', 0)
+        removals = versions.get(f'{REMOVALS_PREFIX}{scope}', 0)
+        known = (previous or {}).get('scopes', {}).get(scope)
+        if known is not None and (known['version'], known['removals']) == (version, removals):
+            manifest_scopes[scope] = known
+            continue
+        dirty = None
+        if known is not None and known['removals'] == removals:
+            starts = [ObjectId(start) for start in known['starts']]
+            dirty = {max(0, bisect.bisect_right(starts, product_id) - 1) for product_id in changed.get(scope, [])}
+        entry = _build_scope(directory, scope, page_size, stats, known, dirty)
+        manifest_scopes[scope] = dict(entry, version=version, removals=removals)
+        stats['scopes'] += 1
+
+    tree = categories.snapshot()
+    categories_path = f"categories.{tree.etags['tree']}.json"
+    stats['written'] += _write(directory, categories_path, tree.bodies['tree'])
+
+    manifest = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'synced_at': synced_at.isoformat(),
+        'page_size': page_size,
+        'categories': categories_path,
+        'scopes': manifest_scopes
+    }
+    _write(directory, MANIFEST, _encode(manifest)[0], replace=True)
+
+    # Clients holding the previous manifest can still fetch its pages
+    stats['removed'] = _prune(directory, _files(manifest) | _files(last))
+    return stats
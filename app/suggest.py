@@ -0,0 +1,234 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timedelta
+from app.models import Category, Product, SalesRollup
+
+POPULARITY_DAYS = 90
+MAX_RESULTS = 50
+SHORT_PREFIX = 3  # Prefixes up to this length have precomputed rankings
+
+def normalize(text):
+    """Lower-case and collapse whitespace so lookups are case-insensitive."""
+    return ' '.join(text.lower().split())
+
+def _terms(label):
+    """Every word-aligned suffix of a label, so "red shoe" matches "sho"."""
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+def _short_prefixes(terms):
+    return {term[:end] for term in terms for end in range(1, min(len(term), SHORT_PREFIX) + 1)}
+
+class PrefixIndex:
+    """Sorted-array prefix index over product and category names.
+
+    ``_terms`` is a sorted list of ``(term, key)`` tuples, so all entries
+    starting with a prefix form one contiguous slice found with two
+    bisections, and the slice is ranked by popularity. Short prefixes
+    match slices too large to rank per keystroke, so ``_top`` keeps their
+    ranked keys precomputed and patches them on every write.
+    """
+
+    def __init__(self):
+        self._terms = []
+        self._entries = {}
+        self._top = {}
+        self._lock = threading.Lock()
+        self._pending = None  # Writes made while a rebuild reads the database
+        self._rebuilding = False
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _rank(self, key):
+        # Most popular first; among equals, shorter (closer) names first
+        label, popularity = self._entries[key]
+        return popularity, -len(label)
+
+    def _scan(self, prefix):
+        terms = self._terms
+        low = bisect_left(terms, (prefix,))
+        high = bisect_left(terms, (prefix + '\uffff',), low)
+        keys = {key for _, key in terms[low:high] if key in self._entries}
+        return heapq.nlargest(MAX_RESULTS, keys, key=self._rank)
+
+    def _add(self, key, label, popularity):
+        self._entries[key] = (label, popularity)
+        terms = _terms(label)
+        for term in terms:
+            insort(self._terms, (term, key))
+        rank = self._rank(key)
+        for prefix in _short_prefixes(terms):
+            top = self._top.setdefault(prefix, [])
+            if len(top) < MAX_RESULTS or rank > self._rank(top[-1]):
+                top.append(key)
+                top.sort(key=self._rank, reverse=True)
+                del top[MAX_RESULTS:]
+
+    def _remove(self, key):
+        if key not in self._entries:
+            return None
+        terms = _terms(self._entries[key][0])
+        for term in terms:
+            position = bisect_left(self._terms, (term, key))
+            if position < len(self._terms) and self._terms[position] == (term, key):
+                del self._terms[position]
+        entry = self._entries.pop(key)
+        for prefix in _short_prefixes(terms):
+            if key in self._top.get(prefix, ()):
+                # Refill from the slice so the list stays a true top-k
+                self._top[prefix] = self._scan(prefix)
+        return entry
+
+    def _upsert(self, key, label, popularity):
+        previous = self._remove(key)
+        if popularity is None:
+            popularity = previous[1] if previous else 0
+        self._add(key, label, popularity)
+
+    def record_writes(self):
+        """Keep the writes made from now on, for ``load`` to replay."""
+        with self._lock:
+            self._pending = []
+
+    def discard_writes(self):
+        with self._lock:
+            self._pending = None
+
+    def load(self, entries):
+        """Replace the index with ``(kind, id, label, popularity)`` entries.
+
+        Writes recorded since ``record_writes`` may be missing from the
+        entries, so they are applied again on top.
+        """
+        fresh = PrefixIndex()
+        terms = []
+        for kind, entry_id, label, popularity in entries:
+            key = (kind, entry_id)
+            fresh._entries[key] = (label, popularity)
+            terms.extend((term, key) for term in _terms(label))
+        terms.sort()
+        fresh._terms = terms
+        for prefix in _short_prefixes({term for term, _ in terms}):
+            fresh._top[prefix] = fresh._scan(prefix)
+        with self._lock:
+            self._terms = fresh._terms
+            self._entries = fresh._entries
+            self._top = fresh._top
+            for key, label, popularity in self._pending or ():
+                if label is None:
+                    self._remove(key)
+                else:
+                    self._upsert(key, label, popularity)
+            self._pending = None
+            self.built_at = time.monotonic()
+
+    def upsert(self, kind, entry_id, label, popularity=None):
+        """Add or rename an entry, keeping its popularity unless given."""
+        key = (kind, entry_id)
+        with self._lock:
+            self._upsert(key, label, popularity)
+            if self._pending is not None:
+                self._pending.append((key, label, popularity))
+
+    def remove(self, kind, entry_id):
+        with self._lock:
+            self._remove((kind, entry_id))
+            if self._pending is not None:
+                self._pending.append(((kind, entry_id), None, None))
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` entries whose name has a word starting with ``query``."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            ranked = self._top.get(prefix, [])[:limit]
+        else:
+            ranked = self._scan(prefix)[:limit]
+        entries = self._entries
+        return [
+            {'type': kind, 'id': entry_id, 'label': entries[(kind, entry_id)][0]}
+            for kind, entry_id in ranked if (kind, entry_id) in entries
+        ]
+
+index = PrefixIndex()
+
+def _popularity():
+    """Units sold per product and per category over the recent daily rollups."""
+    products = Counter()
+    categories = Counter()
+    since = datetime.utcnow() - timedelta(days=POPULARITY_DAYS)
+    for rollup in SalesRollup.objects(granularity='day', bucket__gte=since).only(
+        'units_by_product', 'units_by_category'
+    ):
+        products.update(rollup.units_by_product)
+        categories.update(rollup.units_by_category)
+    return products, categories
+
+def build():
+    """Load every product and category name into the shared index."""
+    # Writes made while the names are read are replayed after the swap
+    index.record_writes()
+    try:
+        product_units, category_units = _popularity()
+        entries = []
+        for doc in Product.objects.only('name').as_pymongo():
+            product_id = str(doc['_id'])
+            entries.append(('product', product_id, doc['name'], product_units[product_id]))
+        for doc in Category.objects.only('name').as_pymongo():
+            category_id = str(doc['_id'])
+            entries.append(('category', category_id, doc['name'], category_units[category_id]))
+    except Exception:
+        index.discard_writes()
+        raise
+    index.load(entries)
+
+_build_lock = threading.Lock()
+
+def _rebuild_in_background(app):
+    def run():
+        try:
+            with app.app_context():
+                build()
+        except Exception as e:
+            print(f"Failed to rebuild the suggestion index: {str(e)}")
+        finally:
+            index._rebuilding = False
+
+    index._rebuilding = True
+    threading.Thread(target=run, daemon=True).start()
+
+def ensure_built(app):
+    """Build the index on first use and refresh it every ``SUGGEST_INDEX_MAX_AGE`` seconds.
+
+    Each worker only sees its own writes, so the periodic rebuild is what
+    picks up products created or renamed through other workers. It runs in
+    a background thread while searches keep using the current index.
+    """
+    if index.built_at is None:
+        with _build_lock:
+            if index.built_at is None:
+                build()
+        return index
+    if time.monotonic() - index.built_at >= app.config['SUGGEST_INDEX_MAX_AGE'] and not index._rebuilding:
+        with _build_lock:
+            if not index._rebuilding:
+                _rebuild_in_background(app)
+    return index
+
+def product_saved(product):
+    """Index a created or renamed product."""
+    index.upsert('product', str(product.id), product.name)
+
+def product_deleted(product_id):
+    """Drop a deleted product from the index."""
+    index.remove('product', str(product_id))
+
+def category_saved(category):
+    """Index a created category."""
+    index.upsert('category', str(category.id), category.name)
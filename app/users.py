@@ -0,0 +1,14 @@
+from flask import request
+from app.models import User
+
+# Users loaded once per /api/batch, keyed by id, in each sub-request's environ
+USERS_KEY = 'esell.batch.users'
+
+def load_user(user_id):
+    """Return the user with this id, loaded once per batch inside ``/api/batch``."""
+    users = request.environ.get(USERS_KEY)
+    if users is None:
+        return User.objects(id=user_id).first()
+    if user_id not in users:
+        users[user_id] = User.objects(id=user_id).first()
+    return users[user_id]
@@ -0,0 +1,4 @@
+from app.asgi import create_asgi_app
+from config import get_config
+
+app = create_asgi_app(get_config())
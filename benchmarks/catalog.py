@@ -0,0 +1,108 @@
+"""Compare product listings served by MongoDB and by the in-memory catalog engine.
+
+Times the same listings both ways against the benchmark database, so run
+``python -m benchmarks.seed`` first, once per scale to compare:
+
+    python -m benchmarks.seed --scale 100k && python -m benchmarks.catalog --output catalog-100k.json
+    python -m benchmarks.seed --scale 1M && python -m benchmarks.catalog --output catalog-1M.json
+"""
+import json
+import statistics
+import time
+from datetime import datetime
+import click
+from werkzeug.datastructures import MultiDict
+from app import create_app, catalog
+from app.models import Category, Product
+from app.routes.product import product_listing
+from benchmarks.common import BenchmarkConfig, git_commit
+
+def cases(category_id):
+    """Listing arguments covering each filter and sort the engine handles."""
+    return {
+        'newest': {},
+        'price_asc': {'sort_by': 'price', 'sort_order': 'asc'},
+        'name_asc': {'sort_by': 'name', 'sort_order': 'asc'},
+        'price_range': {'min_price': '50', 'max_price': '150'},
+        'category': {'category': category_id},
+        'category_price_range_by_price': {
+            'category': category_id, 'min_price': '50', 'max_price': '150', 'sort_by': 'price', 'sort_order': 'desc'
+        },
+        'deep_page': {'page': '200', 'per_page': '20'}
+    }
+
+def mongo_page(args):
+    queryset, page, per_page = product_listing(MultiDict(args))
+    products = list(queryset.skip((page - 1) * per_page).limit(per_page))
+    return [product.id for product in products], queryset.count()
+
+def engine_page(app, args):
+    queryset, page, per_page = product_listing(MultiDict(args))
+    ids, total = catalog.page_ids(app, queryset, page, per_page)
+    products = catalog.in_order(ids, Product.objects(id__in=ids))
+    return [product.id for product in products], total
+
+def timed(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'mean_ms': round(statistics.fmean(samples), 3)
+    }
+
+@click.command()
+@click.option('--repeat', default=50, show_default=True, help='Timed runs per listing and path.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(repeat, output):
+    """Time each listing through MongoDB and the catalog engine and print the JSON report."""
+    app = create_app(BenchmarkConfig)
+    results = {}
+    with app.app_context():
+        products = Product.objects.count()
+        category_id = str(Category.objects.only('id').first().id)
+
+        started = time.perf_counter()
+        catalog.build()
+        build_seconds = time.perf_counter() - started
+        columns = catalog.engine._columns
+        column_bytes = sum(
+            getattr(columns, name).nbytes for name in ('price', 'category', 'created', 'alive')
+        )
+
+        for name, args in cases(category_id).items():
+            (mongo_ids, mongo_total), mongo = timed(lambda: mongo_page(args), repeat)
+            (engine_ids, engine_total), engine = timed(lambda: engine_page(app, args), repeat)
+            results[name] = {
+                'args': args,
+                'total': mongo_total,
+                # Products with equal sort keys may legitimately come back in another order
+                'same_total': mongo_total == engine_total,
+                'same_page': mongo_ids == engine_ids,
+                'mongo': mongo,
+                'engine': engine,
+                'speedup_p50': round(mongo['p50_ms'] / max(engine['p50_ms'], 1e-6), 1)
+            }
+
+    report = {
+        'meta': {'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat(), 'repeat': repeat},
+        'catalog': {
+            'products': products,
+            'build_seconds': round(build_seconds, 2),
+            'numeric_column_mb': round(column_bytes / 1e6, 1)
+        },
+        'listings': results
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+if __name__ == '__main__':
+    main()
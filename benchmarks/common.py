@@ -0,0 +1,31 @@
+import os
+import subprocess
+from config import ProductionConfig
+
+class BenchmarkConfig(ProductionConfig):
+    """Production settings pointed at a throwaway benchmark database."""
+    MONGODB_SETTINGS = dict(
+        ProductionConfig.MONGODB_SETTINGS,
+        host=os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017/ecommerce_bench')
+    )
+    MAIL_SUPPRESS_SEND = True  # Checkout must not wait on SMTP
+    # Measure raw capacity by default; set to true to benchmark load shedding
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'False').lower() == 'true'
+
+# Presets for --scale: (products, users, orders)
+SCALES = {
+    '1k': (1000, 200, 2000),
+    '100k': (100000, 10000, 200000),
+    '1M': (1000000, 100000, 2000000)
+}
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
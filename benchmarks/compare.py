@@ -0,0 +1,43 @@
+"""Compare two load-test reports route by route.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import click
+
+METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+def _change(before, after):
+    if not before:
+        return '    n/a'
+    return f'{(after - before) / before * 100:+6.1f}%'
+
+@click.command()
+@click.argument('before', type=click.File())
+@click.argument('after', type=click.File())
+@click.option('--metric', 'metrics', multiple=True, type=click.Choice(METRICS), default=METRICS)
+def main(before, after, metrics):
+    """Print the relative change of each metric from BEFORE to AFTER."""
+    before, after = json.load(before), json.load(after)
+    click.echo(f"before: {before['meta']['commit']} ({before['meta']['mix']}, c={before['meta']['concurrency']})")
+    click.echo(f"after:  {after['meta']['commit']} ({after['meta']['mix']}, c={after['meta']['concurrency']})")
+
+    header = f"{'route':<40}" + ''.join(f'{metric:>24}' for metric in metrics)
+    click.echo(header)
+    click.echo('-' * len(header))
+
+    rows = [('TOTAL', before['totals'], after['totals'])] + [
+        (route, before['routes'].get(route, {}), after['routes'].get(route, {}))
+        for route in sorted(set(before['routes']) | set(after['routes']))
+    ]
+    for route, old, new in rows:
+        cells = []
+        for metric in metrics:
+            if metric not in old or metric not in new:
+                cells.append(f'{"-":>24}')
+                continue
+            cells.append(f'{old[metric]:>9} -> {new[metric]:<9}{_change(old[metric], new[metric])}')
+        click.echo(f'{route:<40}' + ''.join(cells))
+
+if __name__ == '__main__':
+    main()
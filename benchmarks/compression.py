@@ -0,0 +1,98 @@
+"""Measure the CPU cost and bytes saved of each response encoding.
+
+Payloads are real API responses rendered from the benchmark database, so
+run ``python -m benchmarks.seed`` first.
+
+    python -m benchmarks.compression --output compression.json
+"""
+import json
+import time
+from datetime import datetime
+import click
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.compression import CompressedCache, compress
+from app.models import User, Product
+from benchmarks.common import BenchmarkConfig, git_commit
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 6, 9), 'zstd': (1, 3, 9)}
+
+def payloads(app):
+    """Render representative responses without compression."""
+    with app.app_context():
+        product = Product.objects.order_by('-created_at').first()
+        admin = User.objects(is_admin=True).first()
+        token = create_access_token(identity=str(admin.id))
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'identity'}
+    paths = {
+        'product_list_10': '/api/products/?per_page=10',
+        'product_list_100': '/api/products/?per_page=100',
+        'product_detail': f'/api/products/{product.id}',
+        'categories': '/api/categories/',
+        'orders_export_csv': f'/api/orders/export?format=csv&start={datetime.utcnow().date().isoformat()}',
+        'orders_export_ndjson': f'/api/orders/export?format=ndjson&start={datetime.utcnow().date().isoformat()}'
+    }
+    bodies = {}
+    for name, path in paths.items():
+        response = client.get(path, headers=headers)
+        if response.status_code == 200:
+            bodies[name] = response.get_data()
+    return bodies
+
+def measure(data, encoding, level, min_time):
+    """Average seconds per compression over at least ``min_time`` seconds."""
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        compressed = compress(data, encoding, level)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return compressed, elapsed / runs
+
+@click.command()
+@click.option('--min-time', default=0.2, show_default=True, help='Seconds spent timing each case.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(min_time, output):
+    """Compress sample responses at every level and print the JSON report."""
+    app = create_app(BenchmarkConfig)
+    results = {}
+    for name, data in payloads(app).items():
+        cases = []
+        for encoding, levels in LEVELS.items():
+            for level in levels:
+                compressed, seconds = measure(data, encoding, level, min_time)
+                cases.append({
+                    'encoding': encoding,
+                    'level': level,
+                    'bytes': len(compressed),
+                    'ratio': round(len(data) / len(compressed), 2),
+                    'saved_pct': round((1 - len(compressed) / len(data)) * 100, 1),
+                    'compress_us': round(seconds * 1e6, 1),
+                    'mb_per_s': round(len(data) / seconds / 1e6, 1),
+                    # CPU spent per kilobyte saved, to compare across payload sizes
+                    'us_per_kb_saved': round(seconds * 1e6 / max(1, (len(data) - len(compressed)) / 1024), 2)
+                })
+
+        cache = CompressedCache(len(data) * 4)
+        cache.get(data, 'gzip', 6)
+        started = time.perf_counter()
+        for _ in range(100):
+            cache.get(data, 'gzip', 6)
+        cached_us = (time.perf_counter() - started) / 100 * 1e6
+
+        results[name] = {'bytes': len(data), 'cache_hit_us': round(cached_us, 1), 'encodings': cases}
+
+    report = {
+        'meta': {'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat()},
+        'payloads': results
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+if __name__ == '__main__':
+    main()
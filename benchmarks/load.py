@@ -0,0 +1,240 @@
+"""Drive a weighted mix of shopper traffic and report per-route latency.
+
+By default every worker thread gets its own Flask test client for an
+in-process ``create_app()``, which measures the application and MongoDB
+without a web server in the way. ``--url`` sends the same traffic to a
+running deployment instead.
+
+    python -m benchmarks.load --mix shopping --concurrency 16 --duration 60 --output run.json
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+import click
+import requests
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.models import User, Category, Product
+from benchmarks.common import BenchmarkConfig, git_commit
+
+# Scenario weights for each named traffic mix
+MIXES = {
+    'browse': {'browse': 80, 'search': 20},
+    'shopping': {'browse': 55, 'search': 25, 'cart': 15, 'checkout': 5},
+    'checkout': {'browse': 20, 'search': 10, 'cart': 40, 'checkout': 30}
+}
+
+SHIPPING_ADDRESS = {
+    'street': '1 Benchmark Way', 'city': 'Springfield', 'state': 'IL', 'zip': '62701', 'country': 'US'
+}
+
+class Recorder:
+    """Per-thread latency samples keyed by route template."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def record(self, route, elapsed, status):
+        if not self.recording:
+            return
+        self.latencies[route].append(elapsed)
+        if status >= 400:
+            self.errors[route] += 1
+
+class Session:
+    """Issue requests through a test client or HTTP and time each one."""
+
+    def __init__(self, recorder, app=None, url=None, token=None):
+        self.recorder = recorder
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        if url:
+            self.http = requests.Session()
+            self.url = url.rstrip('/')
+        else:
+            self.http = None
+            self.client = app.test_client()
+
+    def request(self, method, route, path, **kwargs):
+        headers = dict(self.headers, **kwargs.pop('headers', {}))
+        started = time.perf_counter()
+        if self.http:
+            response = self.http.request(method, self.url + path, headers=headers, **kwargs)
+            status, body = response.status_code, response.content
+        else:
+            response = self.client.open(path, method=method, headers=headers, **kwargs)
+            status, body = response.status_code, response.get_data()
+        self.recorder.record(f'{method} {route}', time.perf_counter() - started, status)
+        return status, body
+
+def _json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return {}
+
+def browse(session, rng, data):
+    session.request('GET', '/api/categories/', '/api/categories/')
+    category = rng.choice(data['categories'])
+    sort = rng.choice([('created_at', 'desc'), ('price', 'asc'), ('price', 'desc')])
+    session.request(
+        'GET', '/api/products/',
+        f'/api/products/?category={category}&sort_by={sort[0]}&sort_order={sort[1]}&page={rng.randint(1, 5)}'
+    )
+    product = rng.choice(data['products'])
+    session.request('GET', '/api/products/<id>', f'/api/products/{product}')
+    session.request('GET', '/api/products/<id>/related', f'/api/products/{product}/related')
+
+def search(session, rng, data):
+    term = rng.choice(data['terms'])
+    for length in range(1, min(len(term), 4) + 1):
+        session.request('GET', '/api/products/suggest', f'/api/products/suggest?q={term[:length]}')
+    session.request('GET', '/api/products/?search', f'/api/products/?search={term}')
+
+def cart(session, rng, data):
+    product = rng.choice(data['products'])
+    session.request('POST', '/api/cart/add', '/api/cart/add', json={'product_id': product, 'quantity': 1})
+    session.request('GET', '/api/cart/', '/api/cart/')
+    if rng.random() < 0.3:
+        session.request('DELETE', '/api/cart/remove/<id>', f'/api/cart/remove/{product}')
+
+def checkout(session, rng, data):
+    for product in rng.sample(data['products'], rng.randint(1, 3)):
+        session.request('POST', '/api/cart/add', '/api/cart/add', json={'product_id': product, 'quantity': 1})
+    status, body = session.request(
+        'POST', '/api/orders/create', '/api/orders/create', json={'shipping_address': SHIPPING_ADDRESS}
+    )
+    order = _json(body).get('order', {}).get('id') if status < 400 else None
+    if order:
+        session.request('GET', '/api/orders/<id>', f'/api/orders/{order}')
+    session.request('GET', '/api/orders/', '/api/orders/')
+
+SCENARIOS = {'browse': browse, 'search': search, 'cart': cart, 'checkout': checkout}
+
+def load_data(app, users, sample_size):
+    """Sample ids and search terms from the seeded database."""
+    with app.app_context():
+        products = [
+            str(product['_id'])
+            for product in Product.objects.aggregate([{'$sample': {'size': sample_size}}, {'$project': {'name': 1}}])
+        ]
+        names = Product.objects(id__in=products).scalar('name')
+        terms = sorted({word.lower() for name in names for word in re.findall(r'[A-Za-z]{3,}', name)})
+        categories = [str(category_id) for category_id in Category.objects.scalar('id')]
+        buyers = User.objects(is_admin=False, is_active=True).only('id').limit(users)
+        tokens = [create_access_token(identity=str(user.id)) for user in buyers]
+    if not products or not tokens:
+        raise click.ClickException('The benchmark database is empty; run `python -m benchmarks.seed` first.')
+    return {'products': products, 'terms': terms, 'categories': categories, 'tokens': tokens}
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return samples[min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))]
+
+def summarize(recorders, elapsed):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for recorder in recorders:
+        for route, samples in recorder.latencies.items():
+            latencies[route].extend(samples)
+        for route, count in recorder.errors.items():
+            errors[route] += count
+
+    routes = {}
+    for route, samples in sorted(latencies.items()):
+        samples.sort()
+        routes[route] = {
+            'count': len(samples),
+            'errors': errors[route],
+            'rps': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+            'max_ms': round(samples[-1] * 1000, 3)
+        }
+    total = sum(route['count'] for route in routes.values())
+    return {
+        'totals': {
+            'requests': total,
+            'errors': sum(route['errors'] for route in routes.values()),
+            'rps': round(total / elapsed, 2),
+            'elapsed_s': round(elapsed, 3)
+        },
+        'routes': routes
+    }
+
+def run(app, data, mix, concurrency, duration, warmup, url=None, seed_value=42):
+    """Run ``concurrency`` workers for ``warmup`` + ``duration`` seconds."""
+    names = list(MIXES[mix])
+    weights = [MIXES[mix][name] for name in names]
+    recorders = [Recorder() for _ in range(concurrency)]
+    stop = threading.Event()
+
+    def worker(index):
+        rng = random.Random(seed_value + index)
+        token = data['tokens'][index % len(data['tokens'])]
+        session = Session(recorders[index], app=app, url=url, token=token)
+        while not stop.is_set():
+            SCENARIOS[rng.choices(names, weights)[0]](session, rng, data)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    for recorder in recorders:
+        recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    for recorder in recorders:
+        recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return summarize(recorders, elapsed)
+
+@click.command()
+@click.option('--mix', type=click.Choice(sorted(MIXES)), default='shopping', show_default=True)
+@click.option('--concurrency', default=8, show_default=True, help='Number of concurrent clients.')
+@click.option('--duration', default=30.0, show_default=True, help='Measured seconds.')
+@click.option('--warmup', default=5.0, show_default=True, help='Unmeasured seconds before the run.')
+@click.option('--users', default=100, show_default=True, help='Distinct shoppers to log in as.')
+@click.option('--sample', default=2000, show_default=True, help='Products sampled for the traffic.')
+@click.option('--url', help='Benchmark a running server instead of an in-process app.')
+@click.option('--scale', help='Label recorded in the output, e.g. the seed scale.')
+@click.option('--seed', 'seed_value', default=42, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(mix, concurrency, duration, warmup, users, sample, url, scale, seed_value, output):
+    """Run a load test and print the JSON report."""
+    app = create_app(BenchmarkConfig)
+    data = load_data(app, users, sample)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'target': url or 'in-process',
+            'scale': scale,
+            'mix': mix,
+            'concurrency': concurrency,
+            'duration_s': duration,
+            'warmup_s': warmup,
+            'seed': seed_value
+        }
+    }
+    report.update(run(app, data, mix, concurrency, duration, warmup, url=url, seed_value=seed_value))
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Seed the benchmark database with synthetic catalog, user and order data.
+
+Products are variations of the templates in ``public/products.json``, so
+names and descriptions look like the real catalog.
+
+    python -m benchmarks.seed --scale 100k
+    python -m benchmarks.seed --products 5000 --users 500 --orders 10000
+"""
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+import click
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+from app import create_app, analytics, categories, indexes, recommendations
+from app.models import User, Category, Product, Cart, Order
+from benchmarks.common import BenchmarkConfig, SCALES
+
+PRODUCTS_JSON = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'public', 'products.json'
+)
+
+CATEGORY_NAMES = [
+    'Audio', 'Wearables', 'Cameras', 'Gaming', 'Computers', 'Phones',
+    'Home', 'Kitchen', 'Outdoors', 'Fitness', 'Office', 'Accessories'
+]
+ADJECTIVES = [
+    'Pro', 'Mini', 'Max', 'Lite', 'Plus', 'Ultra', 'Classic', 'Sport',
+    'Studio', 'Travel', 'Compact', 'Premium', 'Eco', 'Smart', 'Wireless'
+]
+COLORS = ['Black', 'White', 'Silver', 'Blue', 'Red', 'Green', 'Gold', 'Grey']
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+PAYMENT_STATUSES = ['pending', 'completed', 'failed', 'refunded']
+
+# Every synthetic user shares this password so the load test can log in
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 5000
+
+def _insert(model, documents):
+    """Insert raw documents in batches, bypassing per-document validation."""
+    collection = model._get_collection()
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+def seed(products, users, orders, seed_value=42):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    with open(PRODUCTS_JSON) as f:
+        templates = json.load(f)['products']
+
+    for model in indexes.MODELS:
+        model.drop_collection()
+    indexes.ensure_indexes()
+
+    password_hash = generate_password_hash(PASSWORD)
+    user_ids = [ObjectId() for _ in range(users)]
+    _insert(User, (
+        {
+            '_id': user_id,
+            'email': f'user{i}@bench.test',
+            'password_hash': password_hash,
+            'first_name': 'Bench',
+            'last_name': f'User{i}',
+            'is_admin': i == 0,
+            'is_active': True,
+            'role': 'admin' if i == 0 else ('seller' if i < 10 else 'buyer'),
+            'created_at': now,
+            'updated_at': now
+        }
+        for i, user_id in enumerate(user_ids)
+    ))
+    sellers = user_ids[:10]
+
+    category_ids = [ObjectId() for _ in CATEGORY_NAMES]
+    _insert(Category, (
+        {'_id': category_id, 'name': name, 'description': f'{name} products', 'created_at': now}
+        for category_id, name in zip(category_ids, CATEGORY_NAMES)
+    ))
+
+    product_ids = [ObjectId() for _ in range(products)]
+    prices = {}
+
+    def product_documents():
+        for i, product_id in enumerate(product_ids):
+            template = templates[i % len(templates)]
+            price = round(template['price'] * rng.uniform(0.5, 2.0), 2)
+            prices[product_id] = price
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            yield {
+                '_id': product_id,
+                'name': f"{template['brand']} {template['name']} {rng.choice(ADJECTIVES)} {rng.choice(COLORS)}",
+                'description': template['description'],
+                'price': price,
+                'category': rng.choice(category_ids),
+                'stock': 1000000,
+                'images': template['images'],
+                'reviews': [],
+                'created_at': created_at,
+                'updated_at': created_at,
+                'seller': rng.choice(sellers)
+            }
+
+    _insert(Product, product_documents())
+
+    # Skewed popularity: a few products appear in most baskets
+    cum_weights = []
+    total = 0.0
+    for rank in range(products):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+
+    def basket(size):
+        return list(dict.fromkeys(rng.choices(product_ids, cum_weights=cum_weights, k=size)))
+
+    _insert(Cart, (
+        {
+            'user': user_id,
+            'items': [
+                {'product': product_id, 'quantity': rng.randint(1, 3), 'added_at': now}
+                for product_id in basket(rng.randint(0, 4))
+            ],
+            'created_at': now,
+            'updated_at': now
+        }
+        for user_id in user_ids[::2]
+    ))
+
+    def order_documents():
+        for _ in range(orders):
+            created_at = now - timedelta(seconds=rng.randint(0, 90 * 86400))
+            items = [
+                {'product': product_id, 'quantity': rng.randint(1, 3), 'price_at_time': prices[product_id]}
+                for product_id in basket(rng.randint(1, 5))
+            ]
+            yield {
+                'user': rng.choice(user_ids),
+                'items': items,
+                'total_amount': round(sum(item['price_at_time'] * item['quantity'] for item in items), 2),
+                'status': rng.choice(STATUSES),
+                'shipping_address': {
+                    'street': f'{rng.randint(1, 999)} Main St', 'city': 'Springfield',
+                    'state': 'IL', 'zip': f'{rng.randint(10000, 99999)}', 'country': 'US'
+                },
+                'payment_status': rng.choice(PAYMENT_STATUSES),
+                'payment_id': None,
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+
+    _insert(Order, order_documents())
+    # Raw inserts bypass the incremental counters
+    categories.recount()
+
+@click.command()
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='1k', show_default=True,
+              help='Preset sizes for products, users and orders.')
+@click.option('--products', type=int, help='Override the number of products.')
+@click.option('--users', type=int, help='Override the number of users.')
+@click.option('--orders', type=int, help='Override the number of orders.')
+@click.option('--seed', 'seed_value', default=42, show_default=True)
+@click.option('--derived/--no-derived', default=True, show_default=True,
+              help='Also build sales rollups and recommendations from the seeded orders.')
+def main(scale, products, users, orders, seed_value, derived):
+    """Drop and re-seed the benchmark database."""
+    default_products, default_users, default_orders = SCALES[scale]
+    products = products or default_products
+    users = users or default_users
+    orders = orders or default_orders
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        started = time.perf_counter()
+        seed(products, users, orders, seed_value)
+        click.echo(f'Seeded {products} products, {users} users, {orders} orders '
+                   f'in {time.perf_counter() - started:.1f}s.')
+        if derived:
+            started = time.perf_counter()
+            analytics.backfill(datetime.utcnow() - timedelta(days=91), datetime.utcnow())
+            recommendations.build()
+            click.echo(f'Built rollups and recommendations in {time.perf_counter() - started:.1f}s.')
+
+if __name__ == '__main__':
+    main()
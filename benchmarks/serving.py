@@ -0,0 +1,102 @@
+"""Run the same traffic against the WSGI and ASGI servers side by side.
+
+Each server is started on the benchmark database, driven by
+``benchmarks.load`` over HTTP at every requested concurrency, then
+stopped, so the two see identical data and load.
+
+    python -m benchmarks.serving --concurrency 64 --concurrency 256 --output serving.json
+
+At high concurrency the threaded load generator itself needs CPU; give
+the servers fewer workers than the machine has cores.
+"""
+import json
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+import click
+from app import create_app
+from app.asgi import create_asgi_app
+from benchmarks import load
+from benchmarks.common import BenchmarkConfig, git_commit
+
+def wsgi_app():
+    return create_app(BenchmarkConfig)
+
+def asgi_app():
+    return create_asgi_app(BenchmarkConfig)
+
+def _command(server, port, workers, threads):
+    if server == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--threads', str(threads), '--worker-class', 'gthread',
+            'benchmarks.serving:wsgi_app()'
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', '--port', str(port), '--workers', str(workers),
+        '--factory', '--no-access-log', '--log-level', 'warning', 'benchmarks.serving:asgi_app'
+    ]
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException(f'Server on port {port} did not start within {timeout}s')
+
+@click.command()
+@click.option('--server', 'servers', multiple=True, type=click.Choice(['wsgi', 'asgi']),
+              default=('wsgi', 'asgi'), show_default=True)
+@click.option('--concurrency', 'levels', multiple=True, type=int, default=(16, 64, 256), show_default=True)
+@click.option('--workers', default=2, show_default=True, help='Server processes for both servers.')
+@click.option('--threads', default=8, show_default=True, help='Threads per gunicorn worker.')
+@click.option('--mix', type=click.Choice(sorted(load.MIXES)), default='shopping', show_default=True)
+@click.option('--duration', default=30.0, show_default=True)
+@click.option('--warmup', default=5.0, show_default=True)
+@click.option('--port', default=8100, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(servers, levels, workers, threads, mix, duration, warmup, port, output):
+    """Benchmark gunicorn (WSGI) against uvicorn (ASGI) and print the JSON report."""
+    app = create_app(BenchmarkConfig)
+    data = load.load_data(app, 200, 2000)
+    runs = []
+    for concurrency in levels:
+        for server in servers:
+            process = subprocess.Popen(_command(server, port, workers, threads))
+            try:
+                _wait_for(port)
+                result = load.run(app, data, mix, concurrency, duration, warmup, url=f'http://127.0.0.1:{port}')
+            finally:
+                process.terminate()
+                process.wait()
+            runs.append(dict(result, server=server, concurrency=concurrency))
+            click.echo(
+                f"{server:<5} c={concurrency:<4} {result['totals']['rps']:>9.1f} req/s "
+                f"{result['totals']['errors']} errors", err=True
+            )
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'mix': mix,
+            'workers': workers,
+            'threads': threads,
+            'duration_s': duration,
+            'warmup_s': warmup
+        },
+        'runs': runs
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+if __name__ == '__main__':
+    main()
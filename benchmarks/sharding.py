@@ -0,0 +1,199 @@
+"""Check the app against a local sharded cluster: a mongos and two shards.
+
+Starts a config server, two single-member shard replica sets and a mongos
+from the MongoDB binaries on ``PATH`` (or ``--mongo-bin``) in a temporary
+directory, shards the collections like ``flask db shard`` does, drives the
+hot cart and order routes through the app, and then explains the per-user
+and per-product queries to check none is sent to both shards.
+
+    python -m benchmarks.sharding --output sharding.json
+
+Exits with status 1 if a route fails or a targeted query is broadcast.
+"""
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+import click
+from flask_jwt_extended import create_access_token
+from pymongo import MongoClient
+from app import create_app, indexes, lifecycle
+from app.models import Category, Order, OrderItem, Product, User
+from benchmarks.common import BenchmarkConfig, git_commit
+
+DATABASE = 'ecommerce_shard_check'
+SHARDS = ('shard1', 'shard2')
+SHIPPING_ADDRESS = {'street': '1 Main St', 'city': 'Springfield', 'state': 'IL', 'zip': '62701', 'country': 'US'}
+
+def _wait_for_primary(port, timeout=60):
+    client = MongoClient(port=port, directConnection=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.admin.command('hello').get('isWritablePrimary'):
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise click.ClickException(f'No primary on port {port} within {timeout}s')
+
+def _start_replica_set(mongo_bin, directory, name, port, role):
+    dbpath = os.path.join(directory, name)
+    os.makedirs(dbpath)
+    process = subprocess.Popen([
+        os.path.join(mongo_bin, 'mongod'), f'--{role}', '--replSet', name, '--port', str(port),
+        '--dbpath', dbpath, '--bind_ip', '127.0.0.1', '--logpath', os.path.join(directory, f'{name}.log')
+    ])
+    config = {'_id': name, 'members': [{'_id': 0, 'host': f'127.0.0.1:{port}'}]}
+    if role == 'configsvr':
+        config['configsvr'] = True
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            MongoClient(port=port, directConnection=True).admin.command('replSetInitiate', config)
+            break
+        except Exception:
+            if time.monotonic() > deadline:
+                raise click.ClickException(f'Could not initiate replica set {name}')
+            time.sleep(0.5)
+    _wait_for_primary(port)
+    return process
+
+def start_cluster(mongo_bin, directory, port):
+    """Start the cluster; returns ``(processes, mongos URI)``."""
+    processes = [_start_replica_set(mongo_bin, directory, 'config', port + 1, 'configsvr')]
+    for offset, shard in enumerate(SHARDS, start=2):
+        processes.append(_start_replica_set(mongo_bin, directory, shard, port + offset, 'shardsvr'))
+    processes.append(subprocess.Popen([
+        os.path.join(mongo_bin, 'mongos'), '--configdb', f'config/127.0.0.1:{port + 1}', '--port', str(port),
+        '--bind_ip', '127.0.0.1', '--logpath', os.path.join(directory, 'mongos.log')
+    ]))
+
+    client = MongoClient(port=port)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            for offset, shard in enumerate(SHARDS, start=2):
+                client.admin.command('addShard', f'{shard}/127.0.0.1:{port + offset}')
+            break
+        except Exception:
+            if time.monotonic() > deadline:
+                raise click.ClickException('mongos did not accept the shards')
+            time.sleep(0.5)
+    return processes, f'mongodb://127.0.0.1:{port}/{DATABASE}'
+
+def cluster_config(uri):
+    class ClusterConfig(BenchmarkConfig):
+        MONGODB_SETTINGS = dict(BenchmarkConfig.MONGODB_SETTINGS, host=uri)
+        ORDER_ARCHIVE_INTERVAL = 0  # Archived explicitly below
+    return ClusterConfig
+
+def populate(users, products, orders):
+    """Users, products and orders, some settled long enough ago to archive."""
+    rng = random.Random(42)
+    admin = User(email='admin@example.com', first_name='Admin', last_name='User', is_admin=True, role='admin')
+    admin.set_password('password')
+    admin.save()
+    shoppers = [
+        User(email=f'user{i}@example.com', password_hash=admin.password_hash, first_name='User',
+             last_name=str(i)).save()
+        for i in range(users)
+    ]
+    categories = [Category(name=name).save() for name in ('Shoes', 'Hats')]
+    catalog = [
+        Product(name=f'Product {i}', description='Sharding check', price=float(rng.randint(5, 200)),
+                category=rng.choice(categories), stock=1000, seller=admin).save()
+        for i in range(products)
+    ]
+    now = datetime.utcnow()
+    for _ in range(orders):
+        product = rng.choice(catalog)
+        created_at = now - timedelta(days=rng.randint(0, 365))
+        Order(
+            user=rng.choice(shoppers), items=[OrderItem(product=product, quantity=1, price_at_time=product.price)],
+            total_amount=product.price, status=rng.choice(['pending', 'shipped', 'delivered', 'cancelled']),
+            shipping_address=SHIPPING_ADDRESS, payment_status='completed',
+            created_at=created_at, updated_at=created_at
+        ).save()
+    return admin, shoppers, catalog
+
+def exercise(app, admin, shopper, product):
+    """Run the hot cart and order routes for one shopper; returns their status codes."""
+    client = app.test_client()
+    with app.app_context():
+        shopper_headers = {'Authorization': f'Bearer {create_access_token(identity=str(shopper.id))}'}
+        admin_headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+    statuses = {}
+
+    def call(name, method, path, headers, **kwargs):
+        response = client.open(path, method=method, headers=headers, **kwargs)
+        statuses[name] = response.status_code
+        return response.get_json(silent=True) or {}
+
+    call('get_product', 'GET', f'/api/products/{product.id}', {})
+    call('add_to_cart', 'POST', '/api/cart/add', shopper_headers, json={'product_id': str(product.id), 'quantity': 1})
+    call('update_cart_item', 'PUT', '/api/cart/update', shopper_headers,
+         json={'product_id': str(product.id), 'quantity': 2})
+    call('get_cart', 'GET', '/api/cart/', shopper_headers)
+    order = call('create_order', 'POST', '/api/orders/create', shopper_headers,
+                 json={'shipping_address': SHIPPING_ADDRESS}).get('order', {})
+    call('get_orders', 'GET', '/api/orders/', shopper_headers)
+    call('get_order', 'GET', f"/api/orders/{order.get('id')}", shopper_headers)
+    call('update_order_status', 'PUT', f"/api/orders/{order.get('id')}/status", admin_headers,
+         json={'status': 'processing', 'user': str(shopper.id)})
+    with app.app_context():
+        statuses['archived'] = lifecycle.archive_orders(90)
+    call('get_orders?status', 'GET', '/api/orders/?status=delivered&per_page=50', shopper_headers)
+    return statuses
+
+@click.command()
+@click.option('--mongo-bin', default=lambda: os.path.dirname(shutil.which('mongod') or ''),
+              help='Directory holding mongod and mongos. [default: from PATH]')
+@click.option('--port', default=27100, show_default=True, help='mongos port; the replica sets take the next three.')
+@click.option('--orders', default=2000, show_default=True, help='Orders to seed across the shards.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(mongo_bin, port, orders, output):
+    """Run the routes and the targeting check on a local sharded cluster and print the JSON report."""
+    if not mongo_bin or not os.path.exists(os.path.join(mongo_bin, 'mongos')):
+        raise click.ClickException('mongod and mongos not found; pass --mongo-bin')
+    directory = tempfile.mkdtemp(prefix='ecommerce-shards-')
+    processes = []
+    try:
+        processes, uri = start_cluster(mongo_bin, directory, port)
+        app = create_app(cluster_config(uri))
+        with app.app_context():
+            indexes.ensure_indexes()
+            # Empty collections sharded on a hashed key start with chunks on both shards
+            sharded = indexes.shard_collections()
+            admin, shoppers, catalog = populate(200, 500, orders)
+        routes = exercise(app, admin, max(shoppers, key=lambda user: Order.objects(user=user).count()), catalog[0])
+        with app.app_context():
+            broadcasts = indexes.check_targeting()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    failed = {name: status for name, status in routes.items() if name != 'archived' and status >= 400}
+    report = {
+        'meta': {'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat(), 'shards': len(SHARDS)},
+        'sharded': sharded,
+        'routes': routes,
+        'failed_routes': failed,
+        'broadcasts': broadcasts
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+    if failed or broadcasts:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Measure worker startup time and first-request latency, with and without warm-up.
+
+Starts gunicorn with ``gunicorn.conf.py`` and a single worker on the
+benchmark database, records how long until it accepts connections, then
+times the first and a later request to each path.
+
+    python -m benchmarks.startup --output startup.json
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+import click
+import requests
+from app import create_app
+from app.models import Product
+from benchmarks.common import BenchmarkConfig, git_commit
+
+def _paths(app):
+    with app.app_context():
+        product = Product.objects.only('id').first()
+    return [
+        '/api/products/',
+        f'/api/products/{product.id}',
+        f'/api/products/{product.id}/related',
+        '/api/products/suggest?q=pro',
+        '/api/categories/'
+    ]
+
+def _timed_get(url):
+    started = time.perf_counter()
+    response = requests.get(url, timeout=60)
+    return round((time.perf_counter() - started) * 1000, 3), response.status_code
+
+def measure(warmup, paths, port, repeat):
+    env = dict(
+        os.environ,
+        WARMUP_ENABLED=str(warmup),
+        GUNICORN_APP='benchmarks.serving:wsgi_app()',
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_WORKERS='1'
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env=env)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        while True:
+            try:
+                requests.get(f'{base}/health/live', timeout=1)
+                break
+            except requests.ConnectionError:
+                if process.poll() is not None:
+                    raise click.ClickException('gunicorn exited during startup')
+                time.sleep(0.05)
+        startup = round(time.perf_counter() - started, 3)
+        routes = {}
+        for path in paths:
+            first, status = _timed_get(base + path)
+            later = sorted(_timed_get(base + path)[0] for _ in range(repeat))
+            routes[path] = {'status': status, 'first_ms': first, 'steady_p50_ms': later[len(later) // 2]}
+        ready = requests.get(f'{base}/health/ready', timeout=10).json()
+    finally:
+        process.terminate()
+        process.wait()
+    return {'warmup': warmup, 'startup_s': startup, 'worker_warmup_s': ready.get('warmup'), 'routes': routes}
+
+@click.command()
+@click.option('--port', default=8200, show_default=True)
+@click.option('--repeat', default=20, show_default=True, help='Later requests timed per path.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+def main(port, repeat, output):
+    """Compare a cold worker with a warmed-up one and print the JSON report."""
+    paths = _paths(create_app(BenchmarkConfig))
+    report = {
+        'meta': {'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat()},
+        'runs': [measure(warmup, paths, port, repeat) for warmup in (False, True)]
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+if __name__ == '__main__':
+    main()
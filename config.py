@@ -11,10 +11,129 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     
+    # Token Revocation
+    # Each worker mirrors revoked_tokens in memory and pulls new entries at
+    # most this often, so a revocation reaches other workers within it
+    REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))
+    REVOCATION_REBUILD_INTERVAL = float(os.getenv('REVOCATION_REBUILD_INTERVAL', 3600))  # Drops expired entries
+    REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', 100000))
+    REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('REVOCATION_BLOOM_ERROR_RATE', 0.001))
+    REVOCATION_RECENT_MAX = int(os.getenv('REVOCATION_RECENT_MAX', 10000))  # Exact entries before folding
+    
     # MongoDB Configuration
+    # Extra keys are passed straight to pymongo.MongoClient
     MONGODB_SETTINGS = {
-        'host': os.getenv('MONGODB_URI', 'mongodb://localhost:27017/ecommerce')
+        'host': os.getenv('MONGODB_URI', 'mongodb://localhost:27017/ecommerce'),
+        'appname': os.getenv('MONGODB_APPNAME', 'e-sell'),
+        'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', 50)),
+        'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', 2)),
+        'maxIdleTimeMS': int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 300000)),
+        'waitQueueTimeoutMS': int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000)),
+        'socketTimeoutMS': int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', 30000)),
+        # snappy also needs python-snappy; unavailable compressors are skipped
+        'compressors': os.getenv('MONGODB_COMPRESSORS', 'zstd,zlib'),
+        'uuidRepresentation': 'standard'
+    }
+    MONGODB_READ_PREFERENCE = os.getenv('MONGODB_READ_PREFERENCE', 'primary')
+    
+    # Read Replica Routing
+    READ_REPLICA_ENABLED = os.getenv('READ_REPLICA_ENABLED', 'True').lower() == 'true'
+    READ_REPLICA_MAX_STALENESS = int(os.getenv('READ_REPLICA_MAX_STALENESS', 90))  # Seconds, at least 90
+    
+    # Metrics Configuration
+    # Under gunicorn, also set PROMETHEUS_MULTIPROC_DIR to aggregate across workers
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token required by /metrics when set
+    
+    # Admission Control
+    # Capacity is per worker; match it to the worker's threads (GUNICORN_THREADS)
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', os.getenv('GUNICORN_THREADS', 4)))
+    ADMISSION_ASGI_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_ASGI_MAX_IN_FLIGHT', 256))  # Async routes are not bound by threads
+    ADMISSION_CRITICAL_RESERVE = float(os.getenv('ADMISSION_CRITICAL_RESERVE', 0.25))  # Share of slots kept for critical routes under load
+    ADMISSION_LATENCY_TARGET = float(os.getenv('ADMISSION_LATENCY_TARGET', 0.5))  # Seconds of queue delay or latency
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 2))
+    ADMISSION_TRUST_FORWARDED = os.getenv('ADMISSION_TRUST_FORWARDED', 'False').lower() == 'true'  # Behind a proxy only
+    # Critical only with a token; guest cart requests count as normal
+    ADMISSION_PRIORITIES = {
+        'cart.get_cart': 'critical',
+        'cart.add_to_cart': 'critical',
+        'cart.update_cart_item': 'critical',
+        'cart.remove_from_cart': 'critical',
+        'order.create_order': 'critical',
+        'order.update_payment_status': 'critical',
+        'order.export_orders': 'low',
+        'analytics.get_sales': 'low',
+        'analytics.get_summary': 'low'
+    }
+    # Shed first when requested without a token
+    ADMISSION_ANONYMOUS_LOW = {
+        'product.get_products', 'product.get_product', 'product.suggest_products',
+        'product.get_related_products', 'category.get_categories'
     }
+    ADMISSION_ROUTE_LIMITS = {'order.export_orders': 2, 'analytics.get_sales': 4, 'analytics.get_summary': 4}
+    # (scope, burst, seconds to refill the burst); 'user' keys on the submitted email
+    ADMISSION_RATE_LIMITS = {
+        'auth.login': [('ip', 20, 60), ('user', 5, 300)],
+        'auth.forgot_password': [('ip', 5, 300), ('user', 3, 3600)]
+    }
+    
+    # Live Product Updates (Server-Sent Events)
+    LIVE_CHANGE_STREAM = os.getenv('LIVE_CHANGE_STREAM', 'True').lower() == 'true'  # Needs a replica set
+    LIVE_MAX_PRODUCTS = int(os.getenv('LIVE_MAX_PRODUCTS', 50))  # Products per stream
+    # Per process; under gunicorn every open stream holds one of the worker's threads
+    LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 2))
+    LIVE_ASGI_MAX_SUBSCRIBERS = int(os.getenv('LIVE_ASGI_MAX_SUBSCRIBERS', 1000))
+    LIVE_HEARTBEAT = float(os.getenv('LIVE_HEARTBEAT', 15))  # Seconds between keep-alive comments
+    LIVE_IDLE_TIMEOUT = float(os.getenv('LIVE_IDLE_TIMEOUT', 120))  # Close streams without updates
+    LIVE_MAX_DURATION = float(os.getenv('LIVE_MAX_DURATION', 600))  # Close and let clients reconnect
+    LIVE_RETRY = float(os.getenv('LIVE_RETRY', 5))  # Seconds clients wait before reconnecting
+    
+    # Request Batching (/api/batch)
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 4))  # Threads per worker for concurrent reads
+    
+    # Order Archiving
+    # Delivered and cancelled orders untouched this long move to orders_archive
+    ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 180))
+    ORDER_ARCHIVE_INTERVAL = int(os.getenv('ORDER_ARCHIVE_INTERVAL', 3600))  # Seconds between runs; 0 disables
+    ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 500))
+    
+    # Seller Bulk Updates (/api/products/bulk)
+    BULK_UPDATE_BATCH_SIZE = int(os.getenv('BULK_UPDATE_BATCH_SIZE', 1000))  # Rows per bulk_write
+    
+    # Guest Carts
+    # Kept by the client in a signed token (X-Guest-Cart), which this bounds
+    GUEST_CART_MAX_ITEMS = int(os.getenv('GUEST_CART_MAX_ITEMS', 50))
+    
+    # Response Compression
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # Smaller bodies go out as-is
+    COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+    COMPRESSION_CACHE_BYTES = int(os.getenv('COMPRESSION_CACHE_BYTES', 16 * 1024 * 1024))
+    
+    # Worker Warm-up
+    # Run by gunicorn.conf.py and the ASGI server before a worker takes traffic
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'True').lower() == 'true'  # The suggestion index is built either way
+    # Index builds belong to deploys (flask db ensure-indexes), not to every worker start
+    WARMUP_ENSURE_INDEXES = os.getenv('WARMUP_ENSURE_INDEXES', 'False').lower() == 'true'
+    WARMUP_PATHS = ['/api/categories/', '/api/products/', '/api/products/suggest?q=a']
+    
+    # ASGI Server
+    # Threads running the Flask app for paths without an async handler
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 10))
+    
+    # Profiling Configuration
+    # Nothing is installed unless enabled; admins then profile a request by
+    # sending PROFILING_HEADER, and PROFILING_SAMPLE_RATE profiles at random
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+    PROFILING_HEADER = 'X-Profile'
+    PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance/profiles'))
+    PROFILING_MAX_ENTRIES = int(os.getenv('PROFILING_MAX_ENTRIES', 200))  # Oldest entries are deleted first
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 100))
     
     # Mail Configuration
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -28,6 +147,21 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app/static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    
+    # Search Suggestions
+    SUGGEST_INDEX_MAX_AGE = int(os.getenv('SUGGEST_INDEX_MAX_AGE', 300))  # Seconds between rebuilds
+    CATEGORY_TREE_MAX_AGE = float(os.getenv('CATEGORY_TREE_MAX_AGE', 5))  # Seconds between version checks
+    
+    # In-memory Catalog Engine
+    # Listings filter and sort in each worker's memory; for catalogs that fit in RAM
+    CATALOG_ENGINE_ENABLED = os.getenv('CATALOG_ENGINE_ENABLED', 'False').lower() == 'true'
+    CATALOG_ENGINE_SYNC_INTERVAL = float(os.getenv('CATALOG_ENGINE_SYNC_INTERVAL', 2))  # Pull other workers' writes
+    CATALOG_ENGINE_REBUILD_INTERVAL = float(os.getenv('CATALOG_ENGINE_REBUILD_INTERVAL', 600))  # Full background reload
+    
+    # Static Catalog Snapshots (flask catalog snapshot)
+    # Served by the frontend's web server or a CDN; public/ is copied into the build
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public/catalog'))
+    SNAPSHOT_PAGE_SIZE = int(os.getenv('SNAPSHOT_PAGE_SIZE', 48))
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -45,10 +179,12 @@ class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
     DEBUG = True
-    MONGODB_SETTINGS = {
-        'host': 'mongodb://localhost:27017/ecommerce_test'
-    }
+    MONGODB_SETTINGS = dict(
+        Config.MONGODB_SETTINGS,
+        host='mongodb://localhost:27017/ecommerce_test'
+    )
     WTF_CSRF_ENABLED = False
+    ORDER_ARCHIVE_INTERVAL = 0
 
 # Configuration dictionary
 config = {
@@ -0,0 +1,60 @@
+"""Production gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (``preload_app``) and forked into
+workers. Each worker then opens its own MongoDB client and warms up in
+``post_worker_init``, before it accepts a connection, so a new or
+recycled worker never serves its first request cold. Every setting can
+be overridden through the ``GUNICORN_*`` variables below.
+"""
+import glob
+import multiprocessing
+import os
+
+wsgi_app = os.getenv('GUNICORN_APP', 'run:app')
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Requests mostly wait on MongoDB, so threads overlap that I/O cheaply;
+# one process per core keeps Python code itself running in parallel
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+# Recycle workers to bound memory growth; the jitter keeps them from all
+# restarting (and warming up) at the same moment
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+# Warm-up runs before the worker's first heartbeat, so it must fit in here
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+def on_starting(server):
+    # Metrics files left by a previous run would be merged into this one's
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+def post_fork(server, worker):
+    from app import db
+    db.reset_after_fork(server.app.wsgi())
+
+def post_worker_init(worker):
+    from app import health
+    app = worker.wsgi
+    timings = health.warm_up(app)
+    worker.log.info('Worker %s warmed up in %.3fs: %s', worker.pid, timings['total'], timings)
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
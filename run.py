@@ -3,5 +3,6 @@ from config import get_config
 
 app = create_app(get_config())
 
+# Development server only; production runs `gunicorn -c gunicorn.conf.py`
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -2,14 +2,65 @@ import axios from 'axios';
 
 const api = axios.create({ baseURL: 'http://localhost:5000/api' });
 
-// Simulate dynamic product data (fetching from a local JSON file)
-const fetchProducts = async () => {
-  // In a real app, you'd fetch from an API endpoint (e.g. api.get('/products'))
-  // For demo, we simulate a fetch from a local JSON file (e.g. /public/products.json)
-  // (You can later replace this with an actual fetch call.)
-  const res = await fetch('/products.json');
-  const data = await res.json();
-  return data.products; // Assume products.json contains { products: [...] }
+// Read-your-writes: after one of our writes, the API asks us to keep our
+// reads on the primary until replicas have caught up
+const READ_AFTER_HEADER = 'X-Read-Primary-Until';
+let readPrimaryUntil = null;
+
+// Guest carts: without a login the API keeps no cart, it hands back a
+// signed token with every cart response instead. Login merges it into the
+// account's cart and answers with an empty header to drop it.
+const GUEST_CART_HEADER = 'X-Guest-Cart';
+const GUEST_CART_KEY = 'guestCart';
+
+api.interceptors.response.use((response) => {
+  const until = response.headers[READ_AFTER_HEADER.toLowerCase()];
+  if (until) readPrimaryUntil = Number(until);
+  const guestCart = response.headers[GUEST_CART_HEADER.toLowerCase()];
+  if (guestCart) localStorage.setItem(GUEST_CART_KEY, guestCart);
+  else if (guestCart === '') localStorage.removeItem(GUEST_CART_KEY);
+  return response;
+});
+
+api.interceptors.request.use((config) => {
+  if (readPrimaryUntil && Date.now() / 1000 < readPrimaryUntil) {
+    config.headers[READ_AFTER_HEADER] = String(readPrimaryUntil);
+  }
+  const guestCart = localStorage.getItem(GUEST_CART_KEY);
+  if (guestCart && /^\/(cart|auth\/login)/.test(config.url)) {
+    config.headers[GUEST_CART_HEADER] = guestCart;
+  }
+  return config;
+});
+
+// Product listings for anonymous browsing come from the static catalog
+// snapshot (flask catalog snapshot), so they never reach the API. scope is
+// 'all' or a category id; pages are numbered from 1, newest first. Falls
+// back to the API when no snapshot has been generated.
+const fetchProducts = async ({ scope = 'all', page = 1 } = {}) => {
+  const manifest = await fetch('/catalog/manifest.json', { cache: 'no-cache' });
+  if (!manifest.ok) {
+    const params = { page, ...(scope === 'all' ? {} : { category: scope }) };
+    const res = await api.get('/products/', { params });
+    return res.data.products;
+  }
+  const { page_size: size, scopes } = await manifest.json();
+  const entry = scopes[scope];
+  if (!entry) return [];
+  // Snapshot pages are stored oldest first, so that new products only
+  // change the last one; walk them from the end to list newest first
+  const skip = (page - 1) * size;
+  const files = [];
+  let after = 0;
+  for (let i = entry.pages.length - 1; i >= 0 && after < skip + size; i -= 1) {
+    if (after + entry.sizes[i] > skip) files.push({ path: entry.pages[i], after });
+    after += entry.sizes[i];
+  }
+  if (!files.length) return [];
+  const pages = await Promise.all(files.map(({ path }) => fetch(`/catalog/${path}`).then((res) => res.json())));
+  const newest = pages.flatMap((data) => data.products.slice().reverse());
+  const start = skip - files[0].after;
+  return newest.slice(start, start + size);
 };
 
 // Helper function for live search filtering (client-side filtering demo)
@@ -19,5 +70,22 @@ const filterProducts = (products, searchTerm) => {
   return products.filter(p => p.name.toLowerCase().includes(term) || (p.description && p.description.toLowerCase().includes(term)));
 };
 
-export { fetchProducts, filterProducts };
+// Several API calls in one round trip: [{ method, path, body }] in,
+// [{ status, body }] out, in the same order. Paths include the /api prefix.
+const batch = async (requests) => {
+  const res = await api.post('/batch', { requests });
+  return res.data.responses;
+};
+
+// Live stock and price updates for the given product ids over Server-Sent
+// Events. onChange receives { id, stock?, price? } or { id, deleted: true };
+// call the returned function to stop listening.
+const subscribeProducts = (ids, onChange) => {
+  const source = new EventSource(`${api.defaults.baseURL}/products/live?ids=${ids.join(',')}`);
+  source.addEventListener('product', (e) => onChange(JSON.parse(e.data)));
+  source.addEventListener('deleted', (e) => onChange({ ...JSON.parse(e.data), deleted: true }));
+  return () => source.close();
+};
+
+export { fetchProducts, filterProducts, batch, subscribeProducts };
 export default api; 
\ No newline at end of file
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useParams } from 'react-router-dom';
-import api from '../api/axios';
+import api, { subscribeProducts } from '../api/axios';
 
 function ProductDetail() {
   const { id } = useParams();
@@ -13,6 +13,16 @@ function ProductDetail() {
       .catch(() => setError('Product not found'));
   }, [id]);
 
+  // Keep stock and price current without reloading
+  useEffect(() => subscribeProducts([id], (change) => {
+    if (change.deleted) {
+      setError('This product is no longer available');
+      return;
+    }
+    const { id: _, ...fields } = change;
+    setProduct(current => current && { ...current, ...fields });
+  }), [id]);
+
   if (error) return <div style={{ color: 'red' }}>{error}</div>;
   if (!product) return <div>Loading...</div>;
 